@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+
+"""Benchmark kombii on synthetic constrained models.
+
+Every model has `var_num` variables with `domain_size` values each. Every pair
+of variables gets a constraint with the probability `density`; a constraint
+forbids the fraction `tightness` of the value pairs of its two variables (the
+later variable `watches` and the earlier one is `read`). The models are
+generated from a seed, so the same arguments always benchmark the same models.
+
+Every benchmark is timed (the best of `--repeat` runs) and run once more under
+`tracemalloc` to record its peak memory. The results are written as JSON so
+two runs, e.g., on two commits, can be compared with `--compare`:
+
+    ./scripts/bench --output before.json
+    (change the code)
+    ./scripts/bench --output after.json --compare before.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from kombii.covering import covering_array
+from kombii.kombii import (
+    ConstraintResult,
+    _grow_kombii_tree,
+    conditional_combinatorial,
+    full_combinatorial,
+)
+from ytestit_common.constraints import scoped
+
+
+# (var_num, domain_size, density, tightness) of the default models.
+DEFAULT_MODELS = [
+    (6, 4, 0.3, 0.3),
+    (8, 4, 0.3, 0.3),
+    (10, 3, 0.2, 0.3),
+    (10, 3, 0.5, 0.5),
+    (12, 3, 0.2, 0.2),
+    # Only `covering_array` runs on this one (see `--max-full`).
+    (50, 3, 0.05, 0.2),
+]
+
+
+def make_model(var_num, domain_size, density, tightness, seed=0):
+    """Generate the possible values, the variable precedence and the
+    constraints of a synthetic model.
+    """
+    rnd = random.Random(seed)
+
+    possible_values = {f"v{i}": list(range(domain_size)) for i in range(var_num)}
+    var_precedence = list(possible_values.keys())
+
+    value_pairs = [(a, b) for a in range(domain_size) for b in range(domain_size)]
+
+    def make_cons(watched, read, forbidden):
+        @scoped(watches=[watched], reads=[read])
+        def cons(var, value, state):
+            return (
+                ConstraintResult.DISCARD
+                if (state[read], value) in forbidden
+                else ConstraintResult.KEEP
+            )
+
+        return cons
+
+    constraints = {}
+    for j, watched in enumerate(var_precedence):
+        for read in var_precedence[:j]:
+            if rnd.random() >= density:
+                continue
+
+            forbidden = set(
+                rnd.sample(value_pairs, round(len(value_pairs) * tightness))
+            )
+            constraints[f"{watched}_{read}"] = make_cons(watched, read, forbidden)
+
+    return possible_values, var_precedence, constraints
+
+
+def _run_full(model):
+    possible_values, _, _ = model
+    return len(full_combinatorial(possible_values=possible_values))
+
+
+def _run_conditional(model):
+    possible_values, var_precedence, constraints = model
+    return len(
+        conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+    )
+
+
+def _run_conditional_adaptive(model):
+    possible_values, var_precedence, constraints = model
+    return len(
+        conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            adaptive=True,
+        )
+    )
+
+
+def _run_grow_tree(model):
+    possible_values, var_precedence, constraints = model
+    _grow_kombii_tree(
+        possible_values=possible_values,
+        var_precedence=var_precedence,
+        constraints=constraints,
+    )
+    return None
+
+
+def _run_covering_array(model, strength):
+    possible_values, var_precedence, constraints = model
+    return len(
+        covering_array(
+            possible_values=possible_values,
+            strength=strength,
+            constraints=constraints,
+            var_precedence=var_precedence,
+        )
+    )
+
+
+def _run_covering_array_2(model):
+    return _run_covering_array(model, strength=2)
+
+
+def _run_covering_array_3(model):
+    return _run_covering_array(model, strength=3)
+
+
+BENCHMARKS = {
+    "full_combinatorial": _run_full,
+    "conditional_combinatorial": _run_conditional,
+    "conditional_combinatorial(adaptive)": _run_conditional_adaptive,
+    "_grow_kombii_tree": _run_grow_tree,
+    "covering_array(strength=2)": _run_covering_array_2,
+    "covering_array(strength=3)": _run_covering_array_3,
+}
+
+# The benchmarks that don't enumerate the combinations, so they also run on
+# the models that are too large for the others.
+NOT_ENUMERATING = {"covering_array(strength=2)", "covering_array(strength=3)"}
+
+
+def measure(func, model, repeat):
+    """Return the best time of `repeat` runs, the peak memory of one more run
+    and the result of `func(model)`.
+    """
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(model)
+        seconds.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(model)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return min(seconds), peak, result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(models, benchmarks, repeat, seed, max_full):
+    records = []
+    for var_num, domain_size, density, tightness in models:
+        model = make_model(var_num, domain_size, density, tightness, seed=seed)
+        params = {
+            "var_num": var_num,
+            "domain_size": domain_size,
+            "density": density,
+            "tightness": tightness,
+            "seed": seed,
+            "constraint_num": len(model[2]),
+        }
+
+        for name in benchmarks:
+            if name not in NOT_ENUMERATING and domain_size**var_num > max_full:
+                continue
+
+            seconds, peak, result = measure(
+                func=BENCHMARKS[name], model=model, repeat=repeat
+            )
+            records.append(
+                {
+                    "benchmark": name,
+                    "params": params,
+                    "seconds": seconds,
+                    "peak_bytes": peak,
+                    "results": result,
+                }
+            )
+            print(
+                f"{name:<38} vars={var_num:<3} domain={domain_size:<3} "
+                f"density={density:<5} tightness={tightness:<5} "
+                f"{seconds * 1000:10.2f} ms {peak / 1024:12.1f} KiB",
+                file=sys.stderr,
+            )
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "records": records,
+    }
+
+
+def _record_key(record):
+    params = record["params"]
+    return (
+        record["benchmark"],
+        params["var_num"],
+        params["domain_size"],
+        params["density"],
+        params["tightness"],
+        params["seed"],
+    )
+
+
+def compare(baseline, current):
+    """Print the time and peak memory of every benchmark in `current`
+    relative to the same benchmark in `baseline`.
+    """
+    old = {_record_key(r): r for r in baseline["records"]}
+    print(f"baseline: {baseline.get('commit')}  current: {current.get('commit')}")
+    for record in current["records"]:
+        base = old.get(_record_key(record))
+        if base is None:
+            continue
+
+        time_ratio = record["seconds"] / base["seconds"] if base["seconds"] else 0
+        mem_ratio = (
+            record["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 0
+        )
+        print(
+            f"{record['benchmark']:<38} {_record_key(record)[1:5]}  "
+            f"time x{time_ratio:.2f}  peak memory x{mem_ratio:.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--model",
+        action="append",
+        nargs=4,
+        type=float,
+        metavar=("VARS", "DOMAIN", "DENSITY", "TIGHTNESS"),
+        help="benchmark this model instead of the default ones (repeatable)",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="append",
+        choices=list(BENCHMARKS.keys()),
+        help="run only this benchmark (repeatable)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--max-full",
+        type=int,
+        default=10**6,
+        help="skip the benchmarks that enumerate the combinations for models "
+        "with more combinations",
+    )
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with the results in this file")
+    args = parser.parse_args()
+
+    models = DEFAULT_MODELS
+    if args.model:
+        models = [
+            (int(var_num), int(domain_size), density, tightness)
+            for var_num, domain_size, density, tightness in args.model
+        ]
+
+    results = run(
+        models=models,
+        benchmarks=args.benchmark or list(BENCHMARKS.keys()),
+        repeat=args.repeat,
+        seed=args.seed,
+        max_full=args.max_full,
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(baseline=json.load(f), current=results)
+
+
+if __name__ == "__main__":
+    main()
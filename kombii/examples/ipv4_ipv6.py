@@ -2,6 +2,7 @@
 
 
 from kombii.kombii import ConstraintResult, conditional_combinatorial
+from ytestit_common.constraints import scoped
 
 
 POSSIBLE_VALUES = {
@@ -16,6 +17,7 @@ POSSIBLE_VALUES = {
 VAR_PRECEDENCE = ["v4_enabled", "v6_enabled", "v4_ip", "v4_dns", "v6_ip", "v6_dns"]
 
 
+@scoped(watches=["v4_ip", "v4_dns"], reads=["v4_enabled"])
 def cons_v4_enabled(var, value, state):
     if var != "v4_ip" and var != "v4_dns":
         return ConstraintResult.KEEP
@@ -33,6 +35,7 @@ def cons_v4_enabled(var, value, state):
         )
 
 
+@scoped(watches=["v4_ip", "v4_dns"], reads=["v4_ip", "v4_dns"])
 def cons_v4_ip_dns(var, value, state):
     if var != "v4_ip" and var != "v4_dns":
         return ConstraintResult.KEEP
@@ -51,13 +54,14 @@ def cons_v4_ip_dns(var, value, state):
     elif v4_dns is not None:
         return (
             ConstraintResult.DISCARD
-            if v4_dns == "AUTO" and value == "Manual"
+            if v4_dns == "Auto" and value == "Manual"
             else ConstraintResult.KEEP
         )
     else:
         return ConstraintResult.KEEP
 
 
+@scoped(watches=["v6_ip", "v6_dns"], reads=["v6_enabled"])
 def cons_v6_enabled(var, value, state):
     if var != "v6_ip" and var != "v6_dns":
         return ConstraintResult.KEEP
@@ -75,6 +79,7 @@ def cons_v6_enabled(var, value, state):
         )
 
 
+@scoped(watches=["v6_ip", "v6_dns"], reads=["v6_ip", "v6_dns"])
 def cons_v6_ip_dns(var, value, state):
     if var != "v6_ip" and var != "v6_dns":
         return ConstraintResult.KEEP
@@ -93,13 +98,14 @@ def cons_v6_ip_dns(var, value, state):
     elif v6_dns is not None:
         return (
             ConstraintResult.DISCARD
-            if v6_dns == "AUTO" and value == "Manual"
+            if v6_dns == "Auto" and value == "Manual"
             else ConstraintResult.KEEP
         )
     else:
         return ConstraintResult.KEEP
 
 
+@scoped(watches=["v6_dns"], reads=["v4_dns"])
 def cons_same_dns(var, value, state):
     if var != "v6_dns":
         return ConstraintResult.KEEP
@@ -0,0 +1,759 @@
+"""Generate t-way covering arrays with the IPOG algorithm.
+
+A t-way covering array is a set of test cases in which every combination of
+the values of any `t` variables appears at least once. IPOG builds it one
+variable at a time: the first `t` variables are combined exhaustively; every
+further variable is first added to the existing test cases, choosing for each
+test case the value that covers the most uncovered t-tuples ("horizontal
+growth"), and then new test cases are added for the t-tuples that are still
+uncovered ("vertical growth").
+
+The uncovered t-tuples of every set of variables are tracked in a bitset (a
+Python `int`) indexed by the value codes, i.e., the positions of the values in
+`possible_values`.
+
+The constraints are the same as the ones of `conditional_combinatorial`. A
+partial test case is only used if it can be completed into a valid test case,
+which is checked with a bounded depth-first search (see `_Completer`), and the
+t-tuples that can't be part of any valid test case are not required to be
+covered. A t-tuple whose completion takes longer than the bound is treated
+like one that can't, so with very tight constraints a few valid t-tuples may
+be left uncovered.
+"""
+
+from itertools import combinations, product
+from types import MappingProxyType
+from typing import Dict, List, Optional, Set, Tuple
+
+from kombii.kombii import (
+    _forward_check,
+    _independent_components,
+    _index_constraints,
+    _live_reads,
+    _meets_constraints,
+    _restore_domains,
+    _SearchPlan,
+    auto_var_precedence,
+)
+from ytestit_common.constraints import ScopedConstraint
+from ytestit_common.types import (
+    Type_Constraints,
+    Type_PossibleValues,
+    Type_VariableValues,
+)
+
+
+# The number of values that `_Completer` may try to complete one partial test
+# case before it gives up.
+_COMPLETION_BUDGET = 200
+
+# The number of the last completions of a group that `_Completer` tries to
+# reuse before it searches.
+_RECENT_COMPLETIONS = 64
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+class _Infeasible(Exception):
+    pass
+
+
+class _Group(object):
+    """The variables of a group that no constraint connects to the others,
+    but that has constraints between its own variables, with what `_Completer`
+    needs to search them and what it remembers.
+    """
+
+    def __init__(
+        self,
+        levels: List[int],
+        variables: List[str],
+        constraints: Type_Constraints,
+    ):
+        self.levels = levels
+        self.variables = variables
+        # The valid value codes for every combination of fixed value codes.
+        self.memo = {}
+        self.recent = []
+
+        self.plan = _SearchPlan(
+            var_precedence=variables, constraints=constraints, forward_checking=True
+        )
+        cons_index = _index_constraints(variables=variables, constraints=constraints)
+        self.live = _live_reads(var_precedence=variables, cons_index=cons_index)
+        self.dead = set()
+
+        # `(positions, constraints)` of every `ScopedConstraint` that only
+        # reads variables before the one it is checked for, so it can be
+        # checked as soon as these variables have values, whatever their order.
+        # The first position is the one of the variable it is checked for.
+        position = {var: i for i, var in enumerate(variables)}
+        self.scoped = []
+        for i, var in enumerate(variables):
+            for name, cons in cons_index[var].items():
+                if not isinstance(cons, ScopedConstraint) or cons.reads is None:
+                    continue
+                reads = [position.get(r, i) for r in cons.reads if r != var]
+                if all(r < i for r in reads):
+                    self.scoped.append(((i, *reads), {name: cons}))
+
+        # The indexes in `scoped` of the constraints of every position, and
+        # the result of every constraint for the value codes of its
+        # positions.
+        self.touching = [[] for _ in variables]
+        for n, (positions, _) in enumerate(self.scoped):
+            for p in set(positions):
+                self.touching[p].append(n)
+        self.verdicts = [{} for _ in self.scoped]
+
+        # Whether `scoped` holds all the constraints, so that a test case
+        # whose values meet all of them is valid.
+        self.all_scoped = len(self.scoped) == sum(
+            len(cons_index[var]) for var in variables
+        )
+
+
+class _Completer(object):
+    """Find valid test cases that have some of the variables fixed.
+
+    The variables are split into the groups that no constraint connects (see
+    `_independent_components`), so the search and its memos only deal with the
+    variables of one group at a time.
+
+    Most of the partial test cases that IPOG tries are either completed like
+    one of the last ones (or like the test case they were made from), or can't
+    be completed because of the fixed values themselves, so both are checked
+    before searching: the `ScopedConstraint`s between fixed variables (or
+    between fixed variables and one other variable) are checked, with their
+    results memoized on the value codes, and the earlier completions are
+    repaired by putting the fixed values in and checking only the constraints
+    of the changed variables again.
+
+    The search itself is depth-first with forward checking. A partial
+    assignment whose subtree has no valid test case is remembered as dead,
+    keyed on the values that the later constraints can still read (see
+    `_live_reads`) and on the fixed values of the later variables, so no later
+    search goes down the same subtree. A search that tries more than `budget`
+    values gives up and the partial test case is treated as if it couldn't be
+    completed: IPOG then leaves the value to vertical growth, which puts the
+    t-tuples into other rows or new ones, instead of proving exactly whether
+    it fits.
+    """
+
+    def __init__(
+        self,
+        values: List[List],
+        var_precedence: List[str],
+        constraints: Type_Constraints,
+        budget: int = _COMPLETION_BUDGET,
+    ):
+        self.values = values
+        self.var_precedence = var_precedence
+        self.budget = budget
+
+        self.groups = []
+        position = {var: level for level, var in enumerate(var_precedence)}
+        for variables, group_constraints in _independent_components(
+            var_precedence=var_precedence, constraints=constraints
+        ):
+            if not group_constraints:
+                # Without constraints every combination is valid, so the
+                # variables keep their fixed values or take their first ones.
+                continue
+            self.groups.append(
+                _Group(
+                    levels=[position[var] for var in variables],
+                    variables=variables,
+                    constraints=group_constraints,
+                )
+            )
+
+        # The value code of every hashable value, by its type and value so
+        # that equal values of different types, like `1` and `True`, keep
+        # their own codes.
+        self.codes = []
+        for var_values in values:
+            codes = {}
+            for code, value in enumerate(var_values):
+                try:
+                    codes.setdefault((type(value), value), code)
+                except TypeError:
+                    pass
+            self.codes.append(codes)
+
+    def encode(self, level: int, value) -> int:
+        try:
+            return self.codes[level][type(value), value]
+        except (KeyError, TypeError):
+            for code, v in enumerate(self.values[level]):
+                if type(v) is type(value) and v == value:
+                    return code
+            raise ValueError(f"{value!r} is not a possible value")
+
+    def complete(
+        self,
+        fixed: Dict[int, int],
+        hint: Optional[List[int]] = None,
+        exhaustive: bool = False,
+    ) -> Optional[List[int]]:
+        """Return the value codes of a valid test case whose variable at level
+        `i` has the value code `fixed[i]`, or `None` if there is none or none
+        was found within the budget. If `exhaustive` is `True`, the search is
+        not bounded by the budget, so `None` means that there is none.
+
+        `hint` is the value codes of a valid test case, e.g., an earlier
+        completion of most of the same fixed values, which is tried first with
+        the fixed values put in.
+        """
+        codes = [fixed.get(level, 0) for level in range(len(self.values))]
+        for group in self.groups:
+            key = tuple(map(fixed.get, group.levels))
+            if exhaustive or key not in group.memo:
+                group.memo[key] = self._complete_group(
+                    group=group,
+                    key=key,
+                    hint=(
+                        None
+                        if hint is None
+                        else tuple(map(hint.__getitem__, group.levels))
+                    ),
+                    budget=None if exhaustive else self.budget,
+                )
+
+            group_codes = group.memo[key]
+            if group_codes is None:
+                return None
+            for level, code in zip(group.levels, group_codes):
+                codes[level] = code
+
+        return codes
+
+    def _complete_group(
+        self,
+        group: _Group,
+        key: Tuple[Optional[int], ...],
+        hint: Optional[Tuple[int, ...]],
+        budget: Optional[int],
+    ) -> Optional[Tuple[int, ...]]:
+        fixed = [(p, code) for p, code in enumerate(key) if code is not None]
+        group_codes = None
+        if hint is not None:
+            try:
+                group_codes = self._repair(
+                    group=group, key=key, fixed=fixed, codes=hint
+                )
+            except _Infeasible:
+                return None
+
+        if group_codes is None:
+            # Most of the partial test cases that can't be completed are
+            # already ruled out by the constraints between their fixed values.
+            code_domains = self._check_fixed(group=group, key=key)
+            if code_domains is None:
+                return None
+
+        if group_codes is None and hint is None:
+            # A recent completion that still meets the constraints with the
+            # fixed values put in saves a search.
+            for codes in group.recent:
+                group_codes = self._repair(
+                    group=group, key=key, fixed=fixed, codes=codes
+                )
+                if group_codes is not None:
+                    break
+
+        if group_codes is None:
+            # Fixing a variable to a value is the same as leaving only that
+            # value to choose from.
+            domains = [
+                [self.values[level][code] for code in codes]
+                for level, codes in zip(group.levels, code_domains)
+            ]
+            state = self._search(group=group, key=key, domains=domains, budget=budget)
+            if state is None:
+                return None
+
+            group_codes = tuple(
+                self.encode(level, state[var]) if code is None else code
+                for level, var, code in zip(group.levels, group.variables, key)
+            )
+
+        group.recent.insert(0, group_codes)
+        del group.recent[_RECENT_COMPLETIONS:]
+        return group_codes
+
+    def _repair(
+        self,
+        group: _Group,
+        key: Tuple[Optional[int], ...],
+        fixed: List[Tuple[int, int]],
+        codes: Tuple[int, ...],
+    ) -> Optional[Tuple[int, ...]]:
+        """Return the value codes `codes` of a valid test case with the fixed
+        value codes `fixed` put in, or `None` if they are not valid any more.
+
+        Only the constraints of the changed variables are checked again, so a
+        group whose constraints are not all in `scoped` can't be repaired.
+        Raises `_Infeasible` if a violated constraint only has fixed variables.
+        """
+        changed = {p: code for p, code in fixed if codes[p] != code}
+        if not changed:
+            return codes
+        if not group.all_scoped:
+            return None
+
+        touched = set()
+        for p in changed:
+            touched.update(group.touching[p])
+
+        for n in touched:
+            positions, _ = group.scoped[n]
+            if not self._verdict(
+                group, n, tuple(changed.get(p, codes[p]) for p in positions)
+            ):
+                if all(key[p] is not None for p in positions):
+                    raise _Infeasible()
+                return None
+
+        codes = list(codes)
+        for p, code in changed.items():
+            codes[p] = code
+        return tuple(codes)
+
+    def _check_fixed(
+        self, group: _Group, key: Tuple[Optional[int], ...]
+    ) -> Optional[List[List[int]]]:
+        """Check the `ScopedConstraint`s whose variables are all fixed, and
+        remove the values that violate the ones with a single variable that is
+        not fixed from its domain.
+
+        Returns the value codes that are left to every variable of the group,
+        or `None` if a constraint is violated or a domain becomes empty.
+        """
+        domains = [
+            range(len(self.values[level])) if code is None else [code]
+            for level, code in zip(group.levels, key)
+        ]
+
+        touched = set()
+        for p, code in enumerate(key):
+            if code is not None:
+                touched.update(group.touching[p])
+
+        codes = list(key)
+        for n in sorted(touched):
+            positions, _ = group.scoped[n]
+            free = [p for p in positions if key[p] is None]
+            if not free:
+                if not self._verdict(group, n, tuple(key[p] for p in positions)):
+                    return None
+                continue
+            if len(set(free)) > 1:
+                continue
+
+            p = free[0]
+            domain = []
+            for code in domains[p]:
+                codes[p] = code
+                if self._verdict(group, n, tuple(codes[q] for q in positions)):
+                    domain.append(code)
+            codes[p] = None
+            if not domain:
+                return None
+            domains[p] = domain
+
+        return domains
+
+    def _verdict(self, group: _Group, n: int, codes: Tuple[int, ...]) -> bool:
+        """Return whether the constraint `group.scoped[n]` is met by the value
+        codes `codes` of its positions.
+        """
+        verdicts = group.verdicts[n]
+        try:
+            return verdicts[codes]
+        except KeyError:
+            pass
+
+        positions, constraints = group.scoped[n]
+        values = [
+            self.values[group.levels[p]][code] for p, code in zip(positions, codes)
+        ]
+        state = {
+            group.variables[p]: value for p, value in zip(positions[1:], values[1:])
+        }
+        verdict = _meets_constraints(
+            constraints=constraints,
+            var=group.variables[positions[0]],
+            value=values[0],
+            state=MappingProxyType(state),
+        )
+        verdicts[codes] = verdict
+        return verdict
+
+    def _search(
+        self,
+        group: _Group,
+        key: Tuple[Optional[int], ...],
+        domains: List[List],
+        budget: Optional[int],
+    ) -> Optional[Type_VariableValues]:
+        """Search the `domains` of the group's variables for a valid test case
+        and return its values, or `None` if there is none or the search tries
+        more than `budget` values (if it is not `None`).
+        """
+        variables = group.variables
+        cons_index = group.plan.cons_index
+        lookahead = group.plan.lookahead
+
+        state = {}
+        view = MappingProxyType(state)
+        if not _forward_check(
+            checks=lookahead[0],
+            var_precedence=variables,
+            domains=domains,
+            state=view,
+            pruned=[],
+        ):
+            return None
+
+        tried = 0
+
+        def extend(i: int) -> bool:
+            nonlocal tried
+            if i == len(variables):
+                return True
+
+            dead_key = (i, tuple(state[var] for var in group.live[i]), key[i:])
+            try:
+                if dead_key in group.dead:
+                    return False
+            except TypeError:
+                # Some of the values are not hashable.
+                dead_key = None
+
+            var = variables[i]
+            pruned = []
+            for value in domains[i]:
+                tried += 1
+                if budget is not None and tried > budget:
+                    raise _BudgetExceeded()
+
+                if not _meets_constraints(
+                    constraints=cons_index[var], var=var, value=value, state=view
+                ):
+                    continue
+
+                state[var] = value
+                if _forward_check(
+                    checks=lookahead[i + 1],
+                    var_precedence=variables,
+                    domains=domains,
+                    state=view,
+                    pruned=pruned,
+                ) and extend(i + 1):
+                    return True
+                del state[var]
+                _restore_domains(domains=domains, pruned=pruned)
+
+            if dead_key is not None:
+                group.dead.add(dead_key)
+            return False
+
+        try:
+            found = extend(0)
+        except _BudgetExceeded:
+            return None
+
+        return state if found else None
+
+
+def covering_array(
+    possible_values: Type_PossibleValues,
+    strength: int = 2,
+    constraints: Optional[Type_Constraints] = None,
+    var_precedence: Optional[List[str]] = None,
+) -> List[Type_VariableValues]:
+    """Generate valid test cases that cover every valid combination of the
+    values of any `strength` variables at least once.
+
+    The variables are added in the order of `var_precedence`, which also
+    decides which earlier variables the constraints see, like in
+    `conditional_combinatorial`. If it is `None`, the order is chosen by
+    `auto_var_precedence`. The keys of every test case follow the order of
+    `possible_values`.
+
+    If `strength` is not less than the number of variables, all the valid test
+    cases are returned. If there are no valid test cases, an empty list is
+    returned.
+    """
+    if strength <= 0:
+        raise ValueError(f"strength must be > 0 (actual: {strength})")
+
+    constraints = constraints or {}
+
+    if var_precedence is None:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    var_num = len(var_precedence)
+    if var_num == 0:
+        return []
+
+    values = [list(possible_values[var]) for var in var_precedence]
+    dims = [len(v) for v in values]
+    if 0 in dims:
+        return []
+
+    completer = _Completer(
+        values=values,
+        var_precedence=var_precedence,
+        constraints=constraints,
+    )
+
+    # Without any valid test case there is nothing to cover, and every
+    # t-tuple would only be ruled out when its search runs out of budget.
+    if completer.complete(fixed={}, exhaustive=True) is None:
+        return []
+
+    # Every row holds the value codes of the variables added so far.
+    t = min(strength, var_num)
+    rows = [
+        list(codes)
+        for codes in product(*[range(d) for d in dims[:t]])
+        if completer.complete(fixed=dict(enumerate(codes))) is not None
+    ]
+
+    # With a strength of 3 or more, the t-tuples with a pair of values that
+    # can't be part of any valid test case are ruled out together instead of
+    # one by one (see `_add_infeasible_pairs`).
+    pairs = None
+    if t >= 3:
+        pairs = {}
+        for level in range(1, t):
+            _add_infeasible_pairs(
+                pairs=pairs, level=level, dims=dims, completer=completer
+            )
+
+    for level in range(t, var_num):
+        rows = _grow(
+            rows=rows,
+            level=level,
+            strength=t,
+            dims=dims,
+            completer=completer,
+            pairs=pairs,
+        )
+
+    # Give the variables that are still "don't care" any valid values.
+    rows = [completer.complete(fixed=_fixed(row)) for row in rows]
+
+    levels = [(var, var_precedence.index(var)) for var in possible_values.keys()]
+    return [{var: values[level][row[level]] for var, level in levels} for row in rows]
+
+
+def _fixed(row: List[Optional[int]]) -> Dict[int, int]:
+    return {level: code for level, code in enumerate(row) if code is not None}
+
+
+def _decode(index: int, tuple_dims: Tuple[int, ...]) -> List[int]:
+    """Return the value codes of the t-tuple with the mixed-radix index
+    `index`.
+    """
+    codes = []
+    for d in reversed(tuple_dims):
+        index, code = divmod(index, d)
+        codes.append(code)
+    codes.reverse()
+    return codes
+
+
+def _add_infeasible_pairs(
+    pairs: Dict[int, Dict[int, Set[Tuple[int, int]]]],
+    level: int,
+    dims: List[int],
+    completer: _Completer,
+):
+    """Add the pairs of value codes of the variable at `level` and an earlier
+    one that can't be part of any valid test case to `pairs`.
+
+    `pairs[a][b]` holds the infeasible pairs of the variables at the levels
+    `a` and `b`, with the value code of the variable at `a` first, so every
+    pair is in it twice. The pairs are checked without the budget, since a
+    pair that is wrongly taken as infeasible rules out all the t-tuples with
+    it.
+    """
+    for other in range(level):
+        for codes in product(range(dims[other]), range(dims[level])):
+            fixed = dict(zip((other, level), codes))
+            if completer.complete(fixed=fixed, exhaustive=True) is None:
+                pairs.setdefault(other, {}).setdefault(level, set()).add(codes)
+                pairs.setdefault(level, {}).setdefault(other, set()).add(codes[::-1])
+
+
+def _grow(
+    rows: List[List[Optional[int]]],
+    level: int,
+    strength: int,
+    dims: List[int],
+    completer: _Completer,
+    pairs: Optional[Dict[int, Dict[int, Set[Tuple[int, int]]]]] = None,
+) -> List[List[Optional[int]]]:
+    """Add the variable at `level` to the covering array of the variables
+    before it. `None` in a row means "don't care": the variable can take any
+    value that keeps the row valid, so later t-tuples can still be put there.
+
+    If `pairs` is given, it holds the infeasible pairs of value codes of the
+    variables before `level` (see `_add_infeasible_pairs`), and the ones with
+    the new variable are added to it.
+    """
+    dim = dims[level]
+
+    # The sets of earlier variables that form a t-tuple with the new variable,
+    # and a bitset of the uncovered t-tuples of each of them. Bit `i` stands
+    # for the tuple whose value codes have the mixed-radix index `i`, with the
+    # new variable's code as the last digit.
+    var_sets = list(combinations(range(level), strength - 1))
+    set_dims = [tuple(dims[v] for v in s) + (dim,) for s in var_sets]
+    uncovered = []
+    for tuple_dims in set_dims:
+        size = 1
+        for d in tuple_dims:
+            size *= d
+        uncovered.append((1 << size) - 1)
+
+    # The weight of every value code in the mixed-radix index of a set's
+    # tuples, without the new variable's digit.
+    weights = []
+    for tuple_dims in set_dims:
+        set_weights = []
+        weight = dim
+        for d in reversed(tuple_dims[:-1]):
+            set_weights.append(weight)
+            weight *= d
+        set_weights.reverse()
+        weights.append(set_weights)
+
+    # The t-tuples with an infeasible pair of values can't be covered.
+    if pairs is not None:
+        _add_infeasible_pairs(pairs=pairs, level=level, dims=dims, completer=completer)
+        for i, (s, tuple_dims) in enumerate(zip(var_sets, set_dims)):
+            infeasible = [
+                (j, k, pairs[x][y])
+                for (j, x), (k, y) in combinations(enumerate(s + (level,)), 2)
+                if y in pairs.get(x, ())
+            ]
+            if not infeasible:
+                continue
+
+            bits = uncovered[i]
+            while bits:
+                index = (bits & -bits).bit_length() - 1
+                bits &= bits - 1
+                codes = _decode(index, tuple_dims)
+                if any((codes[j], codes[k]) in bad for j, k, bad in infeasible):
+                    uncovered[i] &= ~(1 << index)
+
+    window = (1 << dim) - 1
+
+    # Horizontal growth: extend every row with the value that covers the most
+    # uncovered t-tuples. A row whose variables are "don't care" doesn't cover
+    # any tuple of those variables yet. The sets whose tuples are all covered
+    # are dropped from `active` as the rows go.
+    active = list(range(len(var_sets)))
+    for row in rows:
+        # The sets whose tuples with this row's values are not all covered,
+        # with the index of the tuple whose new variable's code is 0.
+        active = [i for i in active if uncovered[i]]
+        sets = []
+        gains = [0] * dim
+        for i in active:
+            base = 0
+            for v, weight in zip(var_sets[i], weights[i]):
+                code = row[v]
+                if code is None:
+                    break
+                base += code * weight
+            else:
+                bits = (uncovered[i] >> base) & window
+                if bits:
+                    sets.append((i, base))
+                    for code in range(dim):
+                        gains[code] += (bits >> code) & 1
+
+        best_code = None
+        best_gain = 0
+        hint = None
+        for code, gain in enumerate(gains):
+            if gain <= best_gain:
+                continue
+
+            fixed = _fixed(row)
+            if hint is None:
+                hint = completer.complete(fixed=fixed)
+            fixed[level] = code
+            if completer.complete(fixed=fixed, hint=hint) is None:
+                continue
+
+            best_code = code
+            best_gain = gain
+
+        # If no value covers anything new, leave the value to vertical growth.
+        row.append(best_code)
+        if best_code is not None:
+            for i, base in sets:
+                uncovered[i] &= ~(1 << (base + best_code))
+
+    # Vertical growth: put every t-tuple that is still uncovered into the
+    # first row whose "don't care" variables can take it, or into a new row.
+    # A row without "don't care" variables already covers all its tuples, so
+    # only the others are searched.
+    open_rows = [row for row in rows if None in row]
+    for s, tuple_dims, bits in zip(var_sets, set_dims, uncovered):
+        tuple_levels = s + (level,)
+        while bits:
+            index = (bits & -bits).bit_length() - 1
+            bits &= bits - 1
+
+            assignment = list(zip(tuple_levels, _decode(index, tuple_dims)))
+
+            # A tuple that can't be part of any valid test case doesn't need
+            # to be covered, so it isn't tried in every row.
+            if completer.complete(fixed=dict(assignment)) is None:
+                continue
+
+            # The values of the other variables that the tuple's values can't
+            # be in a valid test case with.
+            conflicts = []
+            if pairs is not None:
+                for v, c in assignment:
+                    for other, bad in pairs.get(v, {}).items():
+                        other_codes = {b for a, b in bad if a == c}
+                        if other_codes:
+                            conflicts.append((other, other_codes))
+
+            for row in open_rows:
+                for v, c in assignment:
+                    if row[v] is not None and row[v] != c:
+                        break
+                else:
+                    if any(row[v] in codes for v, codes in conflicts):
+                        continue
+
+                    fixed = _fixed(row)
+                    hint = completer.complete(fixed=fixed)
+                    fixed.update(assignment)
+                    if completer.complete(fixed=fixed, hint=hint) is not None:
+                        for v, c in assignment:
+                            row[v] = c
+                        break
+            else:
+                row = [None] * (level + 1)
+                for v, c in assignment:
+                    row[v] = c
+                rows.append(row)
+                open_rows.append(row)
+
+    return rows
@@ -0,0 +1,331 @@
+"""An opt-in disk cache of the results of `full_combinatorial` and
+`conditional_combinatorial`.
+
+The results are stored as `ResultSet` columns: a small header with the
+variables and their value dictionaries, followed by the raw value codes of
+every column. On a hit, only the header is read; the columns are memory-mapped
+and the value codes are read from the file when they are accessed.
+
+The cache key is a fingerprint of `possible_values`, `var_precedence`, the
+constraints (their names, scopes and code objects, including the constants,
+default arguments and closure variables of the functions) and the cache's
+`version`. Anything else that a constraint depends on, e.g., the global
+variables it reads or the functions it calls, is not part of the fingerprint,
+so bump `version` when it changes. The results are not cached if the
+arguments hold an object without a stable description, e.g., an instance of a
+class without a `__repr__`.
+"""
+
+import functools
+import hashlib
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import tempfile
+import types
+
+from typing import List, Optional
+from kombii.kombii import (
+    ConstraintCache,
+    conditional_combinatorial,
+    full_combinatorial,
+)
+from kombii.tables import TableConstraint
+from ytestit_common.constraints import ScopedConstraint
+from ytestit_common.results import ResultSet
+from ytestit_common.types import Type_Constraints, Type_PossibleValues
+
+
+_MAGIC = b"KOMBII\x00\x01"
+
+# The columns start at multiples of this many bytes in the file.
+_ALIGNMENT = 8
+
+# The address in the default `repr` of an object, which changes in every run.
+_ADDRESS = re.compile(r" at 0x[0-9A-Fa-f]+")
+
+
+class DiskCache(object):
+    """Cache the results of `full_combinatorial` and
+    `conditional_combinatorial` as files in `directory`, which is created if
+    it doesn't exist.
+
+    `version` is a tag that is part of every cache key, so changing it
+    invalidates the results that were cached with the old tag.
+
+    The `ResultSet`s that are loaded from the cache are read-only views of the
+    files.
+    """
+
+    def __init__(self, directory: str, version: Optional[str] = None):
+        self.directory = directory
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"DiskCache(directory={self.directory!r} version={self.version!r} "
+            f"hits={self.hits} misses={self.misses})"
+        )
+
+    def clear(self) -> None:
+        """Remove all the cached results."""
+        for name in os.listdir(self.directory):
+            if name.endswith(".kombii"):
+                os.remove(os.path.join(self.directory, name))
+
+    def full_combinatorial(self, possible_values: Type_PossibleValues) -> ResultSet:
+        """Return the same combinations as `full_combinatorial` as a
+        `ResultSet`, from the cache if possible.
+        """
+        key = _fingerprint(["full", possible_values, self.version])
+        return self._get_or_generate(
+            key=key,
+            generate=lambda: full_combinatorial(
+                possible_values=possible_values, columnar=True
+            ),
+        )
+
+    def conditional_combinatorial(
+        self,
+        possible_values: Type_PossibleValues,
+        var_precedence: Optional[List[str]],
+        constraints: Type_Constraints,
+        forward_checking: bool = False,
+        workers: Optional[int] = None,
+    ) -> ResultSet:
+        """Return the same combinations as `conditional_combinatorial` as a
+        `ResultSet`, from the cache if possible. `forward_checking` and
+        `workers` don't change the results so they are not part of the key.
+        """
+        key = _fingerprint(
+            ["conditional", possible_values, var_precedence, constraints, self.version]
+        )
+        return self._get_or_generate(
+            key=key,
+            generate=lambda: conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=forward_checking,
+                workers=workers,
+                columnar=True,
+            ),
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.kombii")
+
+    def _get_or_generate(self, key: Optional[str], generate) -> ResultSet:
+        if key is None:
+            # The arguments have no stable fingerprint, so the results could
+            # never be found again.
+            self.misses += 1
+            return generate()
+
+        path = self._path(key)
+        results = _load(path) if os.path.exists(path) else None
+        if results is not None:
+            self.hits += 1
+            return results
+
+        self.misses += 1
+        results = generate()
+        _save(path=path, results=results)
+        return results
+
+
+def _save(path: str, results: ResultSet) -> None:
+    columns = [results.columns[var] for var in results.variables]
+
+    header = {
+        "byteorder": sys.byteorder,
+        "variables": results.variables,
+        "values": [results.dictionaries[var].values for var in results.variables],
+        "columns": [(column.typecode, column.itemsize) for column in columns],
+        "length": len(results),
+    }
+    try:
+        header_bytes = pickle.dumps(header)
+    except Exception:
+        # The values can't be stored, so the results are just not cached.
+        return
+
+    # Write to a temporary file first so a concurrent reader never sees a
+    # partly written file.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for column in columns:
+                f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+                column.tofile(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _load(path: str) -> Optional[ResultSet]:
+    """Load the results in `path`, or return `None` if the file can't be
+    used.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            return None
+        try:
+            (header_size,) = struct.unpack("<Q", f.read(8))
+            header = pickle.loads(f.read(header_size))
+        except Exception:
+            # A truncated or corrupted file.
+            return None
+
+        if header["byteorder"] != sys.byteorder:
+            return None
+
+        offset = len(_MAGIC) + 8 + header_size
+        length = header["length"]
+
+        mapped = None
+        if any(itemsize * length for _, itemsize in header["columns"]):
+            mapped = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    results = ResultSet(variables=header["variables"])
+    for var, values in zip(results.variables, header["values"]):
+        dictionary = results.dictionaries[var]
+        for value in values:
+            dictionary.encode(value)
+
+    for var, (typecode, itemsize) in zip(results.variables, header["columns"]):
+        offset += -offset % _ALIGNMENT
+        size = itemsize * length
+        if size and offset + size > len(mapped):
+            # The file was truncated after the header.
+            return None
+        if mapped is None:
+            results.columns[var] = memoryview(b"").cast(typecode)
+        else:
+            # A read-only view of the value codes in the file.
+            results.columns[var] = mapped[offset : offset + size].cast(typecode)
+        offset += size
+
+    return results
+
+
+class _UnstableDescription(Exception):
+    """Raised by `_describe` for an object whose description would be
+    different in every run.
+    """
+
+
+def _fingerprint(obj) -> Optional[str]:
+    """Return the cache key of `obj`, or `None` if it holds an object without
+    a stable description.
+    """
+    digest = hashlib.sha256()
+    try:
+        _describe(obj=obj, update=digest.update, seen=set())
+    except _UnstableDescription:
+        return None
+    return digest.hexdigest()
+
+
+def _describe(obj, update, seen) -> None:
+    """Feed a description of `obj` into `update`. Two objects with the same
+    description generate the same combinations.
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes)):
+        update(f"{type(obj).__name__}:{obj!r};".encode())
+        return
+
+    # `seen` holds the objects that are being described, so an object that
+    # refers to itself (e.g., a closure that calls itself) doesn't recurse
+    # forever.
+    if id(obj) in seen:
+        update(b"<recursion>;")
+        return
+    seen.add(id(obj))
+
+    if isinstance(obj, (list, tuple)):
+        update(f"{type(obj).__name__}[{len(obj)}](".encode())
+        for item in obj:
+            _describe(obj=item, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, dict) or isinstance(obj, types.MappingProxyType):
+        update(f"dict[{len(obj)}](".encode())
+        for key, value in obj.items():
+            _describe(obj=key, update=update, seen=seen)
+            _describe(obj=value, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, (set, frozenset)):
+        # The order of a set depends on the hashes of its items, which may
+        # change between runs (e.g., for strings), and the order of the
+        # results follows it when the set is iterated, so it is part of the
+        # description.
+        update(f"set[{len(obj)}](".encode())
+        for item in obj:
+            _describe(obj=item, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, TableConstraint):
+        update(b"table(")
+        _describe(obj=obj.variables, update=update, seen=seen)
+        _describe(obj=obj.allowed, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, ScopedConstraint):
+        update(b"scoped(")
+        _describe(obj=sorted(obj.watches), update=update, seen=seen)
+        _describe(
+            obj=None if obj.reads is None else sorted(obj.reads),
+            update=update,
+            seen=seen,
+        )
+        _describe(obj=obj.func, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, types.FunctionType):
+        update(f"function:{obj.__module__}.{obj.__qualname__}(".encode())
+        _describe(obj=obj.__code__, update=update, seen=seen)
+        _describe(obj=obj.__defaults__, update=update, seen=seen)
+        _describe(obj=obj.__kwdefaults__, update=update, seen=seen)
+        cells = [cell.cell_contents for cell in obj.__closure__ or ()]
+        _describe(obj=cells, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, types.CodeType):
+        update(b"code(")
+        update(obj.co_code)
+        _describe(obj=obj.co_names, update=update, seen=seen)
+        _describe(obj=obj.co_consts, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, ConstraintCache):
+        # A memoized constraint refers to its cache, whose statistics don't
+        # change the results.
+        update(b"ConstraintCache;")
+    elif isinstance(obj, types.MethodType):
+        update(b"method(")
+        _describe(obj=obj.__func__, update=update, seen=seen)
+        _describe(obj=obj.__self__, update=update, seen=seen)
+        update(b");")
+    elif isinstance(obj, functools.partial):
+        update(b"partial(")
+        _describe(obj=obj.func, update=update, seen=seen)
+        _describe(obj=obj.args, update=update, seen=seen)
+        _describe(obj=obj.keywords, update=update, seen=seen)
+        update(b");")
+    else:
+        # Fall back to the `repr`, unless it is the default one or has an
+        # address in it, which is different in every run.
+        description = repr(obj)
+        if type(obj).__repr__ is object.__repr__ or _ADDRESS.search(description):
+            raise _UnstableDescription(description)
+        update(f"{type(obj).__qualname__}:{description};".encode())
+
+    # The same object may appear again outside of itself, e.g., a function
+    # that is used by two constraints.
+    seen.discard(id(obj))
@@ -1,8 +1,31 @@
+import asyncio
 import copy
 import enum
+import pickle
+import random
+import threading
+import time
 
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
 from itertools import product
-from typing import List
+from types import MappingProxyType
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from kombii.ordering import _check_order, iter_gray_code, min_change_order
+from ytestit_common.constraints import ScopedConstraint
+from ytestit_common.results import ResultSet, ValueDictionary
 from ytestit_common.types import (
     Type_PossibleValues,
     Type_VariableValues,
@@ -17,6 +40,70 @@ class Node(object):
         self.children = []
 
 
+class PartialState(Mapping):
+    """A read-only partial combination of the variables.
+
+    Assigning a variable creates a new `PartialState` that points back to the
+    one it extends, so all the partial combinations on a branch share their
+    common prefix and nothing is copied. Looking a variable up walks the chain
+    back towards the root, which is cheap because a chain is never longer than
+    the number of variables.
+    """
+
+    __slots__ = ("_parent", "_var", "_value", "_len")
+
+    def __init__(self, parent=None, var=None, value=None):
+        self._parent = parent
+        self._var = var
+        self._value = value
+        self._len = 0 if parent is None else parent._len + 1
+
+    def assign(self, var: str, value) -> "PartialState":
+        return PartialState(parent=self, var=var, value=value)
+
+    def __getitem__(self, var: str):
+        s = self
+        while s._parent is not None:
+            if s._var == var:
+                return s._value
+            s = s._parent
+
+        raise KeyError(var)
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self) -> int:
+        return self._len
+
+    # `Mapping` implements the following views with `__getitem__`, which would
+    # walk the chain once per variable.
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def values(self):
+        return self.to_dict().values()
+
+    def __repr__(self) -> str:
+        return f"PartialState({self.to_dict()})"
+
+    def to_dict(self) -> Type_VariableValues:
+        """Materialize the partial combination as a new `dict` whose keys are
+        in the order the variables were assigned.
+        """
+        items = []
+        s = self
+        while s._parent is not None:
+            items.append((s._var, s._value))
+            s = s._parent
+
+        return dict(reversed(items))
+
+
 class ConstraintResult(enum.IntEnum):
     # Discard the current test case because it doesn't meet the constraint.
     DISCARD = 1
@@ -24,9 +111,487 @@ class ConstraintResult(enum.IntEnum):
     KEEP = 2
 
 
+# Stands for the read variables that are not in the state yet when a constraint
+# result is memoized, so they are not confused with any actual value.
+_UNASSIGNED = object()
+
+
+class ConstraintCache(object):
+    """A bounded LRU cache of constraint results.
+
+    `memoize` wraps every `ScopedConstraint` that declares its `reads` so that
+    its result is looked up by `(constraint, var, value, values of the read
+    variables)` before the constraint is actually called. This assumes the
+    constraints are pure functions of their arguments. The least recently used
+    result is evicted when the cache holds `maxsize` results.
+
+    `hits` and `misses` count the lookups. The constraints whose scope isn't
+    declared can't be memoized and are left as they are.
+    """
+
+    def __init__(self, maxsize: int = 65536):
+        if maxsize <= 0:
+            raise ValueError(f"maxsize must be > 0 (actual: {maxsize})")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def __repr__(self) -> str:
+        return (
+            f"ConstraintCache(hits={self.hits} misses={self.misses} "
+            f"size={len(self)} maxsize={self.maxsize})"
+        )
+
+    def clear(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._results.clear()
+
+    def memoize(self, constraints: Type_Constraints) -> Type_Constraints:
+        memoized = {}
+        for name, cons in constraints.items():
+            if isinstance(cons, ScopedConstraint) and cons.reads is not None:
+                cons = ScopedConstraint(
+                    func=self._memoize_one(cons),
+                    watches=cons.watches,
+                    reads=cons.reads,
+                    cost=cons.cost,
+                )
+            memoized[name] = cons
+
+        return memoized
+
+    def _memoize_one(self, cons: ScopedConstraint):
+        reads = sorted(cons.reads)
+
+        def memoized(var, value, state):
+            key = (
+                cons,
+                var,
+                value,
+                tuple(state.get(r, _UNASSIGNED) for r in reads),
+            )
+            try:
+                ret = self._results[key]
+            except KeyError:
+                pass
+            except TypeError:
+                # Some of the values are not hashable.
+                self.misses += 1
+                return cons(var=var, value=value, state=state)
+            else:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return ret
+
+            self.misses += 1
+            ret = cons(var=var, value=value, state=state)
+            self._results[key] = ret
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+            return ret
+
+        memoized.__name__ = getattr(cons, "__name__", memoized.__name__)
+        return memoized
+
+
+class ConstraintStats(object):
+    """How many times a constraint was called, how long the calls took in
+    total (in seconds) and how many of them returned DISCARD.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.discards = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"ConstraintStats(calls={self.calls} seconds={self.seconds:.6f} "
+            f"discards={self.discards})"
+        )
+
+
+class LevelStats(object):
+    """How many nodes the tree got for a variable, and how many leaves ended
+    at it because it had no valid values (so their branches were discarded as
+    incomplete).
+    """
+
+    def __init__(self, var: str):
+        self.var = var
+        self.nodes = 0
+        self.discarded_leaves = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"LevelStats(var={self.var} nodes={self.nodes} "
+            f"discarded_leaves={self.discarded_leaves})"
+        )
+
+
+class SearchStats(object):
+    """Counters of a `conditional_combinatorial` run, to find the constraint
+    or the variable that makes a search slow.
+
+    - `constraints` maps the name of every constraint to its
+      `ConstraintStats`. The constraints are counted by the wrappers that
+      `instrument` puts around them.
+    - `levels` holds the `LevelStats` of every variable, in the order of the
+      precedence. They are only counted by the tree search, i.e., without
+      `forward_checking`, `workers` or `columnar`.
+
+    The same `SearchStats` can be passed to several runs to add their
+    counters up. `levels` only keeps the variables of the last precedence.
+    """
+
+    def __init__(self):
+        self.constraints = {}
+        self.levels = []
+
+    def __repr__(self) -> str:
+        return (
+            f"SearchStats(constraints={len(self.constraints)} "
+            f"levels={len(self.levels)})"
+        )
+
+    def instrument(self, constraints: Type_Constraints) -> Type_Constraints:
+        """Wrap every constraint so that its calls are counted. A
+        `ScopedConstraint` stays a `ScopedConstraint` with the same scope.
+        """
+        instrumented = {}
+        for name, cons in constraints.items():
+            stats = self.constraints.setdefault(name, ConstraintStats())
+            wrapper = _counted(cons=cons, stats=stats)
+            if isinstance(cons, ScopedConstraint):
+                wrapper = ScopedConstraint(
+                    func=wrapper,
+                    watches=cons.watches,
+                    reads=cons.reads,
+                    cost=cons.cost,
+                )
+            instrumented[name] = wrapper
+
+        return instrumented
+
+    def level(self, level: int, var: str) -> LevelStats:
+        while len(self.levels) <= level:
+            self.levels.append(None)
+        if self.levels[level] is None or self.levels[level].var != var:
+            self.levels[level] = LevelStats(var=var)
+        return self.levels[level]
+
+    def report(self) -> str:
+        """Format the counters as a table, with the slowest constraints
+        first.
+        """
+        lines = ["constraint                       calls     seconds   discards"]
+        for name, stats in sorted(
+            self.constraints.items(), key=lambda item: -item[1].seconds
+        ):
+            lines.append(
+                f"{name:<28} {stats.calls:>9} {stats.seconds:>11.6f} "
+                f"{stats.discards:>10}"
+            )
+
+        lines.append("")
+        lines.append("level variable                     nodes   discarded leaves")
+        for level, stats in enumerate(self.levels):
+            lines.append(
+                f"{level:>5} {stats.var:<24} {stats.nodes:>9} "
+                f"{stats.discarded_leaves:>18}"
+            )
+
+        return "\n".join(lines)
+
+
+def _counted(cons, stats: ConstraintStats):
+    def counted(var, value, state):
+        start = time.perf_counter()
+        try:
+            ret = cons(var=var, value=value, state=state)
+        finally:
+            stats.seconds += time.perf_counter() - start
+            stats.calls += 1
+        if ret == ConstraintResult.DISCARD:
+            stats.discards += 1
+        return ret
+
+    counted.__name__ = getattr(cons, "__name__", counted.__name__)
+    return counted
+
+
+class ProductSequence(Sequence):
+    """All the combinations of `possible_values`, in the same order as
+    `full_combinatorial`, as a sequence that doesn't store any of them.
+
+    The combination at index `i` is decoded from `i` as a mixed-radix number
+    whose digits are the positions of the values in `possible_values`, and
+    `index` encodes a combination back into its index. Slicing returns
+    another `ProductSequence` over the selected indexes, so a range of the
+    combinations (e.g., the shard of one CI node) can be taken without
+    generating the others.
+    """
+
+    def __init__(
+        self,
+        possible_values: Type_PossibleValues,
+        indexes: Optional[range] = None,
+    ):
+        self.variables = list(possible_values.keys())
+        self.values = [list(possible_values[var]) for var in self.variables]
+
+        size = 1 if self.variables else 0
+        for values in self.values:
+            size *= len(values)
+
+        self.indexes = range(size) if indexes is None else indexes
+        self._positions = self._index_positions()
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            sliced = copy.copy(self)
+            sliced.indexes = self.indexes[index]
+            return sliced
+
+        return self.decode(self.indexes[index])
+
+    def __contains__(self, combination) -> bool:
+        try:
+            self.index(combination)
+        except ValueError:
+            return False
+        return True
+
+    def __repr__(self) -> str:
+        return f"ProductSequence(variables={self.variables} indexes={self.indexes})"
+
+    def _index_positions(self) -> List[Dict]:
+        """Return the position of every hashable value in the values of its
+        variable, for every variable.
+        """
+        all_positions = []
+        for values in self.values:
+            positions = {}
+            for position, value in enumerate(values):
+                try:
+                    positions.setdefault(value, position)
+                except TypeError:
+                    pass
+            all_positions.append(positions)
+        return all_positions
+
+    def decode(self, product_index: int) -> Type_VariableValues:
+        """Return the combination at `product_index` in the full product,
+        regardless of the slice this sequence covers.
+        """
+        positions = []
+        for values in reversed(self.values):
+            product_index, position = divmod(product_index, len(values))
+            positions.append(position)
+
+        return {
+            var: values[position]
+            for var, values, position in zip(
+                self.variables, self.values, reversed(positions)
+            )
+        }
+
+    def encode(self, combination: Type_VariableValues) -> int:
+        """Return the index of `combination` in the full product."""
+        if not self.variables or combination.keys() != set(self.variables):
+            raise ValueError(f"{combination} is not a combination of {self.variables}")
+
+        product_index = 0
+        for var, values, positions in zip(self.variables, self.values, self._positions):
+            value = combination[var]
+            try:
+                position = positions[value]
+            except KeyError:
+                raise ValueError(f"{value!r} is not a possible value of '{var}'")
+            except TypeError:
+                try:
+                    position = values.index(value)
+                except ValueError:
+                    raise ValueError(f"{value!r} is not a possible value of '{var}'")
+            product_index = product_index * len(values) + position
+
+        return product_index
+
+    def index(self, combination: Type_VariableValues, start=0, stop=None) -> int:
+        """Return the index of `combination` in this sequence."""
+        product_index = self.encode(combination)
+        try:
+            index = self.indexes.index(product_index)
+        except ValueError:
+            raise ValueError(f"{combination} is not in the sequence")
+
+        if index < start or (stop is not None and index >= stop):
+            raise ValueError(f"{combination} is not in the sequence")
+
+        return index
+
+
+class ComponentProduct(ProductSequence):
+    """The cartesian product of the combinations of independent groups of
+    variables, as a sequence that doesn't store any of the products.
+
+    `components` holds the variables of every group and `results[i]` holds
+    the combinations of `components[i]`. A combination of the product merges
+    one combination of every group, with the keys in the order of `keys`. The
+    groups are ordered like the variables of a `ProductSequence`, so the last
+    group changes the fastest.
+    """
+
+    def __init__(
+        self,
+        components: List[List[str]],
+        results: List[Sequence],
+        keys: Iterable[str],
+        indexes: Optional[range] = None,
+    ):
+        self.components = components
+        self.keys = list(keys)
+        self._key_set = set(self.keys)
+
+        super().__init__(
+            possible_values={
+                f"component{i}": component_results
+                for i, component_results in enumerate(results)
+            },
+            indexes=indexes,
+        )
+
+    def __repr__(self) -> str:
+        return f"ComponentProduct(components={self.components} indexes={self.indexes})"
+
+    def _index_positions(self) -> List[Dict]:
+        """Return the position of every combination of a group, by its values.
+        The combinations are `dict`s so they can't be looked up by themselves.
+        """
+        all_positions = []
+        for component, component_results in zip(self.components, self.values):
+            positions = {}
+            for position, combination in enumerate(component_results):
+                try:
+                    positions.setdefault(
+                        tuple(combination[var] for var in component), position
+                    )
+                except TypeError:
+                    pass
+            all_positions.append(positions)
+        return all_positions
+
+    def decode(self, product_index: int) -> Type_VariableValues:
+        merged = {}
+        for combination in super().decode(product_index).values():
+            merged.update(combination)
+
+        return _reorder_keys(merged, self.keys)
+
+    def encode(self, combination: Type_VariableValues) -> int:
+        if not self.variables or combination.keys() != self._key_set:
+            raise ValueError(f"{combination} is not a combination of {self.keys}")
+
+        product_index = 0
+        for component, values, positions in zip(
+            self.components, self.values, self._positions
+        ):
+            sub = {var: combination[var] for var in component}
+            try:
+                position = positions[tuple(sub.values())]
+            except KeyError:
+                raise ValueError(f"{sub} is not a valid combination")
+            except TypeError:
+                try:
+                    position = values.index(sub)
+                except ValueError:
+                    raise ValueError(f"{sub} is not a valid combination")
+            product_index = product_index * len(values) + position
+
+        return product_index
+
+
+def _check_shard(shard: Tuple[int, int], possible_values: Type_PossibleValues) -> None:
+    k, n = shard
+    if n <= 0:
+        raise ValueError(f"number of shards must be > 0 (actual: {n})")
+    if not 0 <= k < n:
+        raise ValueError(f"shard must be >= 0 and < {n} (actual: {k})")
+
+    # Every CI node must see the values in the same order, which isn't the
+    # case for e.g. a `set` of strings, whose order depends on PYTHONHASHSEED.
+    for var, values in possible_values.items():
+        if not isinstance(values, Sequence):
+            raise ValueError(
+                f"possible values of '{var}' must be an ordered sequence to shard "
+                f"(actual: {type(values).__name__})"
+            )
+
+
 def full_combinatorial(
     possible_values: Type_PossibleValues,
-) -> List[Type_VariableValues]:
+    columnar: bool = False,
+    lazy: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    order: Optional[str] = None,
+) -> Union[List[Type_VariableValues], ResultSet, ProductSequence]:
+    """Generate all the combinations of `possible_values`. With `columnar`,
+    the combinations are returned as a `ResultSet` instead of `dict`s. With
+    `lazy`, they are returned as a `ProductSequence` that generates every
+    combination only when it is accessed.
+
+    With `shard=(k, n)`, only the `k`-th of `n` contiguous, equally sized
+    ranges of the combinations is generated, so that `n` CI nodes together
+    generate every combination exactly once. The possible values of every
+    variable must then be a sequence (e.g., a `list`, not a `set`), so that
+    every node sees them in the same order.
+
+    With `order="min_change"`, the combinations are generated in the order of
+    a Gray code, in which every two consecutive combinations differ in exactly
+    one variable (see `kombii.ordering.iter_gray_code`). It can't be combined
+    with `lazy` or `shard`.
+    """
+    if columnar and lazy:
+        raise ValueError("combinations can't be both columnar and lazy")
+
+    _check_order(order)
+    if order is not None:
+        if lazy or shard is not None:
+            raise ValueError("order can't be combined with lazy or shard")
+
+        results = iter_gray_code(possible_values=possible_values)
+        if columnar:
+            return ResultSet.from_dicts(rows=results, variables=possible_values.keys())
+        return list(results)
+
+    if shard is not None:
+        _check_shard(shard=shard, possible_values=possible_values)
+        k, n = shard
+        sequence = ProductSequence(possible_values=possible_values)
+        size = len(sequence)
+        sequence = sequence[size * k // n : size * (k + 1) // n]
+        if lazy:
+            return sequence
+        if columnar:
+            return ResultSet.from_dicts(rows=sequence, variables=sequence.variables)
+        return list(sequence)
+
+    if lazy:
+        return ProductSequence(possible_values=possible_values)
+
+    if columnar:
+        return _full_combinatorial_columnar(possible_values=possible_values)
+
     if not possible_values:
         return []
 
@@ -42,43 +607,223 @@ def full_combinatorial(
     return result
 
 
+def _full_combinatorial_columnar(possible_values: Type_PossibleValues) -> ResultSet:
+    variables = list(possible_values.keys())
+    dictionaries = {var: ValueDictionary() for var in variables}
+    codes = [
+        [dictionaries[var].encode(value) for value in possible_values[var]]
+        for var in variables
+    ]
+
+    # The column types depend on the sizes of the value dictionaries, so the
+    # values must be encoded before the `ResultSet` is created.
+    results = ResultSet(variables=variables, dictionaries=dictionaries)
+
+    # Like in `itertools.product`, the last variable changes the fastest: each
+    # of its values repeats `stride` times in a block, and the block repeats
+    # for every combination of the variables before it.
+    stride = 1
+    for i in reversed(range(len(variables))):
+        var = variables[i]
+        block = array(
+            results.columns[var].typecode,
+            [code for code in codes[i] for _ in range(stride)],
+        )
+        repeats = 1
+        for var_codes in codes[:i]:
+            repeats *= len(var_codes)
+        results.columns[var] = block * repeats
+        stride *= len(codes[i])
+
+    return results
+
+
+def _index_constraints(
+    variables: Iterable[str],
+    constraints: Type_Constraints,
+) -> Dict[str, Type_Constraints]:
+    """Find the constraints that need to be checked for each variable.
+
+    A `ScopedConstraint` is only checked for the variables it watches. A plain
+    constraint function may be interested in any variable so it is checked for
+    all of them.
+    """
+    index = {}
+    for var in variables:
+        index[var] = {
+            name: cons
+            for name, cons in constraints.items()
+            if not isinstance(cons, ScopedConstraint) or var in cons.watches
+        }
+
+    return index
+
+
+def _independent_components(
+    var_precedence: List[str],
+    constraints: Type_Constraints,
+) -> List[Tuple[List[str], Type_Constraints]]:
+    """Split the variables into groups such that no constraint involves the
+    variables of two groups, so the valid combinations of every group can be
+    searched on their own. Every group keeps the order of `var_precedence`,
+    and the groups are ordered by their first variables.
+
+    A `ScopedConstraint` that declares its `reads` involves the variables it
+    watches and reads. Any other constraint may involve every variable.
+    """
+    position = {var: i for i, var in enumerate(var_precedence)}
+    parent = list(range(len(var_precedence)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    scopes = {}
+    for name, cons in constraints.items():
+        if isinstance(cons, ScopedConstraint) and cons.reads is not None:
+            scope = cons.watches | cons.reads
+        else:
+            scope = var_precedence
+        scopes[name] = sorted(position[var] for var in scope if var in position)
+
+        for i in scopes[name][1:]:
+            root, other = sorted((find(scopes[name][0]), find(i)))
+            parent[other] = root
+
+    components = {}
+    for i, var in enumerate(var_precedence):
+        components.setdefault(find(i), ([], {}))[0].append(var)
+
+    for name, cons in constraints.items():
+        if scopes[name]:
+            components[find(scopes[name][0])][1][name] = cons
+
+    return list(components.values())
+
+
+def _meets_constraints(
+    constraints: Type_Constraints,
+    var: str,
+    value,
+    state: Type_VariableValues,
+) -> bool:
+    for name, cons in constraints.items():
+        ret = cons(var=var, value=value, state=state)
+        if ret == ConstraintResult.DISCARD:
+            return False
+        elif ret != ConstraintResult.KEEP:
+            raise ValueError(
+                f"constraint '{name}' "
+                "must return 'ConstraintResult.DISCARD' "
+                "or 'ConstraintResult.KEEP' "
+                f"but actually returned '{ret}'"
+            )
+
+    return True
+
+
+class _AdaptiveChecks(object):
+    """Check the constraints of one variable in the order that is expected to
+    find a DISCARD with the fewest calls, learned from the checks so far.
+
+    Every constraint is scored by its observed discard rate (smoothed, so a
+    constraint isn't written off after a few calls) divided by its declared
+    `cost` (see `ScopedConstraint`; `1.0` if there is none), and the checks
+    are re-sorted by score every `interval` checks. The order only depends on
+    the results of the constraints, never on time, so it is the same for
+    every run of the same model.
+    """
+
+    def __init__(self, constraints: Type_Constraints, interval: int = 8):
+        # [name, constraint, calls, discards, cost, original position]
+        self.checks = [
+            [name, cons, 0, 0, getattr(cons, "cost", 1.0), i]
+            for i, (name, cons) in enumerate(constraints.items())
+        ]
+        self.interval = interval
+        self._until_sort = interval
+
+    def order(self) -> List[str]:
+        return [check[0] for check in self.checks]
+
+    def meets(self, var: str, value, state: Type_VariableValues) -> bool:
+        discarded = False
+        for check in self.checks:
+            name, cons = check[0], check[1]
+            ret = cons(var=var, value=value, state=state)
+            check[2] += 1
+            if ret == ConstraintResult.DISCARD:
+                check[3] += 1
+                discarded = True
+                break
+            elif ret != ConstraintResult.KEEP:
+                raise ValueError(
+                    f"constraint '{name}' "
+                    "must return 'ConstraintResult.DISCARD' "
+                    "or 'ConstraintResult.KEEP' "
+                    f"but actually returned '{ret}'"
+                )
+
+        self._until_sort -= 1
+        if self._until_sort == 0:
+            self._until_sort = self.interval
+            self.checks.sort(
+                key=lambda check: (
+                    -(check[3] + 1) / (check[2] + 2) / check[4],
+                    check[5],
+                )
+            )
+
+        return not discarded
+
+
 def _grow_kombii_tree(
     possible_values: Type_PossibleValues,
     var_precedence: List[str],
     constraints: Type_Constraints,
+    stats: Optional[SearchStats] = None,
+    adaptive: bool = False,
 ) -> Node:
-    ROOT = Node(value=None, state={})
+    ROOT = Node(value=None, state=PartialState())
+
+    cons_index = _index_constraints(variables=var_precedence, constraints=constraints)
+
+    if stats is not None:
+        # The levels of an earlier run with more variables are not part of
+        # this one.
+        del stats.levels[len(var_precedence) :]
+
+    checks = None
 
     curr_queue = [ROOT]
     next_queue = []
 
-    for v in var_precedence:
+    for level, v in enumerate(var_precedence):
         for pv in possible_values[v]:
+            if adaptive:
+                # A value is checked against every node of the level in a row,
+                # and which constraint discards it depends on the value, so
+                # the order is learned for each value.
+                checks = _AdaptiveChecks(constraints=cons_index[v])
+
             for node in curr_queue:
-                skip = False
-                for name, cons in constraints.items():
-                    ret = cons(var=v, value=pv, state=node.state)
-                    if ret == ConstraintResult.DISCARD:
-                        skip = True
-                        break
-                    else:
-                        if ret != ConstraintResult.KEEP:
-                            raise ValueError(
-                                f"constraint '{name}' "
-                                "must return 'ConstraintResult.DISCARD' "
-                                "or 'ConstraintResult.KEEP' "
-                                f"but actually returned '{ret}'"
-                            )
-
-                if skip:
+                if checks is not None:
+                    if not checks.meets(var=v, value=pv, state=node.state):
+                        continue
+                elif not _meets_constraints(
+                    constraints=cons_index[v], var=v, value=pv, state=node.state
+                ):
                     continue
 
-                child_state = copy.deepcopy(node.state)
-                child_state.update({v: pv})
-                child = Node(value=pv, state=child_state)
+                child = Node(value=pv, state=node.state.assign(var=v, value=pv))
                 node.children.append(child)
                 next_queue.append(child)
 
+        if stats is not None:
+            stats.level(level=level, var=v).nodes += len(next_queue)
+
         curr_queue = next_queue
         next_queue = []
 
@@ -86,11 +831,14 @@ def _grow_kombii_tree(
 
 
 def _traverse_kombii_tree_recursive(
-    node: Node, results: List[Type_VariableValues], var_num: int
+    node: Node,
+    results: List[Type_VariableValues],
+    var_num: int,
+    stats: Optional[SearchStats] = None,
 ) -> None:
     if node.children:
         for child in node.children:
-            _traverse_kombii_tree_recursive(child, results, var_num)
+            _traverse_kombii_tree_recursive(child, results, var_num, stats)
     else:
         # This is a leaf node.
 
@@ -100,19 +848,25 @@ def _traverse_kombii_tree_recursive(
             # combinations of the variables, so we just return.
             return
 
-        if len(node.state.keys()) != var_num:
+        if len(node.state) != var_num:
             # If a leaf node doesn't include all the variables, that means
             # there are no valid test cases on this branch at all, and we
             # should skip this test case.
             # This could happen when the first few variables in the precedence
             # list can form a valid partial combination but the later variables
             # don't meet the constraints.
+            if stats is not None:
+                stats.levels[len(node.state)].discarded_leaves += 1
             return
 
-        results.append(node.state)
+        results.append(node.state.to_dict())
 
 
-def _traverse_kombii_tree(node: Node, var_num: int) -> List[Type_VariableValues]:
+def _traverse_kombii_tree(
+    node: Node,
+    var_num: int,
+    stats: Optional[SearchStats] = None,
+) -> List[Type_VariableValues]:
     if not isinstance(node, Node):
         raise TypeError(f"node must be 'Node' but is '{node.__class__.__name__}'")
 
@@ -120,22 +874,1104 @@ def _traverse_kombii_tree(node: Node, var_num: int) -> List[Type_VariableValues]
         raise ValueError(f"number of variables must be >= 0 (actual: {var_num})")
 
     results = []
-    _traverse_kombii_tree_recursive(node=node, results=results, var_num=var_num)
+    _traverse_kombii_tree_recursive(
+        node=node, results=results, var_num=var_num, stats=stats
+    )
 
     return results
 
 
+def auto_var_precedence(
+    possible_values: Type_PossibleValues,
+    constraints: Type_Constraints,
+) -> List[str]:
+    """Choose a variable precedence from the declared constraint scopes.
+
+    Every constraint must be a `ScopedConstraint` that declares its `reads`,
+    because a plain constraint function may depend on any variable having been
+    assigned before the ones it checks.
+
+    The variables that a constraint reads (but doesn't watch) are always put
+    before the variables it watches. Among the variables that can go next, the
+    most constrained one is chosen first:
+    1. The one that shares the most constraints with the variables already
+       placed, so those constraints can discard values as early as possible.
+    2. The one with the fewest possible values.
+    3. The one involved in the most constraints.
+    4. The one that comes first in `possible_values`.
+    """
+    for name, cons in constraints.items():
+        if not isinstance(cons, ScopedConstraint) or cons.reads is None:
+            raise ValueError(
+                f"constraint '{name}' must be a 'ScopedConstraint' that "
+                "declares its reads to choose the variable precedence automatically"
+            )
+
+    variables = list(possible_values.keys())
+    scopes = [cons.watches | cons.reads for cons in constraints.values()]
+
+    # The variables that must be placed before each variable.
+    before = {var: set() for var in variables}
+    for cons in constraints.values():
+        for w in cons.watches:
+            if w in before:
+                before[w] |= (cons.reads - cons.watches) & before.keys()
+
+    degree = {var: sum(var in scope for scope in scopes) for var in variables}
+
+    precedence = []
+    placed = set()
+    while len(precedence) < len(variables):
+        candidates = [
+            var for var in variables if var not in placed and before[var] <= placed
+        ]
+        if not candidates:
+            unplaced = [var for var in variables if var not in placed]
+            raise ValueError(
+                f"constraints read each other's variables in a cycle: {unplaced}"
+            )
+
+        def rank(var):
+            linked = sum(
+                1 for scope in scopes if var in scope and not scope.isdisjoint(placed)
+            )
+            return (
+                -linked,
+                len(possible_values[var]),
+                -degree[var],
+                variables.index(var),
+            )
+
+        var = min(candidates, key=rank)
+        precedence.append(var)
+        placed.add(var)
+
+    return precedence
+
+
+def _reorder_keys(values: Type_VariableValues, keys: Iterable[str]):
+    return {key: values[key] for key in keys}
+
+
 def conditional_combinatorial(
     possible_values: Type_PossibleValues,
-    var_precedence: List[str],
+    var_precedence: Optional[List[str]],
     constraints: Type_Constraints,
-) -> List[Type_VariableValues]:
+    forward_checking: bool = False,
+    workers: Optional[int] = None,
+    columnar: bool = False,
+    stats: Optional[SearchStats] = None,
+    adaptive: bool = False,
+    shard: Optional[Tuple[int, int]] = None,
+    order: Optional[str] = None,
+) -> Union[List[Type_VariableValues], ResultSet]:
+    """Generate all the combinations of `possible_values` that meet the
+    `constraints`. The variables are assigned in the order of
+    `var_precedence`; if it is `None`, the order is chosen by
+    `auto_var_precedence` and the keys of every result follow the order of
+    `possible_values`.
+
+    With `workers`, the search is split into subtrees by the values of the
+    first one or two variables in the precedence, and the subtrees are searched
+    by a pool of `workers` processes (see `_parallel_conditional_combinatorial`).
+
+    With `columnar`, the combinations are returned as a `ResultSet` that is
+    filled by the depth-first search, so neither the tree nor a `dict` per
+    combination is ever held in memory.
+
+    With `stats`, the calls of every constraint and the nodes and the
+    discarded leaves of every level of the tree are counted into the
+    `SearchStats`. The worker processes can't report their counters, so
+    `stats` can't be combined with `workers`.
+
+    With `adaptive`, the tree search checks the constraints of every variable
+    in the order that discards the most with the fewest (and cheapest) calls
+    so far (see `_AdaptiveChecks`). The results are the same. It only applies
+    to the tree search, so it can't be combined with `forward_checking`,
+    `workers`, `columnar` or `shard`.
+
+    With `shard=(k, n)`, only the `k`-th of `n` shards of the combinations is
+    searched: the subtrees under the first variables are split into `n`
+    contiguous runs of about the same size (see `_shard_prefixes`), so that
+    `n` CI nodes together generate every combination exactly once, and the
+    shards in the order of `k` are in the same order as the whole search. The
+    possible values of every variable must then be a sequence, like in
+    `full_combinatorial`.
+
+    With `order="min_change"`, the combinations are reordered so that
+    consecutive combinations differ in as few variables as possible (see
+    `kombii.ordering.min_change_order`). With `shard`, every shard is
+    reordered on its own.
+    """
+    _check_order(order)
+    if order is not None:
+        results = min_change_order(
+            conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=forward_checking,
+                workers=workers,
+                stats=stats,
+                adaptive=adaptive,
+                shard=shard,
+            )
+        )
+        if columnar:
+            return ResultSet.from_dicts(
+                rows=results,
+                variables=possible_values.keys()
+                if var_precedence is None
+                else var_precedence,
+            )
+        return results
+
+    if stats is not None:
+        if workers is not None:
+            raise ValueError("stats can't be collected with workers")
+        constraints = stats.instrument(constraints)
+
+    if adaptive and (
+        forward_checking or workers is not None or columnar or shard is not None
+    ):
+        raise ValueError(
+            "adaptive can't be combined with forward_checking, workers, columnar "
+            "or shard"
+        )
+
+    if shard is not None:
+        if workers is not None:
+            raise ValueError("shard can't be combined with workers")
+        _check_shard(shard=shard, possible_values=possible_values)
+
+        rows = _iter_shard(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            forward_checking=forward_checking,
+            shard=shard,
+        )
+        if columnar:
+            return ResultSet.from_dicts(
+                rows=rows,
+                variables=possible_values.keys()
+                if var_precedence is None
+                else var_precedence,
+            )
+        return list(rows)
+
+    if columnar:
+        if workers is None:
+            rows = iter_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=forward_checking,
+            )
+        else:
+            rows = _parallel_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=forward_checking,
+                workers=workers,
+            )
+
+        return ResultSet.from_dicts(
+            rows=rows,
+            variables=possible_values.keys()
+            if var_precedence is None
+            else var_precedence,
+        )
+
+    if workers is not None:
+        return _parallel_conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            forward_checking=forward_checking,
+            workers=workers,
+        )
+
+    if forward_checking:
+        # Forward checking prunes the dead branches during a depth-first
+        # search, so there is no tree to build.
+        return list(
+            iter_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=True,
+            )
+        )
+
+    auto_precedence = var_precedence is None
+    if auto_precedence:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
     root = _grow_kombii_tree(
         possible_values=possible_values,
         var_precedence=var_precedence,
         constraints=constraints,
+        stats=stats,
+        adaptive=adaptive,
     )
 
-    results = _traverse_kombii_tree(node=root, var_num=len(var_precedence))
+    results = _traverse_kombii_tree(node=root, var_num=len(var_precedence), stats=stats)
+
+    if auto_precedence:
+        results = [_reorder_keys(r, possible_values.keys()) for r in results]
+
+    return results
+
+
+def _check_picklable(
+    possible_values: Type_PossibleValues,
+    constraints: Type_Constraints,
+) -> None:
+    try:
+        pickle.dumps(possible_values)
+    except Exception as e:
+        raise ValueError(
+            f"possible values can't be sent to the worker processes: {e}"
+        ) from e
+
+    for name, cons in constraints.items():
+        try:
+            pickle.dumps(cons)
+        except Exception as e:
+            raise ValueError(
+                f"constraint '{name}' can't be sent to the worker processes "
+                f"because it can't be pickled (define it at the module level): {e}"
+            ) from e
+
+
+def _search_subtree(kwargs) -> List[Type_VariableValues]:
+    # Runs in a worker process.
+    return conditional_combinatorial(**kwargs)
+
+
+def _parallel_conditional_combinatorial(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+    forward_checking: bool,
+    workers: int,
+) -> List[Type_VariableValues]:
+    """Search the subtrees under the values of the first one or two variables
+    in `var_precedence` in `workers` processes.
+
+    Fixing the values of the first variables doesn't change what any
+    constraint is called with, and the subtrees are merged in the order of
+    those values, so the results are the same as the serial search, in the
+    same order. The constraints and the possible values are pickled to be sent
+    to the worker processes.
+    """
+    if workers <= 0:
+        raise ValueError(f"number of workers must be > 0 (actual: {workers})")
+
+    auto_precedence = var_precedence is None
+    if auto_precedence:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    if not var_precedence:
+        return []
+
+    _check_picklable(possible_values=possible_values, constraints=constraints)
+
+    # Split by the first variable, or by the first two variables if the first
+    # one doesn't have enough values to keep all the workers busy.
+    split_num = 1
+    if len(possible_values[var_precedence[0]]) < workers and len(var_precedence) > 1:
+        split_num = 2
+
+    split_vars = var_precedence[:split_num]
+    subtrees = []
+    for prefix in product(*[possible_values[var] for var in split_vars]):
+        subtree_values = dict(possible_values)
+        subtree_values.update({var: [pv] for var, pv in zip(split_vars, prefix)})
+        subtrees.append(
+            dict(
+                possible_values=subtree_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=forward_checking,
+            )
+        )
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for subtree_results in executor.map(_search_subtree, subtrees):
+            results.extend(subtree_results)
+
+    if auto_precedence:
+        results = [_reorder_keys(r, possible_values.keys()) for r in results]
 
     return results
+
+
+def _plan_forward_checking(
+    var_precedence: List[str],
+    cons_index: Dict[str, Type_Constraints],
+) -> Tuple[Dict[str, Type_Constraints], List[List[Tuple[int, Type_Constraints]]]]:
+    """Split the constraints of every variable into the ones that can be
+    checked ahead of time and the ones that must be checked when the variable
+    is assigned.
+
+    A constraint can be checked ahead of time for a variable if it is a
+    `ScopedConstraint` that only reads variables that precede the variable in
+    `var_precedence`: once the last of them is assigned, the constraint's
+    result for every value of the variable is already known.
+
+    Returns the remaining per-variable constraints and the look-ahead plan.
+    `lookahead[t + 1]` lists the `(level, constraints)` pairs to check right
+    after `var_precedence[t]` is assigned; `lookahead[0]` lists the ones that
+    don't read any variable and can be checked before the search starts.
+    """
+    position = {var: i for i, var in enumerate(var_precedence)}
+    var_num = len(var_precedence)
+
+    remaining = {}
+    lookahead = [[] for _ in range(var_num + 1)]
+
+    for level, var in enumerate(var_precedence):
+        remaining[var] = {}
+        ahead = {}
+        for name, cons in cons_index[var].items():
+            # A variable is never in the state when its own values are being
+            # checked, so reading it doesn't prevent checking ahead of time.
+            reads = (
+                None
+                if not isinstance(cons, ScopedConstraint) or cons.reads is None
+                else cons.reads - {var}
+            )
+            if reads is None or any(position.get(r, var_num) > level for r in reads):
+                remaining[var][name] = cons
+                continue
+
+            trigger = max((position[r] for r in reads), default=-1)
+            ahead.setdefault(trigger, {})[name] = cons
+
+        for trigger, constraints in ahead.items():
+            lookahead[trigger + 1].append((level, constraints))
+
+    return remaining, lookahead
+
+
+def _forward_check(
+    checks: List[Tuple[int, Type_Constraints]],
+    var_precedence: List[str],
+    domains: List[List],
+    state: Type_VariableValues,
+    pruned: List[Tuple[int, List]],
+) -> bool:
+    """Remove the values that violate `checks` from the domains of the later
+    variables. The replaced domains are recorded in `pruned` so they can be
+    restored with `_restore_domains`.
+
+    Returns `False` as soon as the domain of any variable becomes empty.
+    """
+    for level, constraints in checks:
+        var = var_precedence[level]
+        domain = domains[level]
+        new_domain = [
+            value
+            for value in domain
+            if _meets_constraints(
+                constraints=constraints, var=var, value=value, state=state
+            )
+        ]
+        if len(new_domain) != len(domain):
+            pruned.append((level, domain))
+            domains[level] = new_domain
+
+        if not new_domain:
+            return False
+
+    return True
+
+
+def _restore_domains(domains: List[List], pruned: List[Tuple[int, List]]) -> None:
+    for level, domain in reversed(pruned):
+        domains[level] = domain
+
+    pruned.clear()
+
+
+class _SearchPlan(object):
+    """The parts of the depth-first search that only depend on the variable
+    precedence and the constraints, so they are prepared once and reused by
+    every search over the same model.
+    """
+
+    def __init__(
+        self,
+        var_precedence: List[str],
+        constraints: Type_Constraints,
+        forward_checking: bool = False,
+    ):
+        self.var_precedence = var_precedence
+        self.cons_index = _index_constraints(
+            variables=var_precedence, constraints=constraints
+        )
+        self.lookahead = None
+        if forward_checking:
+            self.cons_index, self.lookahead = _plan_forward_checking(
+                var_precedence=var_precedence, cons_index=self.cons_index
+            )
+
+
+def _iter_search(
+    plan: _SearchPlan,
+    domains: List[List],
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Iterator[Type_VariableValues]:
+    """Search the values in `domains[i]` for `plan.var_precedence[i]`
+    depth-first and yield every valid combination as a new `dict`.
+
+    `should_stop` is called before every value is tried, and the search ends
+    as soon as it returns `True`, even in a part of the tree without any
+    valid combination.
+    """
+    var_precedence = plan.var_precedence
+    cons_index = plan.cons_index
+    lookahead = plan.lookahead
+
+    var_num = len(var_precedence)
+    if var_num == 0:
+        return
+
+    state = {}
+    # The constraints only get a read-only view of `state`.
+    state_view = MappingProxyType(state)
+
+    # The values of each variable that are still possible under the current
+    # values of the variables before it. They are only narrowed down by
+    # forward checking.
+    domains = list(domains)
+
+    if lookahead is not None and not _forward_check(
+        checks=lookahead[0],
+        var_precedence=var_precedence,
+        domains=domains,
+        state=state_view,
+        pruned=[],
+    ):
+        return
+
+    # `pending[i]` iterates the values of `var_precedence[i]` that have not
+    # been tried yet under the current values of the variables before it.
+    pending = [iter(domains[0])]
+    # `pruned[i]` records the domains that the current value of
+    # `var_precedence[i]` has narrowed down.
+    pruned = [[]]
+
+    while pending:
+        level = len(pending) - 1
+        var = var_precedence[level]
+
+        # The variable of the current level is re-assigned below, so it must
+        # not be visible to the constraints as if it were an earlier variable,
+        # and the domains must not be narrowed down by its previous value.
+        state.pop(var, None)
+        _restore_domains(domains=domains, pruned=pruned[level])
+
+        for value in pending[level]:
+            if should_stop is not None and should_stop():
+                return
+
+            if not _meets_constraints(
+                constraints=cons_index[var], var=var, value=value, state=state_view
+            ):
+                continue
+
+            if lookahead is None:
+                break
+
+            state[var] = value
+            if _forward_check(
+                checks=lookahead[level + 1],
+                var_precedence=var_precedence,
+                domains=domains,
+                state=state_view,
+                pruned=pruned[level],
+            ):
+                break
+
+            state.pop(var)
+            _restore_domains(domains=domains, pruned=pruned[level])
+        else:
+            # All the values of this level have been tried: backtrack.
+            pending.pop()
+            pruned.pop()
+            continue
+
+        state[var] = value
+
+        if level + 1 == var_num:
+            yield dict(state)
+        else:
+            pending.append(iter(domains[level + 1]))
+            pruned.append([])
+
+
+def iter_conditional_combinatorial(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+    forward_checking: bool = False,
+) -> Iterator[Type_VariableValues]:
+    """Generate the same test cases as `conditional_combinatorial`, in the same
+    order, but search the variables depth-first and yield every test case as
+    soon as its last variable is assigned.
+
+    Only the current path is kept in memory, so the peak memory grows with the
+    number of variables instead of the size of the whole tree.
+
+    With `forward_checking`, every assignment also removes the values of the
+    later variables that are already known to violate a `ScopedConstraint`
+    (see `_plan_forward_checking`), and the search backtracks as soon as a
+    later variable has no values left, instead of going down a branch that
+    can never be completed. The results are the same either way.
+    """
+    return _iter_conditional(
+        possible_values=possible_values,
+        var_precedence=var_precedence,
+        constraints=constraints,
+        forward_checking=forward_checking,
+    )
+
+
+def _iter_conditional(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+    forward_checking: bool,
+    should_stop: Optional[Callable[[], bool]] = None,
+) -> Iterator[Type_VariableValues]:
+    auto_precedence = var_precedence is None
+    if auto_precedence:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    plan = _SearchPlan(
+        var_precedence=var_precedence,
+        constraints=constraints,
+        forward_checking=forward_checking,
+    )
+    results = _iter_search(
+        plan=plan,
+        domains=[possible_values[var] for var in var_precedence],
+        should_stop=should_stop,
+    )
+
+    if auto_precedence:
+        for r in results:
+            yield _reorder_keys(r, possible_values.keys())
+    else:
+        yield from results
+
+
+async def aiter_conditional_combinatorial(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+    forward_checking: bool = False,
+    batch_size: int = 64,
+    maxsize: int = 16,
+) -> AsyncIterator[Type_VariableValues]:
+    """Generate the same test cases as `conditional_combinatorial`, in the same
+    order, for an `async for` loop.
+
+    The search of `iter_conditional_combinatorial` runs in a worker thread so
+    the event loop can dispatch every test case while the next ones are being
+    searched. The test cases are passed to the event loop in batches of
+    `batch_size` through a queue of at most `maxsize` batches; when the queue
+    is full, the search waits until the consumer catches up.
+
+    An exception raised by the search (e.g., by a constraint) is raised by the
+    `async for` loop. If the loop stops early, the search is stopped when the
+    generator is closed, e.g., with `contextlib.aclosing`.
+    """
+    if batch_size <= 0:
+        raise ValueError(f"batch size must be > 0 (actual: {batch_size})")
+    if maxsize <= 0:
+        raise ValueError(f"maxsize must be > 0 (actual: {maxsize})")
+
+    loop = asyncio.get_running_loop()
+    # Every item is a batch (a list of test cases), an exception raised by the
+    # search, or `None` at the end of the search.
+    queue = asyncio.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> None:
+        # Once the consumer is gone nobody empties the queue, so nothing more
+        # may be put into it.
+        if not stop.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def search() -> None:
+        try:
+            batch = []
+            # The search is stopped at every node, so closing the generator
+            # doesn't wait for a long stretch of the tree without any result.
+            for combination in _iter_conditional(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=forward_checking,
+                should_stop=stop.is_set,
+            ):
+                batch.append(combination)
+                if len(batch) == batch_size:
+                    put(batch)
+                    batch = []
+
+            if batch:
+                put(batch)
+        except Exception as e:
+            put(e)
+        else:
+            put(None)
+
+    producer = loop.run_in_executor(None, search)
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            for combination in item:
+                yield combination
+    finally:
+        stop.set()
+        # Make room for a batch that the search may be waiting to put.
+        while not queue.empty():
+            queue.get_nowait()
+        await producer
+
+
+def _live_reads(
+    var_precedence: List[str],
+    cons_index: Dict[str, Type_Constraints],
+) -> List[List[str]]:
+    """For every level of the search, find the variables assigned before it
+    that the constraints of this or any later level may still read.
+
+    The subtree under a partial combination only depends on the values of
+    these variables, so two partial combinations that agree on them have the
+    same subtree.
+    """
+    live = [None] * len(var_precedence)
+
+    needed = set()
+    unknown = False
+    for level in reversed(range(len(var_precedence))):
+        for cons in cons_index[var_precedence[level]].values():
+            if not isinstance(cons, ScopedConstraint) or cons.reads is None:
+                unknown = True
+            else:
+                needed |= cons.reads
+
+        prefix = var_precedence[:level]
+        live[level] = prefix if unknown else [var for var in prefix if var in needed]
+
+    return live
+
+
+class _SubtreeCounter(object):
+    """Count the valid combinations under partial combinations, memoized on
+    the part of the partial combination that the rest of the search can
+    still read (see `_live_reads`).
+    """
+
+    def __init__(
+        self,
+        possible_values: Type_PossibleValues,
+        var_precedence: List[str],
+        constraints: Type_Constraints,
+    ):
+        self.possible_values = possible_values
+        self.var_precedence = var_precedence
+        self.cons_index = _index_constraints(
+            variables=var_precedence, constraints=constraints
+        )
+        self.live = _live_reads(
+            var_precedence=var_precedence, cons_index=self.cons_index
+        )
+        self.memo = {}
+
+    def count(self, level: int, state: Type_VariableValues) -> int:
+        """Count the valid combinations of the variables from `level` on,
+        given the values of the variables before it in `state`.
+        """
+        if level == len(self.var_precedence):
+            return 1
+
+        key = (level, tuple(state[var] for var in self.live[level]))
+        try:
+            return self.memo[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # Some of the values are not hashable so the count can't be
+            # memoized.
+            key = None
+
+        var = self.var_precedence[level]
+        constraints = self.cons_index[var]
+        view = MappingProxyType(state)
+
+        total = 0
+        for value in self.possible_values[var]:
+            if _meets_constraints(
+                constraints=constraints, var=var, value=value, state=view
+            ):
+                state[var] = value
+                total += self.count(level=level + 1, state=state)
+                del state[var]
+
+        if key is not None:
+            self.memo[key] = total
+
+        return total
+
+    def sample(self, rnd: random.Random) -> Optional[Type_VariableValues]:
+        """Draw one valid combination uniformly at random, or return `None` if
+        there is none.
+
+        Every value is chosen with a probability proportional to the number of
+        valid combinations under it, so every combination is equally likely.
+        """
+        state = {}
+        for level, var in enumerate(self.var_precedence):
+            constraints = self.cons_index[var]
+            view = MappingProxyType(state)
+
+            branches = []
+            total = 0
+            for value in self.possible_values[var]:
+                if not _meets_constraints(
+                    constraints=constraints, var=var, value=value, state=view
+                ):
+                    continue
+
+                state[var] = value
+                count = self.count(level=level + 1, state=state)
+                del state[var]
+                if count:
+                    branches.append((value, count))
+                    total += count
+
+            if total == 0:
+                return None
+
+            # The counts can be much larger than a float can hold exactly.
+            pick = rnd.randrange(total)
+            for value, count in branches:
+                if pick < count:
+                    break
+                pick -= count
+
+            state[var] = value
+
+        return state
+
+
+def count_conditional_combinations(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+) -> int:
+    """Return the number of combinations that `conditional_combinatorial`
+    would generate, without generating them.
+
+    The counts of the subtrees are memoized on the values of the variables
+    that the constraints may still read, so the less the constraints read, the
+    more subtrees are counted only once. Only `ScopedConstraint`s with
+    declared reads can share counts; any other constraint makes every partial
+    combination distinct.
+    """
+    if var_precedence is None:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    if not var_precedence:
+        return 0
+
+    counter = _SubtreeCounter(
+        possible_values=possible_values,
+        var_precedence=var_precedence,
+        constraints=constraints,
+    )
+    return counter.count(level=0, state={})
+
+
+def sample_conditional_combinations(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+    n: int,
+    seed=None,
+) -> List[Type_VariableValues]:
+    """Draw `n` of the combinations that `conditional_combinatorial` would
+    generate, independently and uniformly at random (so the same combination
+    may be drawn more than once), without generating all of them.
+
+    The same `seed` always draws the same combinations. Every branch of the
+    search is chosen with the help of the subtree counts of
+    `count_conditional_combinations`, which are computed once and shared by
+    all the draws. Returns an empty list if there are no valid combinations.
+    """
+    if n < 0:
+        raise ValueError(f"n must be >= 0 (actual: {n})")
+
+    auto_precedence = var_precedence is None
+    if auto_precedence:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    if not var_precedence:
+        return []
+
+    counter = _SubtreeCounter(
+        possible_values=possible_values,
+        var_precedence=var_precedence,
+        constraints=constraints,
+    )
+    if n == 0 or counter.count(level=0, state={}) == 0:
+        return []
+
+    rnd = random.Random(seed)
+    samples = [counter.sample(rnd=rnd) for _ in range(n)]
+
+    if auto_precedence:
+        samples = [_reorder_keys(s, possible_values.keys()) for s in samples]
+
+    return samples
+
+
+def _estimate_subtree(
+    possible_values: Type_PossibleValues,
+    var_precedence: List[str],
+    cons_index: Dict[str, Type_Constraints],
+    level: int,
+    state: Type_VariableValues,
+    rnd: random.Random,
+    probes: int = 16,
+) -> float:
+    """Estimate the number of valid combinations of the variables from
+    `level` on, given the values of the variables before it in `state`.
+
+    Every probe goes down one random path and multiplies the numbers of valid
+    values it finds on the way (Knuth's estimator); the estimate is the
+    average of the probes.
+    """
+    total = 0
+    for _ in range(probes):
+        probe = dict(state)
+        view = MappingProxyType(probe)
+        estimate = 1
+        for var in var_precedence[level:]:
+            valid = [
+                value
+                for value in possible_values[var]
+                if _meets_constraints(
+                    constraints=cons_index[var], var=var, value=value, state=view
+                )
+            ]
+            if not valid:
+                estimate = 0
+                break
+            estimate *= len(valid)
+            probe[var] = rnd.choice(valid)
+        total += estimate
+
+    return total / probes
+
+
+def _assign_shards(sizes: List[float], shard_num: int) -> List[int]:
+    """Assign every subtree to a shard so that every shard gets a contiguous
+    run of subtrees of about `1 / shard_num` of the total size.
+
+    A subtree goes to the shard in which its midpoint falls, so the shards of
+    the subtrees never decrease. Without any size (e.g., every subtree is
+    empty), the subtrees are split by their number.
+    """
+    total = sum(sizes)
+    if total <= 0:
+        return [i * shard_num // len(sizes) for i in range(len(sizes))]
+
+    shards = []
+    start = 0
+    for size in sizes:
+        shards.append(min(int((start + size / 2) * shard_num / total), shard_num - 1))
+        start += size
+
+    return shards
+
+
+def _shard_prefixes(
+    possible_values: Type_PossibleValues,
+    var_precedence: List[str],
+    constraints: Type_Constraints,
+    shard: Tuple[int, int],
+    split_factor: int = 8,
+) -> Tuple[int, List[Tuple]]:
+    """Find the subtrees of the search that belong to the shard `(k, n)`.
+
+    The valid values of the first variables are enumerated a level at a time
+    until there are at least `split_factor * n` subtrees (or no variable is
+    left), and the subtrees are assigned to the shards by `_assign_shards` in
+    the order of the search. Every CI node computes the same assignment, so
+    the shards never overlap and never miss a subtree.
+
+    The size of every subtree is counted exactly when all the constraints
+    declare their reads, as the counts are then memoized (see
+    `_SubtreeCounter`); otherwise it is estimated by `_estimate_subtree` with
+    a fixed seed, so that the estimates are the same on every node.
+
+    Returns the number of variables of the prefixes and the prefixes (tuples
+    of values) of the shard's subtrees.
+    """
+    k, n = shard
+    cons_index = _index_constraints(variables=var_precedence, constraints=constraints)
+
+    depth = 0
+    prefixes = [()]
+    while len(prefixes) < split_factor * n and depth < len(var_precedence):
+        var = var_precedence[depth]
+        next_prefixes = []
+        for prefix in prefixes:
+            view = MappingProxyType(dict(zip(var_precedence, prefix)))
+            for value in possible_values[var]:
+                if _meets_constraints(
+                    constraints=cons_index[var], var=var, value=value, state=view
+                ):
+                    next_prefixes.append(prefix + (value,))
+        prefixes = next_prefixes
+        depth += 1
+
+    if not prefixes:
+        return depth, []
+
+    exact = all(
+        isinstance(cons, ScopedConstraint) and cons.reads is not None
+        for cons in constraints.values()
+    )
+    if exact:
+        counter = _SubtreeCounter(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        sizes = [
+            counter.count(level=depth, state=dict(zip(var_precedence, prefix)))
+            for prefix in prefixes
+        ]
+    else:
+        rnd = random.Random(0)
+        sizes = [
+            _estimate_subtree(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                cons_index=cons_index,
+                level=depth,
+                state=dict(zip(var_precedence, prefix)),
+                rnd=rnd,
+            )
+            for prefix in prefixes
+        ]
+
+    shards = _assign_shards(sizes=sizes, shard_num=n)
+    return depth, [prefix for prefix, s in zip(prefixes, shards) if s == k]
+
+
+def _iter_shard(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+    forward_checking: bool,
+    shard: Tuple[int, int],
+) -> Iterator[Type_VariableValues]:
+    """Search the subtrees of the shard `(k, n)` depth-first, in the order of
+    the whole search.
+    """
+    auto_precedence = var_precedence is None
+    if auto_precedence:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    if not var_precedence:
+        return
+
+    depth, prefixes = _shard_prefixes(
+        possible_values=possible_values,
+        var_precedence=var_precedence,
+        constraints=constraints,
+        shard=shard,
+    )
+
+    plan = _SearchPlan(
+        var_precedence=var_precedence,
+        constraints=constraints,
+        forward_checking=forward_checking,
+    )
+    rest = [possible_values[var] for var in var_precedence[depth:]]
+    for prefix in prefixes:
+        results = _iter_search(plan=plan, domains=[[value] for value in prefix] + rest)
+        if auto_precedence:
+            for r in results:
+                yield _reorder_keys(r, possible_values.keys())
+        else:
+            yield from results
+
+
+def decomposed_conditional_combinatorial(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+) -> ComponentProduct:
+    """Generate the same combinations as `conditional_combinatorial`, by
+    searching every independent group of variables (see
+    `_independent_components`) on its own and returning the lazy cartesian
+    product of their combinations.
+
+    The search takes the sum of the sizes of the groups' trees instead of
+    their product. The combinations are the same but, unless there is only
+    one group, their order is the order of the product (the last group
+    changes the fastest) instead of the order of the precedence.
+    """
+    auto_precedence = var_precedence is None
+    if auto_precedence:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    components = _independent_components(
+        var_precedence=var_precedence, constraints=constraints
+    )
+    results = [
+        conditional_combinatorial(
+            possible_values={var: possible_values[var] for var in variables},
+            var_precedence=variables,
+            constraints=component_constraints,
+        )
+        for variables, component_constraints in components
+    ]
+
+    return ComponentProduct(
+        components=[variables for variables, _ in components],
+        results=results,
+        keys=possible_values.keys() if auto_precedence else var_precedence,
+    )
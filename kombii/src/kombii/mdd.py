@@ -0,0 +1,292 @@
+"""Compile the valid combinations of a model into a reduced multi-valued
+decision diagram (MDD).
+
+The diagram has one layer of nodes per variable, in the order of the
+precedence, and a single terminal node after the last layer. Every edge of a
+node is labeled with a value of the layer's variable, and every path from the
+root to the terminal is a valid combination.
+
+The diagram is built layer by layer like `_grow_kombii_tree`, but the nodes of
+a layer are the partial combinations that differ in the variables that the
+constraints can still read (see `_live_reads`), instead of every partial
+combination, so identical subtrees are only built once. The diagram is then
+reduced from the bottom up: the nodes that can't reach the terminal are
+removed and the nodes of a layer with the same edges are merged.
+
+Only `ScopedConstraint`s that declare their `reads` let partial combinations
+share nodes; any other constraint may read every variable, so it keeps every
+partial combination apart like the tree does.
+"""
+
+import random
+
+from types import MappingProxyType
+from typing import Iterator, List, Optional, Tuple
+
+from kombii.kombii import (
+    _index_constraints,
+    _live_reads,
+    _meets_constraints,
+    _reorder_keys,
+    auto_var_precedence,
+)
+from ytestit_common.types import (
+    Type_Constraints,
+    Type_PossibleValues,
+    Type_VariableValues,
+)
+
+
+class MDD(object):
+    """A reduced multi-valued decision diagram of valid combinations.
+
+    `layers[i]` holds the nodes of `var_precedence[i]`; every node is a tuple
+    of `(value index, child)` edges, where the value index is the position of
+    the value in `values[i]` and the child is a node of the next layer. The
+    children of the last layer are the terminal node `0`. The root is node `0`
+    of the first layer; an empty diagram has no layers with nodes.
+    """
+
+    def __init__(
+        self,
+        var_precedence: List[str],
+        values: List[List],
+        layers: List[List[Tuple[Tuple[int, int], ...]]],
+        keys: Optional[List[str]] = None,
+    ):
+        self.var_precedence = var_precedence
+        self.values = values
+        self.layers = layers
+        self._keys = keys
+        self._counts = None
+
+    def __repr__(self) -> str:
+        return (
+            f"MDD(variables={self.var_precedence} nodes={self.node_count()} "
+            f"count={self.count()})"
+        )
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __bool__(self) -> bool:
+        return bool(self.layers) and bool(self.layers[0])
+
+    def node_count(self) -> int:
+        """Return the number of nodes, without the terminal node."""
+        return sum(len(layer) for layer in self.layers)
+
+    def edge_count(self) -> int:
+        return sum(len(node) for layer in self.layers for node in layer)
+
+    def _node_counts(self) -> List[List[int]]:
+        # `counts[i][n]` is the number of paths from node `n` of layer `i` to
+        # the terminal node.
+        if self._counts is None:
+            counts = [None] * len(self.layers)
+            below = [1]
+            for i in reversed(range(len(self.layers))):
+                below = [
+                    sum(below[child] for _, child in node) for node in self.layers[i]
+                ]
+                counts[i] = below
+            self._counts = counts
+
+        return self._counts
+
+    def count(self) -> int:
+        """Return the number of valid combinations."""
+        if not self:
+            return 0
+        return self._node_counts()[0][0]
+
+    def _output(self, codes: List[int]) -> Type_VariableValues:
+        combination = {
+            var: self.values[i][code]
+            for i, (var, code) in enumerate(zip(self.var_precedence, codes))
+        }
+        if self._keys is not None:
+            combination = _reorder_keys(combination, self._keys)
+        return combination
+
+    def __iter__(self) -> Iterator[Type_VariableValues]:
+        """Generate the valid combinations in the same order as
+        `conditional_combinatorial`.
+        """
+        if not self:
+            return
+
+        var_num = len(self.layers)
+        codes = [0] * var_num
+        # `pending[i]` iterates the edges of the current node of layer `i`
+        # that have not been followed yet.
+        pending = [iter(self.layers[0][0])]
+        while pending:
+            level = len(pending) - 1
+            edge = next(pending[level], None)
+            if edge is None:
+                pending.pop()
+                continue
+
+            code, child = edge
+            codes[level] = code
+            if level + 1 == var_num:
+                yield self._output(codes)
+            else:
+                pending.append(iter(self.layers[level + 1][child]))
+
+    def __contains__(self, combination) -> bool:
+        if not self or not isinstance(combination, dict):
+            return False
+        if combination.keys() != set(self.var_precedence):
+            return False
+
+        node = 0
+        for i, var in enumerate(self.var_precedence):
+            value = combination[var]
+            for code, child in self.layers[i][node]:
+                if self.values[i][code] == value:
+                    node = child
+                    break
+            else:
+                return False
+
+        return True
+
+    def sample(self, n: int, seed=None) -> List[Type_VariableValues]:
+        """Draw `n` valid combinations independently and uniformly at random.
+        The same `seed` always draws the same combinations.
+        """
+        if n < 0:
+            raise ValueError(f"n must be >= 0 (actual: {n})")
+        if not self:
+            return []
+
+        counts = self._node_counts()
+        rnd = random.Random(seed)
+
+        samples = []
+        for _ in range(n):
+            codes = []
+            node = 0
+            for i, layer in enumerate(self.layers):
+                below = counts[i + 1] if i + 1 < len(self.layers) else [1]
+                pick = rnd.randrange(counts[i][node])
+                for code, child in layer[node]:
+                    if pick < below[child]:
+                        break
+                    pick -= below[child]
+                codes.append(code)
+                node = child
+            samples.append(self._output(codes))
+
+        return samples
+
+
+def compile_mdd(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+) -> MDD:
+    """Compile the combinations that `conditional_combinatorial` would
+    generate into a reduced `MDD`.
+
+    If `var_precedence` is `None`, the order is chosen by
+    `auto_var_precedence` and the keys of every combination follow the order
+    of `possible_values`.
+    """
+    keys = None
+    if var_precedence is None:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+        keys = list(possible_values.keys())
+
+    var_precedence = list(var_precedence)
+    values = [list(possible_values[var]) for var in var_precedence]
+    if not var_precedence:
+        return MDD(var_precedence=[], values=[], layers=[], keys=keys)
+
+    cons_index = _index_constraints(variables=var_precedence, constraints=constraints)
+    live = _live_reads(var_precedence=var_precedence, cons_index=cons_index) + [[]]
+
+    # Build the diagram from the top down. The nodes of a layer are told apart
+    # by the value indexes of its live variables, and every node keeps the
+    # values of those variables to call the constraints with.
+    edges = []
+    nodes = [({}, {})]  # (values, value indexes) of the live variables
+    for level, var in enumerate(var_precedence):
+        constraints_of_var = cons_index[var]
+        next_live = live[level + 1]
+        next_index = {}
+        next_nodes = []
+        layer_edges = []
+
+        for state, codes in nodes:
+            view = MappingProxyType(state)
+            node_edges = []
+            for code, value in enumerate(values[level]):
+                if not _meets_constraints(
+                    constraints=constraints_of_var, var=var, value=value, state=view
+                ):
+                    continue
+
+                key = tuple(code if v == var else codes[v] for v in next_live)
+                child = next_index.get(key)
+                if child is None:
+                    child = len(next_nodes)
+                    next_index[key] = child
+                    next_nodes.append(
+                        (
+                            {v: value if v == var else state[v] for v in next_live},
+                            dict(zip(next_live, key)),
+                        )
+                    )
+                node_edges.append((code, child))
+
+            layer_edges.append(node_edges)
+
+        edges.append(layer_edges)
+        nodes = next_nodes
+
+    return MDD(
+        var_precedence=var_precedence,
+        values=values,
+        layers=_reduce(edges),
+        keys=keys,
+    )
+
+
+def _reduce(edges: List[List[List[Tuple[int, int]]]]) -> List[List[Tuple]]:
+    """Remove the nodes that can't reach the terminal node and merge the nodes
+    of a layer that have the same edges, from the bottom layer up.
+    """
+    layers = [None] * len(edges)
+
+    # The new ids of the nodes of the layer below; `None` for removed nodes.
+    # The last layer's children are all the terminal node.
+    below = None
+    for level in reversed(range(len(edges))):
+        unique = {}
+        new_ids = []
+        for node_edges in edges[level]:
+            reduced = tuple(
+                (code, child if below is None else below[child])
+                for code, child in node_edges
+                if below is None or below[child] is not None
+            )
+            if not reduced:
+                new_ids.append(None)
+                continue
+
+            new_ids.append(unique.setdefault(reduced, len(unique)))
+
+        layers[level] = list(unique.keys())
+        below = new_ids
+
+    if below[0] is None:
+        # The root can't reach the terminal node, so there are no valid
+        # combinations.
+        return [[] for _ in edges]
+
+    return layers
@@ -0,0 +1,277 @@
+"""A model whose valid combinations are updated incrementally.
+
+`KombiiModel` keeps the combinations that `conditional_combinatorial` would
+generate for its current `possible_values` and `constraints`, in the same
+order. When a value or a constraint is added or removed, only the
+combinations that the change can affect are searched or checked again:
+
+- A new value of a variable can only add the combinations that have it, so
+  only the subtree in which the variable has the new value is searched.
+- Removing a value removes the combinations that have it, without a search.
+- A new constraint can only remove combinations, so only the current
+  combinations are checked against it.
+- Removing a constraint can only add the combinations that it discarded, so
+  the search drops every branch that can no longer violate it.
+
+Every change returns a `ModelDelta` with the combinations it added and
+removed.
+"""
+
+from heapq import merge
+from types import MappingProxyType
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from kombii.kombii import (
+    _index_constraints,
+    _iter_search,
+    _meets_constraints,
+    _reorder_keys,
+    _SearchPlan,
+    auto_var_precedence,
+)
+from ytestit_common.results import ValueDictionary
+from ytestit_common.types import (
+    Type_ConstraintFunction,
+    Type_Constraints,
+    Type_PossibleValues,
+    Type_VariableValues,
+)
+
+
+class ModelDelta(object):
+    """The combinations that a change of a `KombiiModel` added and removed,
+    each in the order of the model's combinations.
+    """
+
+    def __init__(
+        self,
+        added: List[Type_VariableValues],
+        removed: List[Type_VariableValues],
+    ):
+        self.added = added
+        self.removed = removed
+
+    def __repr__(self) -> str:
+        return f"ModelDelta(added={len(self.added)} removed={len(self.removed)})"
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed)
+
+
+class KombiiModel(object):
+    """The valid combinations of `possible_values` under `constraints`,
+    updated incrementally when they change.
+
+    If `var_precedence` is `None`, it is chosen once by `auto_var_precedence`
+    and kept for every later change, and the keys of every combination
+    follow the order of `possible_values`, like in
+    `conditional_combinatorial`.
+    """
+
+    def __init__(
+        self,
+        possible_values: Type_PossibleValues,
+        var_precedence: Optional[List[str]],
+        constraints: Type_Constraints,
+    ):
+        self.possible_values = {
+            var: list(values) for var, values in possible_values.items()
+        }
+        self.constraints = dict(constraints)
+
+        self._keys = None
+        if var_precedence is None:
+            var_precedence = auto_var_precedence(
+                possible_values=self.possible_values, constraints=self.constraints
+            )
+            self._keys = list(self.possible_values.keys())
+        self.var_precedence = list(var_precedence)
+
+        self.results = list(self._search(domains=self._domains()))
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def __iter__(self) -> Iterator[Type_VariableValues]:
+        return iter(self.results)
+
+    def __repr__(self) -> str:
+        return (
+            f"KombiiModel(variables={self.var_precedence} "
+            f"constraints={list(self.constraints.keys())} len={len(self)})"
+        )
+
+    def add_value(self, var: str, value) -> ModelDelta:
+        """Add `value` after the possible values of `var`."""
+        self._check_var(var)
+        if value in self.possible_values[var]:
+            raise ValueError(f"'{var}' already has the value {value!r}")
+
+        self.possible_values[var].append(value)
+
+        domains = self._domains()
+        domains[self.var_precedence.index(var)] = [value]
+        added = list(self._search(domains=domains))
+
+        self.results = list(merge(self.results, added, key=self._sort_key()))
+        return ModelDelta(added=added, removed=[])
+
+    def remove_value(self, var: str, value) -> ModelDelta:
+        """Remove `value` from the possible values of `var`."""
+        self._check_var(var)
+        if value not in self.possible_values[var]:
+            raise ValueError(f"'{var}' doesn't have the value {value!r}")
+
+        self.possible_values[var].remove(value)
+
+        removed = [r for r in self.results if r[var] == value]
+        self.results = [r for r in self.results if r[var] != value]
+        return ModelDelta(added=[], removed=removed)
+
+    def add_constraint(self, name: str, cons: Type_ConstraintFunction) -> ModelDelta:
+        """Add the constraint `cons` as `name`."""
+        if name in self.constraints:
+            raise ValueError(f"constraint '{name}' already exists")
+
+        self.constraints[name] = cons
+
+        checks = _index_constraints(
+            variables=self.var_precedence, constraints={name: cons}
+        )
+        kept = []
+        removed = []
+        for r in self.results:
+            (kept if _meets_all(r, self.var_precedence, checks) else removed).append(r)
+
+        self.results = kept
+        return ModelDelta(added=[], removed=removed)
+
+    def remove_constraint(self, name: str) -> ModelDelta:
+        """Remove the constraint `name`."""
+        if name not in self.constraints:
+            raise ValueError(f"constraint '{name}' doesn't exist")
+
+        cons = self.constraints.pop(name)
+
+        added = list(self._search_discarded_by(name=name, cons=cons))
+        self.results = list(merge(self.results, added, key=self._sort_key()))
+        return ModelDelta(added=added, removed=[])
+
+    def replace_constraint(
+        self, name: str, cons: Type_ConstraintFunction
+    ) -> ModelDelta:
+        """Replace the constraint `name` with `cons`. A combination that both
+        constraints discard or both keep is not in the delta.
+        """
+        removal = self.remove_constraint(name=name)
+        addition = self.add_constraint(name=name, cons=cons)
+
+        # The combinations that the old constraint discarded and the new one
+        # discards again were never really added.
+        readded = {id(r) for r in removal.added}
+        return ModelDelta(
+            added=[r for r in self.results if id(r) in readded],
+            removed=[r for r in addition.removed if id(r) not in readded],
+        )
+
+    def _check_var(self, var: str) -> None:
+        if var not in self.possible_values:
+            raise ValueError(f"unknown variable: '{var}'")
+
+    def _domains(self) -> List[List]:
+        return [self.possible_values[var] for var in self.var_precedence]
+
+    def _sort_key(self) -> Callable[[Type_VariableValues], Tuple[int, ...]]:
+        """Return the key that orders the combinations by the positions of
+        their values in `possible_values`, in the order of the precedence.
+
+        The positions are numbered once per change, so a combination is not
+        looked up in the lists of possible values on every comparison.
+        """
+        dictionaries = [
+            (var, ValueDictionary(values=self.possible_values[var]))
+            for var in self.var_precedence
+        ]
+
+        def key(r: Type_VariableValues) -> Tuple[int, ...]:
+            return tuple(dictionary.encode(r[var]) for var, dictionary in dictionaries)
+
+        return key
+
+    def _output(self, r: Type_VariableValues) -> Type_VariableValues:
+        return r if self._keys is None else _reorder_keys(r, self._keys)
+
+    def _search(self, domains: List[List]) -> Iterator[Type_VariableValues]:
+        plan = _SearchPlan(
+            var_precedence=self.var_precedence, constraints=self.constraints
+        )
+        for r in _iter_search(plan=plan, domains=domains):
+            yield self._output(r)
+
+    def _search_discarded_by(
+        self, name: str, cons: Type_ConstraintFunction
+    ) -> Iterator[Type_VariableValues]:
+        """Search the combinations that meet the current constraints but not
+        `cons`.
+        """
+        var_precedence = self.var_precedence
+        cons_index = _index_constraints(
+            variables=var_precedence, constraints=self.constraints
+        )
+        checks = _index_constraints(variables=var_precedence, constraints={name: cons})
+
+        # After the last variable that `cons` is checked for, a combination
+        # that has met it so far can't be discarded by it any more.
+        last_check = max(
+            (level for level, var in enumerate(var_precedence) if checks[var]),
+            default=-1,
+        )
+
+        state = {}
+        view = MappingProxyType(state)
+
+        def search(level: int, discarded: bool):
+            if level == len(var_precedence):
+                if discarded:
+                    yield self._output(dict(state))
+                return
+
+            if not discarded and level > last_check:
+                return
+
+            var = var_precedence[level]
+            for value in self.possible_values[var]:
+                if not _meets_constraints(
+                    constraints=cons_index[var], var=var, value=value, state=view
+                ):
+                    continue
+
+                discarded_here = discarded or not _meets_constraints(
+                    constraints=checks[var], var=var, value=value, state=view
+                )
+                state[var] = value
+                yield from search(level=level + 1, discarded=discarded_here)
+                del state[var]
+
+        if var_precedence:
+            yield from search(level=0, discarded=False)
+
+
+def _meets_all(
+    r: Type_VariableValues,
+    var_precedence: List[str],
+    cons_index: Dict[str, Type_Constraints],
+) -> bool:
+    """Check the combination `r` against the constraints in `cons_index`,
+    every variable with the values of the variables before it.
+    """
+    state = {}
+    view = MappingProxyType(state)
+    for var in var_precedence:
+        if cons_index[var] and not _meets_constraints(
+            constraints=cons_index[var], var=var, value=r[var], state=view
+        ):
+            return False
+        state[var] = r[var]
+
+    return True
@@ -0,0 +1,264 @@
+"""Order combinations so that consecutive combinations differ in as few
+variables as possible (i.e., with a small Hamming distance between them), so
+that a test runner reconfigures as little as possible between test cases.
+
+A full combination is walked as a reflected mixed-radix Gray code, in which
+every two consecutive combinations differ in exactly one variable. Any other
+set of combinations is ordered by a greedy nearest-neighbor walk that moves to
+a combination that differs in one variable whenever there is one left, and
+the walk is then improved by 2-opt moves within a window around every step
+that changes more than one variable.
+"""
+
+from array import array
+from typing import Iterator, List, Sequence, Tuple
+
+from ytestit_common.results import ValueDictionary
+from ytestit_common.types import Type_PossibleValues, Type_VariableValues
+
+
+# The orders that `full_combinatorial` and `conditional_combinatorial` accept
+# besides `None`, which keeps the order of the search.
+_ORDERS = ["min_change"]
+
+
+def _check_order(order) -> None:
+    if order is not None and order not in _ORDERS:
+        raise ValueError(f"order must be None or one of {_ORDERS} (actual: {order!r})")
+
+
+def _gray_digits(radices: Sequence[int], index: int) -> List[int]:
+    """Return the digits of the `index`-th number of the reflected
+    mixed-radix Gray code with `radices` (the first digit is the most
+    significant). The numbers below every odd digit run backwards, so two
+    consecutive numbers differ in one digit by one.
+    """
+    block = 1
+    for radix in radices:
+        block *= radix
+
+    digits = []
+    for radix in radices:
+        block //= radix
+        digit, index = divmod(index, block)
+        if digit % 2:
+            index = block - 1 - index
+        digits.append(digit)
+
+    return digits
+
+
+def iter_gray_code(
+    possible_values: Type_PossibleValues,
+) -> Iterator[Type_VariableValues]:
+    """Generate the same combinations as `full_combinatorial`, in the order of
+    the reflected mixed-radix Gray code of the positions of the values, so
+    that every two consecutive combinations differ in exactly one variable.
+    """
+    variables = list(possible_values.keys())
+    values = [list(possible_values[var]) for var in variables]
+    if not variables:
+        return
+
+    radices = [len(var_values) for var_values in values]
+    size = 1
+    for radix in radices:
+        size *= radix
+
+    for index in range(size):
+        digits = _gray_digits(radices=radices, index=index)
+        yield {var: values[i][d] for i, (var, d) in enumerate(zip(variables, digits))}
+
+
+def _hamming(a: Tuple, b: Tuple) -> int:
+    return sum(x != y for x, y in zip(a, b))
+
+
+def _nearest_neighbor_walk(codes: List[Tuple], radices: List[int]) -> List[int]:
+    """Walk the combinations (given as tuples of value codes), starting with
+    the first one, always moving to a combination that differs from the
+    current one in a single variable if there is one left. Otherwise, move to
+    the closest of the next combinations in the original order that have not
+    been visited.
+
+    The combinations that differ only in variable `j` are found as the groups
+    of the combinations sorted by their codes without the `j`-th digit.
+    Returns the indexes of the combinations in the order of the walk.
+    """
+    count = len(codes)
+    var_num = len(radices)
+
+    # The combinations as mixed-radix numbers.
+    weights = [1] * var_num
+    for j in reversed(range(var_num - 1)):
+        weights[j] = weights[j + 1] * radices[j + 1]
+    numbers = [sum(c * w for c, w in zip(code, weights)) for code in codes]
+
+    # For every variable: the combinations sorted by their numbers without
+    # the variable's digit, the group of every combination in that order, and
+    # the start of every group, plus the number of unvisited combinations of
+    # every group.
+    members = []
+    groups = []
+    starts = []
+    unvisited = []
+    for j in range(var_num):
+        masked = [n - code[j] * weights[j] for n, code in zip(numbers, codes)]
+        order = sorted(range(count), key=masked.__getitem__)
+        group_of = array("I", bytes(4 * count))
+        group_starts = array("I")
+        previous = None
+        for position, i in enumerate(order):
+            if masked[i] != previous:
+                group_starts.append(position)
+                previous = masked[i]
+            group_of[i] = len(group_starts) - 1
+        group_starts.append(count)
+
+        members.append(array("I", order))
+        groups.append(group_of)
+        starts.append(group_starts)
+        unvisited.append(
+            array(
+                "I",
+                [
+                    group_starts[g + 1] - group_starts[g]
+                    for g in range(len(group_starts) - 1)
+                ],
+            )
+        )
+
+    visited = bytearray(count)
+    walk = []
+    # The first combination in the original order that may be unvisited.
+    scan = 0
+    current = 0
+    while True:
+        walk.append(current)
+        visited[current] = 1
+        for j in range(var_num):
+            unvisited[j][groups[j][current]] -= 1
+
+        if len(walk) == count:
+            break
+
+        following = None
+        for j in range(var_num):
+            g = groups[j][current]
+            if not unvisited[j][g]:
+                continue
+            for position in range(starts[j][g], starts[j][g + 1]):
+                i = members[j][position]
+                if not visited[i]:
+                    following = i
+                    break
+            break
+
+        if following is None:
+            # No combination differs in one variable: take the closest of the
+            # next few unvisited ones.
+            while visited[scan]:
+                scan += 1
+            best_distance = None
+            i = scan
+            seen = 0
+            while i < count and seen < 32:
+                if not visited[i]:
+                    distance = _hamming(codes[current], codes[i])
+                    if best_distance is None or distance < best_distance:
+                        following, best_distance = i, distance
+                    seen += 1
+                i += 1
+
+        current = following
+
+    return walk
+
+
+def _two_opt(codes: List[Tuple], walk: List[int], window: int, passes: int) -> None:
+    """Improve `walk` in place by reversing the part between two steps when
+    that lowers the total distance. Only the steps that change more than one
+    variable can be improved, so only the pairs of steps within `window` of
+    such a step are tried.
+    """
+    count = len(walk)
+    if count < 4:
+        return
+
+    distances = [_hamming(codes[walk[i]], codes[walk[i + 1]]) for i in range(count - 1)]
+
+    for _ in range(passes):
+        improved = False
+        for a in range(count - 1):
+            if distances[a] < 2:
+                continue
+
+            for b in range(max(0, a - window), min(count - 1, a + window + 1)):
+                i, j = min(a, b), max(a, b)
+                if j - i < 2:
+                    continue
+
+                # Reverse walk[i + 1 : j + 1], which replaces the steps
+                # (i, i + 1) and (j, j + 1) by (i, j) and (i + 1, j + 1).
+                first = _hamming(codes[walk[i]], codes[walk[j]])
+                second = _hamming(codes[walk[i + 1]], codes[walk[j + 1]])
+                if first + second >= distances[i] + distances[j]:
+                    continue
+
+                walk[i + 1 : j + 1] = walk[j:i:-1]
+                distances[i + 1 : j] = distances[j - 1 : i : -1]
+                distances[i] = first
+                distances[j] = second
+                improved = True
+                if distances[a] < 2:
+                    break
+
+        if not improved:
+            break
+
+
+def min_change_order(
+    combinations: Sequence[Type_VariableValues],
+    window: int = 32,
+    passes: int = 2,
+) -> List[Type_VariableValues]:
+    """Return `combinations` (which all have the same variables) in an order
+    in which consecutive combinations differ in few variables.
+
+    If the combinations are all the combinations of the values they contain,
+    they are walked as a Gray code (see `iter_gray_code`) and every two
+    consecutive combinations differ in one variable. Otherwise, they are
+    walked by `_nearest_neighbor_walk` and the walk is improved by
+    `_two_opt`. The order only depends on the combinations and their order,
+    so it is the same in every run.
+    """
+    if len(combinations) < 3:
+        return list(combinations)
+
+    variables = list(combinations[0].keys())
+    dictionaries = [ValueDictionary() for _ in variables]
+    codes = [
+        tuple(
+            dictionary.encode(combination[var])
+            for var, dictionary in zip(variables, dictionaries)
+        )
+        for combination in combinations
+    ]
+    radices = [len(dictionary) for dictionary in dictionaries]
+
+    size = 1
+    for radix in radices:
+        size *= radix
+    if size == len(codes) and len(set(codes)) == size:
+        return list(
+            iter_gray_code(
+                possible_values={
+                    var: dictionary.values
+                    for var, dictionary in zip(variables, dictionaries)
+                }
+            )
+        )
+
+    walk = _nearest_neighbor_walk(codes=codes, radices=radices)
+    _two_opt(codes=codes, walk=walk, window=window, passes=passes)
+    return [combinations[i] for i in walk]
@@ -0,0 +1,182 @@
+"""A pytest plugin that parametrizes tests with the test cases of a kombii
+model.
+
+Enable the plugin in a `conftest.py`:
+
+    pytest_plugins = ["kombii.pytest_plugin"]
+
+and mark the tests with the model:
+
+    @pytest.mark.kombii(
+        "case",
+        possible_values=POSSIBLE_VALUES,
+        var_precedence=VAR_PRECEDENCE,
+        constraints=CONSTRAINTS,
+    )
+    def test_route(case):
+        ...
+
+Every test case is passed to the test as a read-only `Row` view of a
+`ResultSet`, so no `dict` is built per test case during the collection. The
+`ResultSet` is stored in a `DiskCache` under pytest's cache directory, so the
+later collections only memory-map it until the model changes. Without
+`constraints`, the test cases are the full combination of `possible_values`.
+
+The ID of a test case is made of `var:value` for every variable, so the test
+cases can be selected with `-k`, e.g., `-k "v4_ip:Manual"`. `--kombii-select
+VAR=VALUE` selects the test cases before the test items are created, which is
+much cheaper for large models.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from kombii.disk_cache import DiskCache
+from kombii.kombii import conditional_combinatorial, full_combinatorial
+from ytestit_common.results import ResultSet
+
+
+def pytest_addoption(parser) -> None:
+    group = parser.getgroup("kombii")
+    group.addoption(
+        "--kombii-select",
+        action="append",
+        default=[],
+        metavar="VAR=VALUE",
+        help="only run the kombii test cases in which VAR has a value that "
+        "prints as VALUE (repeatable; the test cases must match all of them)",
+    )
+    group.addoption(
+        "--kombii-no-cache",
+        action="store_true",
+        default=False,
+        help="generate the kombii test cases without the disk cache",
+    )
+
+
+# The parsed `--kombii-select` options of a session.
+_SELECTIONS = pytest.StashKey[Dict[str, str]]()
+
+
+def pytest_configure(config) -> None:
+    config.stash[_SELECTIONS] = _parse_selections(config.getoption("kombii_select"))
+    config.addinivalue_line(
+        "markers",
+        "kombii(argname, possible_values, var_precedence=None, constraints=None, "
+        "version=None): parametrize the test with the test cases of a kombii "
+        "model, passed as the argument `argname`",
+    )
+
+
+def pytest_generate_tests(metafunc) -> None:
+    config = metafunc.config
+    selections = config.stash[_SELECTIONS]
+
+    cache = None
+    if not config.getoption("kombii_no_cache") and hasattr(config, "cache"):
+        cache = config.cache.mkdir("kombii")
+
+    for marker in metafunc.definition.iter_markers(name="kombii"):
+        argname, results = _results_of_marker(marker=marker, cache_dir=cache)
+        indexes = _select(results=results, selections=selections)
+        metafunc.parametrize(
+            argname,
+            [results[i] for i in indexes],
+            ids=_case_ids(results=results, indexes=indexes),
+        )
+
+
+def _results_of_marker(marker, cache_dir) -> Tuple[str, ResultSet]:
+    """Return the argument name and the test cases of a `kombii` marker."""
+    args = list(marker.args)
+    kwargs = dict(marker.kwargs)
+    argname = kwargs.pop("argname", None)
+    if argname is None:
+        if not args:
+            raise TypeError("the kombii marker needs the name of the argument")
+        argname = args.pop(0)
+    if args:
+        raise TypeError(
+            "the kombii marker only takes the name of the argument positionally"
+        )
+
+    possible_values = kwargs.pop("possible_values")
+    var_precedence = kwargs.pop("var_precedence", None)
+    constraints = kwargs.pop("constraints", None)
+    version = kwargs.pop("version", None)
+    if kwargs:
+        raise TypeError(f"unknown kombii marker arguments: {sorted(kwargs)}")
+
+    if cache_dir is not None:
+        cache = DiskCache(directory=str(cache_dir), version=version)
+        if constraints is None:
+            return argname, cache.full_combinatorial(possible_values=possible_values)
+        return argname, cache.conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+
+    if constraints is None:
+        return argname, full_combinatorial(
+            possible_values=possible_values, columnar=True
+        )
+    return argname, conditional_combinatorial(
+        possible_values=possible_values,
+        var_precedence=var_precedence,
+        constraints=constraints,
+        columnar=True,
+    )
+
+
+def _parse_selections(options: List[str]) -> Dict[str, str]:
+    selections = {}
+    for option in options:
+        var, sep, value = option.partition("=")
+        if not sep or not var:
+            raise pytest.UsageError(
+                f"--kombii-select must be VAR=VALUE (actual: {option!r})"
+            )
+        selections[var] = value
+    return selections
+
+
+def _select(
+    results: ResultSet,
+    selections: Optional[Dict[str, str]],
+) -> List[int]:
+    """Return the indexes of the test cases in which every selected variable
+    has a value whose `str` is the selected text. The selections of the
+    variables that are not in `results` are ignored.
+
+    The values are compared once per distinct value, and the test cases only
+    by their value codes.
+    """
+    indexes = range(len(results))
+    for var, text in (selections or {}).items():
+        if var not in results.dictionaries:
+            continue
+
+        codes = {
+            code
+            for code, value in enumerate(results.dictionaries[var].values)
+            if str(value) == text
+        }
+        column = results.columns[var]
+        indexes = [i for i in indexes if column[i] in codes]
+
+    return list(indexes)
+
+
+def _case_ids(results: ResultSet, indexes: List[int]) -> List[str]:
+    """Return the IDs of the test cases at `indexes`. Every value is turned
+    into a string once per distinct value.
+    """
+    columns = []
+    for var in results.variables:
+        labels = [f"{var}:{value}" for value in results.dictionaries[var].values]
+        column = results.columns[var]
+        columns.append([labels[column[i]] for i in indexes])
+
+    return ["-".join(labels) for labels in zip(*columns)]
@@ -0,0 +1,298 @@
+"""Table constraints: constraints given as the tuples of values that a few
+variables are allowed to have together, e.g., a product matrix.
+
+A `TableConstraint` is a `ScopedConstraint`, so it can be passed to
+`conditional_combinatorial` and the other search functions like any other
+constraint. When a variable of the table is assigned, the values of the table's
+variables that are already assigned must be the start of an allowed tuple,
+which is looked up in a hash set of the allowed tuples projected on those
+variables.
+
+`join_conditional_combinatorial` doesn't search the variables one by one but
+joins the tables with hash indexes instead, so every allowed tuple is only
+looked at once per join instead of once per node of the search tree.
+"""
+
+import csv
+import os
+
+from types import MappingProxyType
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+from kombii.kombii import (
+    ConstraintResult,
+    _index_constraints,
+    _meets_constraints,
+    _reorder_keys,
+    auto_var_precedence,
+)
+from ytestit_common.constraints import ScopedConstraint
+from ytestit_common.types import (
+    Type_Constraints,
+    Type_PossibleValues,
+    Type_VariableValues,
+)
+
+
+class TableConstraint(ScopedConstraint):
+    """Allow only the tuples of values in `allowed` for `variables`: the
+    `i`-th value of every tuple is a value of `variables[i]`.
+
+    The constraint watches and reads all the `variables`. The values must be
+    hashable.
+    """
+
+    def __init__(self, variables: Iterable[str], allowed: Iterable[Sequence]):
+        variables = list(variables)
+        if not variables:
+            raise ValueError("a table needs at least one variable")
+        if len(set(variables)) != len(variables):
+            raise ValueError(f"variables of a table must be unique: {variables}")
+
+        rows = set()
+        for row in allowed:
+            row = tuple(row)
+            if len(row) != len(variables):
+                raise ValueError(
+                    f"every allowed tuple must have {len(variables)} values "
+                    f"(actual: {row!r})"
+                )
+            rows.add(row)
+
+        self.variables = variables
+        self.allowed = frozenset(rows)
+        # The allowed tuples projected on the variables at some positions, by
+        # the positions.
+        self._projections = {}
+
+        super().__init__(func=self._check, watches=variables, reads=variables)
+
+    def __reduce__(self):
+        return (TableConstraint, (self.variables, self.allowed))
+
+    def __repr__(self) -> str:
+        return f"TableConstraint(variables={self.variables} rows={len(self.allowed)})"
+
+    def _projection(self, positions: Tuple[int, ...]) -> frozenset:
+        projection = self._projections.get(positions)
+        if projection is None:
+            projection = frozenset(
+                tuple(row[i] for i in positions) for row in self.allowed
+            )
+            self._projections[positions] = projection
+        return projection
+
+    def _check(self, var, value, state):
+        positions = []
+        values = []
+        for i, v in enumerate(self.variables):
+            if v == var:
+                positions.append(i)
+                values.append(value)
+            elif v in state:
+                positions.append(i)
+                values.append(state[v])
+
+        if tuple(values) in self._projection(tuple(positions)):
+            return ConstraintResult.KEEP
+        return ConstraintResult.DISCARD
+
+
+def read_table_csv(
+    path: Union[str, os.PathLike],
+    possible_values: Optional[Type_PossibleValues] = None,
+) -> TableConstraint:
+    """Read a `TableConstraint` from a CSV file whose header row lists the
+    variables and whose other rows are the allowed tuples. Blank rows are
+    skipped.
+
+    The cells are strings. With `possible_values`, every cell is replaced by
+    the possible value of its variable that prints the same (e.g., `True` for
+    "True" or `1` for "1").
+    """
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        variables = next(reader, None)
+        if variables is None:
+            raise ValueError(f"table has no header row: {path}")
+        variables = [var.strip() for var in variables]
+
+        by_text = None
+        if possible_values is not None:
+            by_text = []
+            for var in variables:
+                if var not in possible_values:
+                    raise ValueError(f"unknown variable in table {path}: '{var}'")
+                by_text.append({str(value): value for value in possible_values[var]})
+
+        rows = []
+        for line, row in enumerate(reader, start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) != len(variables):
+                raise ValueError(
+                    f"row {line} of {path} must have {len(variables)} values "
+                    f"(actual: {len(row)})"
+                )
+            if by_text is not None:
+                try:
+                    row = [values[cell] for values, cell in zip(by_text, row)]
+                except KeyError as e:
+                    raise ValueError(
+                        f"row {line} of {path} has a value that is not possible: "
+                        f"{e.args[0]!r}"
+                    ) from None
+            rows.append(row)
+
+    return TableConstraint(variables=variables, allowed=rows)
+
+
+def _join_order(
+    relations: List[Tuple[List[str], List[Tuple]]]
+) -> List[Tuple[List[str], List[Tuple]]]:
+    """Order the relations to join: the smallest first, and then the smallest
+    of the ones that share a variable with the joined ones, so every join is
+    filtered by a hash lookup instead of growing the results as a cartesian
+    product. A relation that shares no variable is only joined when there is
+    no other left.
+    """
+    remaining = list(relations)
+    ordered = []
+    joined = set()
+    while remaining:
+        best = min(
+            range(len(remaining)),
+            key=lambda i: (
+                not joined.intersection(remaining[i][0]),
+                len(remaining[i][1]),
+                i,
+            ),
+        )
+        relation = remaining.pop(best)
+        ordered.append(relation)
+        joined.update(relation[0])
+    return ordered
+
+
+def join_conditional_combinatorial(
+    possible_values: Type_PossibleValues,
+    var_precedence: Optional[List[str]],
+    constraints: Type_Constraints,
+) -> List[Type_VariableValues]:
+    """Generate the same combinations as `conditional_combinatorial`, in the
+    same order, by joining the `TableConstraint`s instead of searching.
+
+    The allowed tuples of every table are first restricted to the possible
+    values, and every variable without a table becomes a table of its possible
+    values. The tables are joined in the order of `_join_order`: the rows of
+    the joined tables are extended with the tuples of the next table that have
+    the same values of their shared variables, which are looked up in a hash
+    index of the next table.
+
+    Any other constraint is checked for a variable as soon as the variable and
+    the variables that the constraint may read are joined, so the rows that
+    it discards don't grow any further. The values of the variables must be
+    hashable.
+    """
+    auto_precedence = var_precedence is None
+    if auto_precedence:
+        var_precedence = auto_var_precedence(
+            possible_values=possible_values, constraints=constraints
+        )
+
+    if not var_precedence:
+        return []
+
+    positions = {
+        var: {value: i for i, value in enumerate(possible_values[var])}
+        for var in var_precedence
+    }
+
+    relations = []
+    covered = set()
+    others = {}
+    for name, cons in constraints.items():
+        if not isinstance(cons, TableConstraint):
+            others[name] = cons
+            continue
+
+        for var in cons.variables:
+            if var not in positions:
+                raise ValueError(f"unknown variable in table '{name}': '{var}'")
+        rows = [
+            row
+            for row in cons.allowed
+            if all(v in positions[var] for var, v in zip(cons.variables, row))
+        ]
+        relations.append((cons.variables, rows))
+        covered.update(cons.variables)
+
+    for var in var_precedence:
+        if var not in covered:
+            relations.append(([var], [(value,) for value in possible_values[var]]))
+
+    # The other constraints of every variable, with the variables that must be
+    # joined before they can be checked.
+    order = {var: i for i, var in enumerate(var_precedence)}
+    pending = []
+    cons_index = _index_constraints(variables=var_precedence, constraints=others)
+    for var, var_constraints in cons_index.items():
+        for name, cons in var_constraints.items():
+            earlier = var_precedence[: order[var]]
+            if isinstance(cons, ScopedConstraint) and cons.reads is not None:
+                earlier = [v for v in earlier if v in cons.reads]
+            pending.append((var, earlier, {name: cons}))
+
+    joined = []  # the variables of the rows, in the order they were joined
+    column = {}  # the position of every joined variable in the rows
+    rows = [()]
+    for variables, table_rows in _join_order(relations):
+        shared = [i for i, var in enumerate(variables) if var in column]
+        new = [i for i, var in enumerate(variables) if var not in column]
+
+        index = {}
+        for row in table_rows:
+            index.setdefault(tuple(row[i] for i in shared), []).append(
+                tuple(row[i] for i in new)
+            )
+        keys = [column[variables[i]] for i in shared]
+        rows = [
+            row + extension
+            for row in rows
+            for extension in index.get(tuple(row[k] for k in keys), ())
+        ]
+
+        for i in new:
+            column[variables[i]] = len(joined)
+            joined.append(variables[i])
+
+        # Check the other constraints that can be checked now.
+        still_pending = []
+        for var, reads, var_constraints in pending:
+            if var not in column or any(v not in column for v in reads):
+                still_pending.append((var, reads, var_constraints))
+                continue
+            rows = [
+                row
+                for row in rows
+                if _meets_constraints(
+                    constraints=var_constraints,
+                    var=var,
+                    value=row[column[var]],
+                    state=MappingProxyType({v: row[column[v]] for v in reads}),
+                )
+            ]
+        pending = still_pending
+
+    columns = [column[var] for var in var_precedence]
+    rows.sort(
+        key=lambda row: tuple(
+            positions[var][row[c]] for var, c in zip(var_precedence, columns)
+        )
+    )
+
+    results = [{var: row[c] for var, c in zip(var_precedence, columns)} for row in rows]
+    if auto_precedence:
+        results = [_reorder_keys(r, possible_values.keys()) for r in results]
+
+    return results
@@ -0,0 +1,250 @@
+"""A NumPy engine for `full_combinatorial` with declarative constraints.
+
+The full product is never materialized as Python objects. Every variable's
+values are numbered (the "value codes") and the product is generated chunk by
+chunk as a matrix of codes, one column per variable, in the same order as
+`itertools.product`. The constraints are evaluated as boolean masks over whole
+chunks and only the codes of the rows that are kept are stored.
+"""
+
+import numpy as np
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from ytestit_common.results import ResultSet, ValueDictionary
+from ytestit_common.types import Type_PossibleValues, Type_VariableValues
+
+
+# The types whose values NumPy stores as they are when all the values of an
+# array have the same one of them.
+_SCALAR_TYPES = (bool, int, float, complex, str, bytes)
+
+
+def _as_array(values: List[Any]) -> np.ndarray:
+    types = {type(value) for value in values}
+    if len(types) == 1:
+        (value_type,) = types
+        if value_type in _SCALAR_TYPES or issubclass(value_type, np.generic):
+            arr = np.asarray(values)
+            if arr.dtype != object:
+                return arr
+
+    # NumPy would coerce mixed types to a common one (e.g., `[1, "x"]` to
+    # strings or `[True, 2]` to integers), turn sequences (e.g., tuples) into
+    # more dimensions, and lose the types of subclasses (e.g., enums). Keep
+    # the values as Python objects.
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def _to_python(value):
+    # Turn the NumPy scalars back into the Python values they came from.
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class Columns(object):
+    """The columns of a chunk of combinations, as seen by a mask constraint.
+
+    `columns[var]` returns the values of `var` in every row of the chunk;
+    `columns.codes(var)` returns their value codes (i.e., the indexes into the
+    variable's possible values).
+    """
+
+    def __init__(
+        self,
+        variables: List[str],
+        values: List[np.ndarray],
+        codes: np.ndarray,
+    ):
+        self._position = {var: i for i, var in enumerate(variables)}
+        self._values = values
+        self._codes = codes
+
+    def __len__(self) -> int:
+        return self._codes.shape[0]
+
+    def __getitem__(self, var: str) -> np.ndarray:
+        i = self._position[var]
+        return self._values[i][self._codes[:, i]]
+
+    def codes(self, var: str) -> np.ndarray:
+        return self._codes[:, self._position[var]]
+
+
+Type_MaskConstraint = Callable[
+    # Constraint function input parameters
+    [Columns],
+    # Constraint function return type: a boolean array with one element per
+    # row. `True` keeps the row.
+    np.ndarray,
+]
+
+Type_MaskConstraints = Dict[
+    str,  # constraint name
+    Type_MaskConstraint,  # constraint function
+]
+
+
+def is_in(var: str, values: Iterable[Any]) -> Type_MaskConstraint:
+    """Keep the rows in which `var` has one of `values`."""
+    values = _as_array(list(values))
+
+    def mask(columns: Columns) -> np.ndarray:
+        return np.isin(columns[var], values)
+
+    return mask
+
+
+def not_in(var: str, values: Iterable[Any]) -> Type_MaskConstraint:
+    """Keep the rows in which `var` has none of `values`."""
+    cond = is_in(var, values)
+
+    def mask(columns: Columns) -> np.ndarray:
+        return ~cond(columns)
+
+    return mask
+
+
+def implies(
+    condition: Type_MaskConstraint,
+    consequence: Type_MaskConstraint,
+) -> Type_MaskConstraint:
+    """Keep the rows that meet `consequence` whenever they meet `condition`."""
+
+    def mask(columns: Columns) -> np.ndarray:
+        return ~condition(columns) | consequence(columns)
+
+    return mask
+
+
+class ColumnarResult(object):
+    """The combinations kept by `full_combinatorial_vectorized`.
+
+    Only the value codes are stored: `codes` is an integer matrix with one row
+    per combination and one column per variable, and `values[i]` holds the
+    possible values of `variables[i]`. A combination is only turned into a
+    `dict` when it is accessed.
+    """
+
+    def __init__(
+        self,
+        variables: List[str],
+        values: List[np.ndarray],
+        codes: np.ndarray,
+    ):
+        self.variables = variables
+        self.values = values
+        self.codes = codes
+
+    def __len__(self) -> int:
+        return self.codes.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ColumnarResult(
+                variables=self.variables,
+                values=self.values,
+                codes=self.codes[index],
+            )
+
+        row = self.codes[index]
+        return {
+            var: _to_python(self.values[i][row[i]])
+            for i, var in enumerate(self.variables)
+        }
+
+    def __iter__(self) -> Iterator[Type_VariableValues]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def column(self, var: str) -> np.ndarray:
+        """Return the values of `var` in all the combinations."""
+        i = self.variables.index(var)
+        return self.values[i][self.codes[:, i]]
+
+    def to_dicts(self) -> List[Type_VariableValues]:
+        return list(self)
+
+    def to_result_set(self) -> ResultSet:
+        """Copy the value codes into a `ResultSet`, which doesn't need NumPy."""
+        dictionaries = {
+            var: ValueDictionary(values=[_to_python(v) for v in self.values[i]])
+            for i, var in enumerate(self.variables)
+        }
+        results = ResultSet(variables=self.variables, dictionaries=dictionaries)
+        for i, var in enumerate(self.variables):
+            if len(dictionaries[var]) != len(self.values[i]):
+                # Duplicate values share one code in a `ValueDictionary`.
+                for code in self.codes[:, i]:
+                    results.append_code(
+                        var=var,
+                        code=dictionaries[var].encode(_to_python(self.values[i][code])),
+                    )
+                continue
+
+            column = results.columns[var]
+            column.frombytes(
+                self.codes[:, i].astype(np.dtype(column.typecode)).tobytes()
+            )
+
+        return results
+
+
+def full_combinatorial_vectorized(
+    possible_values: Type_PossibleValues,
+    constraints: Optional[Type_MaskConstraints] = None,
+    chunk_size: int = 1 << 20,
+) -> ColumnarResult:
+    """Generate the combinations of `possible_values` that meet all the mask
+    `constraints`, in the same order as `full_combinatorial`.
+
+    The product is generated and filtered `chunk_size` rows at a time, so the
+    peak memory is bounded by the chunk size plus the kept rows.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk size must be > 0 (actual: {chunk_size})")
+
+    constraints = constraints or {}
+
+    variables = list(possible_values.keys())
+    values = [_as_array(list(possible_values[var])) for var in variables]
+    dims = [len(v) for v in values]
+
+    code_type = np.min_scalar_type(max(dims, default=1))
+
+    if not variables or 0 in dims:
+        return ColumnarResult(
+            variables=variables,
+            values=values,
+            codes=np.empty((0, len(variables)), dtype=code_type),
+        )
+
+    # The last variable changes the fastest, like in `itertools.product`.
+    strides = [int(np.prod(dims[i + 1 :], dtype=np.int64)) for i in range(len(dims))]
+    total = strides[0] * dims[0]
+
+    kept = []
+    for start in range(0, total, chunk_size):
+        index = np.arange(start, min(start + chunk_size, total), dtype=np.int64)
+        codes = np.empty((len(index), len(variables)), dtype=code_type)
+        for i, (stride, dim) in enumerate(zip(strides, dims)):
+            codes[:, i] = (index // stride) % dim
+
+        columns = Columns(variables=variables, values=values, codes=codes)
+        mask = np.ones(len(index), dtype=bool)
+        for name, cons in constraints.items():
+            ret = np.asarray(cons(columns))
+            if ret.dtype != bool or ret.shape != mask.shape:
+                raise ValueError(
+                    f"constraint '{name}' must return a boolean array of shape "
+                    f"{mask.shape} but actually returned {ret.dtype} {ret.shape}"
+                )
+            mask &= ret
+
+        kept.append(codes[mask])
+
+    return ColumnarResult(
+        variables=variables,
+        values=values,
+        codes=np.concatenate(kept),
+    )
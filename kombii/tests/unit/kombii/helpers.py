@@ -0,0 +1,36 @@
+import random
+
+from kombii.kombii import ConstraintResult
+from ytestit_common.constraints import scoped
+
+
+def random_model(seed, var_num=6, value_num=3, cons_num=5):
+    """Generate a small model with random constraints that forbid some pairs
+    of values of two variables. Every constraint is a `ScopedConstraint`.
+    """
+    rnd = random.Random(seed)
+
+    possible_values = {f"v{i}": list(range(value_num)) for i in range(var_num)}
+    var_precedence = list(possible_values.keys())
+
+    def make_cons(watched, read, forbidden):
+        @scoped(watches=[watched], reads=[read])
+        def cons(var, value, state):
+            return (
+                ConstraintResult.DISCARD
+                if (state[read], value) in forbidden
+                else ConstraintResult.KEEP
+            )
+
+        return cons
+
+    constraints = {}
+    for c in range(cons_num):
+        read, watched = sorted(rnd.sample(var_precedence, 2))
+        forbidden = set(
+            (rnd.randrange(value_num), rnd.randrange(value_num))
+            for _ in range(value_num * 2)
+        )
+        constraints[f"c{c}"] = make_cons(watched, read, forbidden)
+
+    return possible_values, var_precedence, constraints
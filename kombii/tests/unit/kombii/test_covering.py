@@ -0,0 +1,250 @@
+import unittest
+
+from itertools import combinations
+from kombii.covering import _Completer, covering_array
+from kombii.kombii import ConstraintResult, conditional_combinatorial
+from ytestit_common.constraints import scoped
+
+
+def _tuples(cases, variables, strength):
+    """Return all the t-tuples that appear in `cases`."""
+    tuples = set()
+    for case in cases:
+        for var_set in combinations(variables, strength):
+            tuples.add(tuple((var, case[var]) for var in var_set))
+    return tuples
+
+
+@scoped(watches=["v2"], reads=["v1"])
+def _cons_v2(var, value, state):
+    # "v2" must be 0 when "v1" is 0.
+    return (
+        ConstraintResult.DISCARD
+        if state["v1"] == 0 and value != 0
+        else ConstraintResult.KEEP
+    )
+
+
+@scoped(watches=["v4"], reads=["v3"])
+def _cons_v4(var, value, state):
+    # "v4" must be different from "v3".
+    return ConstraintResult.DISCARD if value == state["v3"] else ConstraintResult.KEEP
+
+
+@scoped(watches=["v5"], reads=["v0", "v4"])
+def _cons_v5(var, value, state):
+    # A dead end: "v5" has no valid values when "v0" is 2 and "v4" is 2.
+    return (
+        ConstraintResult.DISCARD
+        if state["v0"] == 2 and state["v4"] == 2
+        else ConstraintResult.KEEP
+    )
+
+
+class Test_covering_array(unittest.TestCase):
+    def test_0_var(self):
+        self.assertListEqual(covering_array(possible_values={}), [])
+
+    def test_invalid_strength(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"strength must be > 0 \(actual: 0\)",
+            covering_array,
+            possible_values={"v1": [1]},
+            strength=0,
+        )
+
+    def test_exhaustive(self):
+        possible_values = {"v1": [1, 2], "v2": [3, 4]}
+        results = covering_array(possible_values=possible_values, strength=3)
+        self.assertCountEqual(
+            results,
+            [
+                {"v1": 1, "v2": 3},
+                {"v1": 1, "v2": 4},
+                {"v1": 2, "v2": 3},
+                {"v1": 2, "v2": 4},
+            ],
+        )
+
+    def test_pairwise_without_constraints(self):
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(10)}
+        variables = list(possible_values.keys())
+        results = covering_array(possible_values=possible_values, strength=2)
+
+        all_pairs = len(list(combinations(variables, 2))) * 9
+        self.assertEqual(len(_tuples(results, variables, 2)), all_pairs)
+
+        # Far fewer than the 3^10 test cases of the full combination.
+        self.assertLessEqual(len(results), 20)
+
+        for case in results:
+            self.assertListEqual(list(case.keys()), variables)
+
+    def test_with_constraints(self):
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(6)}
+        variables = list(possible_values.keys())
+        constraints = {"v2": _cons_v2, "v4": _cons_v4, "v5": _cons_v5}
+
+        valid = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=variables,
+            constraints=constraints,
+        )
+
+        for strength in (1, 2, 3):
+            results = covering_array(
+                possible_values=possible_values,
+                strength=strength,
+                constraints=constraints,
+                var_precedence=variables,
+            )
+
+            # Every test case is valid.
+            for case in results:
+                self.assertIn(case, valid)
+
+            # Every tuple that some valid test case has is covered.
+            self.assertSetEqual(
+                _tuples(results, variables, strength),
+                _tuples(valid, variables, strength),
+            )
+            self.assertLess(len(results), len(valid))
+
+    def test_auto_var_precedence(self):
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(6)}
+        constraints = {"v2": _cons_v2, "v4": _cons_v4, "v5": _cons_v5}
+        results = covering_array(
+            possible_values=possible_values,
+            strength=2,
+            constraints=constraints,
+        )
+        valid = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=list(possible_values.keys()),
+            constraints=constraints,
+        )
+        for case in results:
+            self.assertIn(case, valid)
+        self.assertSetEqual(
+            _tuples(results, list(possible_values.keys()), 2),
+            _tuples(valid, list(possible_values.keys()), 2),
+        )
+
+    def test_many_variables(self):
+        # Every variable must be different from the one before it, so all the
+        # variables are connected and the searches are long.
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(30)}
+        variables = list(possible_values.keys())
+
+        def make_cons(var, previous):
+            @scoped(watches=[var], reads=[previous])
+            def cons(var, value, state):
+                return (
+                    ConstraintResult.DISCARD
+                    if value == state[previous]
+                    else ConstraintResult.KEEP
+                )
+
+            return cons
+
+        constraints = {
+            var: make_cons(var, previous)
+            for previous, var in zip(variables, variables[1:])
+        }
+        results = covering_array(
+            possible_values=possible_values,
+            strength=2,
+            constraints=constraints,
+            var_precedence=variables,
+        )
+
+        for case in results:
+            for previous, var in zip(variables, variables[1:]):
+                self.assertNotEqual(case[previous], case[var])
+
+        expected = {
+            ((a, x), (b, y))
+            for i, a in enumerate(variables)
+            for j, b in enumerate(variables[i + 1 :], start=i + 1)
+            for x in range(3)
+            for y in range(3)
+            if j != i + 1 or x != y
+        }
+        self.assertSetEqual(_tuples(results, variables, 2), expected)
+
+    def test_no_valid_case(self):
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(20)}
+
+        @scoped(watches=["v19"], reads=["v0"])
+        def cons(var, value, state):
+            return ConstraintResult.DISCARD
+
+        results = covering_array(
+            possible_values=possible_values,
+            strength=3,
+            constraints={"cons": cons},
+        )
+        self.assertListEqual(results, [])
+
+    def test_strength_3_with_constraints(self):
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(6)}
+        variables = list(possible_values.keys())
+        constraints = {"v2": _cons_v2, "v4": _cons_v4, "v5": _cons_v5}
+        results = covering_array(
+            possible_values=possible_values,
+            strength=3,
+            constraints=constraints,
+            var_precedence=variables,
+        )
+        valid = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=variables,
+            constraints=constraints,
+        )
+        for case in results:
+            self.assertIn(case, valid)
+        self.assertSetEqual(
+            _tuples(results, variables, 3), _tuples(valid, variables, 3)
+        )
+
+    def test_plain_constraint(self):
+        possible_values = {f"v{i}": [0, 1] for i in range(5)}
+        variables = list(possible_values.keys())
+
+        def cons_not_all_1(var, value, state):
+            # A plain function may read any variable before `var`.
+            if var == "v4" and value == 1 and all(state.values()):
+                return ConstraintResult.DISCARD
+            return ConstraintResult.KEEP
+
+        constraints = {"not_all_1": cons_not_all_1}
+        results = covering_array(
+            possible_values=possible_values,
+            strength=2,
+            constraints=constraints,
+            var_precedence=variables,
+        )
+        valid = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=variables,
+            constraints=constraints,
+        )
+        for case in results:
+            self.assertIn(case, valid)
+        self.assertSetEqual(
+            _tuples(results, variables, 2), _tuples(valid, variables, 2)
+        )
+
+
+class Test_Completer(unittest.TestCase):
+    def test_encode_equal_values_of_different_types(self):
+        values = [1, True, 1.0, [1]]
+        completer = _Completer(values=[values], var_precedence=["v1"], constraints={})
+        self.assertListEqual(
+            [completer.encode(0, value) for value in values], [0, 1, 2, 3]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+import functools
+import os
+import tempfile
+import unittest
+
+from kombii.disk_cache import _MAGIC, DiskCache, _fingerprint, _load
+from kombii.kombii import (
+    ConstraintCache,
+    ConstraintResult,
+    conditional_combinatorial,
+    full_combinatorial,
+)
+from kombii.tables import TableConstraint
+from ytestit_common.constraints import scoped
+
+
+def _make_cons(forbidden):
+    @scoped(watches=["v2"], reads=["v1"])
+    def cons(var, value, state):
+        return (
+            ConstraintResult.DISCARD
+            if (state["v1"], value) == forbidden
+            else ConstraintResult.KEEP
+        )
+
+    return cons
+
+
+def _cons_v2_ne_v1(var, value, state):
+    if var == "v2" and value == state["v1"]:
+        return ConstraintResult.DISCARD
+    return ConstraintResult.KEEP
+
+
+def _cons_v2_eq_v1(var, value, state):
+    if var == "v2" and value != state["v1"]:
+        return ConstraintResult.DISCARD
+    return ConstraintResult.KEEP
+
+
+def _cons_v2_ne(var, value, state, forbidden):
+    if var == "v2" and value == forbidden:
+        return ConstraintResult.DISCARD
+    return ConstraintResult.KEEP
+
+
+class _Value(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class Test_DiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(directory=os.path.join(self.tmp.name, "cache"))
+        self.possible_values = {"v1": [0, 1, 2], "v2": [0, 1, 2], "v3": ["a", "b"]}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_full_combinatorial(self):
+        expected = full_combinatorial(possible_values=self.possible_values)
+        for _ in range(2):
+            results = self.cache.full_combinatorial(
+                possible_values=self.possible_values
+            )
+            self.assertListEqual(results.to_dicts(), expected)
+
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(results[-1].to_dict(), expected[-1])
+        self.assertListEqual(results[2:4].to_dicts(), expected[2:4])
+
+    def test_conditional_combinatorial(self):
+        kwargs = dict(
+            possible_values=self.possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints={"v2_ne_v1": _cons_v2_ne_v1},
+        )
+        expected = conditional_combinatorial(**kwargs)
+        for _ in range(2):
+            results = self.cache.conditional_combinatorial(**kwargs)
+            self.assertListEqual(results.to_dicts(), expected)
+
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # The execution options are not part of the key.
+        self.cache.conditional_combinatorial(forward_checking=True, **kwargs)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_empty_results(self):
+        results = self.cache.conditional_combinatorial(
+            possible_values=self.possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints={"none": lambda var, value, state: ConstraintResult.DISCARD},
+        )
+        self.assertEqual(len(results), 0)
+
+        results = self.cache.conditional_combinatorial(
+            possible_values=self.possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints={"none": lambda var, value, state: ConstraintResult.DISCARD},
+        )
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(len(results), 0)
+        self.assertListEqual(results.variables, ["v1", "v2", "v3"])
+
+    def test_invalidation(self):
+        kwargs = dict(
+            possible_values=self.possible_values,
+            var_precedence=["v1", "v2", "v3"],
+        )
+        self.cache.conditional_combinatorial(
+            constraints={"c": _cons_v2_ne_v1}, **kwargs
+        )
+
+        # A different function, closure variable, precedence or version is a
+        # different key.
+        results = self.cache.conditional_combinatorial(
+            constraints={"c": _cons_v2_eq_v1}, **kwargs
+        )
+        self.assertEqual(len(results), 3 * 2)
+
+        self.cache.conditional_combinatorial(
+            constraints={"c": _make_cons(forbidden=(0, 0))}, **kwargs
+        )
+        results = self.cache.conditional_combinatorial(
+            constraints={"c": _make_cons(forbidden=(0, 1))}, **kwargs
+        )
+        self.assertNotIn({"v1": 0, "v2": 1, "v3": "a"}, results.to_dicts())
+
+        versioned = DiskCache(directory=self.cache.directory, version="2")
+        versioned.conditional_combinatorial(constraints={"c": _cons_v2_ne_v1}, **kwargs)
+
+        self.assertEqual(self.cache.hits + versioned.hits, 0)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            _fingerprint({"c": _make_cons(forbidden=(0, 0))}),
+            _fingerprint({"c": _make_cons(forbidden=(0, 0))}),
+        )
+        self.assertNotEqual(
+            _fingerprint({"c": _make_cons(forbidden=(0, 0))}),
+            _fingerprint({"c": _make_cons(forbidden=(1, 0))}),
+        )
+
+        self.assertNotEqual(
+            _fingerprint({"t": TableConstraint(["v1", "v2"], [(0, 1)])}),
+            _fingerprint({"t": TableConstraint(["v1", "v2"], [(1, 0)])}),
+        )
+
+        # The statistics of a `ConstraintCache` don't change the key.
+        memoize = ConstraintCache().memoize
+        constraints = memoize({"c": _make_cons(forbidden=(0, 0))})
+        key = _fingerprint(constraints)
+        conditional_combinatorial(
+            possible_values=self.possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=constraints,
+        )
+        self.assertEqual(_fingerprint(constraints), key)
+
+    def test_fingerprint_partial(self):
+        self.assertEqual(
+            _fingerprint({"c": functools.partial(_cons_v2_ne, forbidden=1)}),
+            _fingerprint({"c": functools.partial(_cons_v2_ne, forbidden=1)}),
+        )
+        self.assertNotEqual(
+            _fingerprint({"c": functools.partial(_cons_v2_ne, forbidden=1)}),
+            _fingerprint({"c": functools.partial(_cons_v2_ne, forbidden=2)}),
+        )
+
+        kwargs = dict(
+            possible_values=self.possible_values, var_precedence=["v1", "v2", "v3"]
+        )
+        for _ in range(2):
+            self.cache.conditional_combinatorial(
+                constraints={"c": functools.partial(_cons_v2_ne, forbidden=1)},
+                **kwargs,
+            )
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_unstable_description(self):
+        # The default `repr` has the address of the object.
+        self.assertIsNone(_fingerprint({"v1": [_Value(1)]}))
+        self.assertIsNone(_fingerprint({"v1": [object()]}))
+
+        possible_values = {"v1": [_Value(1), _Value(2)], "v2": [0, 1]}
+        for _ in range(2):
+            results = self.cache.full_combinatorial(possible_values=possible_values)
+            self.assertEqual(len(results), 4)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.assertListEqual(os.listdir(self.cache.directory), [])
+
+    def test_fingerprint_set(self):
+        # 0 and 8 have the same slot in a small set, so the one that is added
+        # first is iterated first, and the results would follow that order.
+        a = set([8, 0])
+        b = set([0, 8])
+        self.assertEqual(a, b)
+        self.assertNotEqual(list(a), list(b))
+        self.assertNotEqual(_fingerprint({"v1": a}), _fingerprint({"v1": b}))
+        self.assertEqual(_fingerprint({"v1": a}), _fingerprint({"v1": set([8, 0])}))
+
+    def test_truncated_file(self):
+        self.cache.full_combinatorial(possible_values=self.possible_values)
+        (name,) = os.listdir(self.cache.directory)
+        path = os.path.join(self.cache.directory, name)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        # In the size of the header, in the header and in the columns.
+        for size in (len(_MAGIC) + 4, len(_MAGIC) + 16, len(data) - 1):
+            with open(path, "wb") as f:
+                f.write(data[:size])
+            self.assertIsNone(_load(path))
+
+            results = self.cache.full_combinatorial(
+                possible_values=self.possible_values
+            )
+            self.assertListEqual(
+                results.to_dicts(),
+                full_combinatorial(possible_values=self.possible_values),
+            )
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 4))
+
+    def test_clear(self):
+        self.cache.full_combinatorial(possible_values=self.possible_values)
+        self.cache.clear()
+        self.cache.full_combinatorial(possible_values=self.possible_values)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_unpicklable_values(self):
+        possible_values = {"v1": [lambda: 1, lambda: 2]}
+        results = self.cache.full_combinatorial(possible_values=possible_values)
+        self.assertEqual(len(results), 2)
+        self.assertListEqual(os.listdir(self.cache.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,44 @@
+import asyncio
+import contextlib
+import os
+import subprocess
+import sys
+import textwrap
+import time
 import unittest
 
+from functools import partial
 from kombii.kombii import (
     Node,
+    PartialState,
+    ConstraintCache,
+    SearchStats,
+    ProductSequence,
+    ComponentProduct,
     ConstraintResult,
     full_combinatorial,
+    _index_constraints,
+    _AdaptiveChecks,
+    _assign_shards,
+    _independent_components,
+    _plan_forward_checking,
+    _live_reads,
+    _SubtreeCounter,
     _grow_kombii_tree,
     _traverse_kombii_tree,
+    auto_var_precedence,
     conditional_combinatorial,
+    iter_conditional_combinatorial,
+    aiter_conditional_combinatorial,
+    count_conditional_combinations,
+    sample_conditional_combinations,
+    decomposed_conditional_combinatorial,
 )
 from unittest.mock import Mock, patch
+from ytestit_common.constraints import ScopedConstraint, scoped
+from ytestit_common.results import ResultSet
+
+from .helpers import random_model
 
 
 class TestImport(unittest.TestCase):
@@ -27,6 +57,211 @@ class TestNode(unittest.TestCase):
         self.assertDictEqual(n.state, {"a": 1, "b": 2})
 
 
+class TestPartialState(unittest.TestCase):
+    def test_empty(self):
+        s = PartialState()
+        self.assertEqual(len(s), 0)
+        self.assertDictEqual(s.to_dict(), {})
+        self.assertNotIn("v1", s)
+        self.assertRaises(KeyError, lambda: s["v1"])
+
+    def test_assign(self):
+        s0 = PartialState()
+        s1 = s0.assign(var="v1", value=1)
+        s2 = s1.assign(var="v2", value=2)
+
+        # Assigning a variable doesn't modify the state it extends.
+        self.assertEqual(len(s0), 0)
+        self.assertDictEqual(s1.to_dict(), {"v1": 1})
+
+        self.assertEqual(len(s2), 2)
+        self.assertEqual(s2["v1"], 1)
+        self.assertEqual(s2["v2"], 2)
+        self.assertEqual(s2.get("v3", 3), 3)
+        self.assertListEqual(list(s2), ["v1", "v2"])
+        self.assertListEqual(list(s2.items()), [("v1", 1), ("v2", 2)])
+        self.assertEqual(s2, {"v1": 1, "v2": 2})
+
+    def test_values_not_copied(self):
+        value = ["not", "copied"]
+        s = PartialState().assign(var="v1", value=value)
+        self.assertIs(s["v1"], value)
+        self.assertIs(s.to_dict()["v1"], value)
+
+
+class TestConstraintCache(unittest.TestCase):
+    def test_invalid_maxsize(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"maxsize must be > 0 \(actual: 0\)",
+            ConstraintCache,
+            maxsize=0,
+        )
+
+    def test_memoize(self):
+        calls = []
+
+        @scoped(watches=["v3"], reads=["v1"])
+        def cons_v3(var, value, state):
+            calls.append((value, state["v1"]))
+            return (
+                ConstraintResult.DISCARD
+                if value == state["v1"]
+                else ConstraintResult.KEEP
+            )
+
+        def cons_plain(var, value, state):
+            return ConstraintResult.KEEP
+
+        cache = ConstraintCache()
+        constraints = cache.memoize({"v3": cons_v3, "plain": cons_plain})
+
+        # The memoized constraint keeps its scope; the plain one is unchanged.
+        self.assertEqual(constraints["v3"].watches, cons_v3.watches)
+        self.assertEqual(constraints["v3"].reads, cons_v3.reads)
+        self.assertIs(constraints["plain"], cons_plain)
+
+        possible_values = {"v1": [1, 2], "v2": [1, 2, 3], "v3": [1, 2]}
+        results = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=constraints,
+        )
+        expected = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints={"v3": cons_v3, "plain": cons_plain},
+        )
+        self.assertListEqual(results, expected)
+
+        # "v2" is not read so its 3 values share the same results.
+        calls.clear()
+        conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=cache.memoize({"v3": cons_v3}),
+        )
+        self.assertListEqual(calls, [])
+        self.assertEqual(cache.misses, 4)
+        self.assertEqual(cache.hits, 8 + 12)
+        self.assertEqual(len(cache), 4)
+
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 0, 0))
+
+    def test_lru(self):
+        @scoped(watches=["v1"], reads=[])
+        def cons_v1(var, value, state):
+            return ConstraintResult.KEEP
+
+        cache = ConstraintCache(maxsize=2)
+        cons = cache.memoize({"v1": cons_v1})["v1"]
+        for value in [1, 2, 1, 3, 2]:
+            cons(var="v1", value=value, state={})
+
+        # 1 and 2 are cached; 1 is used again; 3 evicts 2; 2 evicts 1.
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 4, 2))
+
+    def test_unhashable(self):
+        @scoped(watches=["v1"], reads=[])
+        def cons_v1(var, value, state):
+            return ConstraintResult.KEEP
+
+        cache = ConstraintCache()
+        cons = cache.memoize({"v1": cons_v1})["v1"]
+        self.assertEqual(cons(var="v1", value=[1], state={}), ConstraintResult.KEEP)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 1, 0))
+
+    def test_partial(self):
+        def cons_v1(var, value, state):
+            return ConstraintResult.KEEP
+
+        cache = ConstraintCache()
+        cons = cache.memoize(
+            {"v1": ScopedConstraint(func=partial(cons_v1), watches=["v1"], reads=[])}
+        )["v1"]
+        for value in [1, 1]:
+            self.assertEqual(
+                cons(var="v1", value=value, state={}), ConstraintResult.KEEP
+            )
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (1, 1, 1))
+
+
+class TestProductSequence(unittest.TestCase):
+    POSSIBLE_VALUES = {
+        "v1": [True, False],
+        "v2": ["Auto", "Manual", "N/A"],
+        "v3": [[1], [2]],
+    }
+
+    def test_empty(self):
+        self.assertEqual(len(ProductSequence(possible_values={})), 0)
+        self.assertEqual(len(ProductSequence(possible_values={"v1": []})), 0)
+
+    def test_getitem(self):
+        expected = full_combinatorial(possible_values=self.POSSIBLE_VALUES)
+        seq = ProductSequence(possible_values=self.POSSIBLE_VALUES)
+        self.assertEqual(len(seq), 12)
+        self.assertListEqual([seq[i] for i in range(len(seq))], expected)
+        self.assertDictEqual(seq[-1], expected[-1])
+        self.assertRaises(IndexError, lambda: seq[12])
+
+    def test_slice(self):
+        expected = full_combinatorial(possible_values=self.POSSIBLE_VALUES)
+        seq = ProductSequence(possible_values=self.POSSIBLE_VALUES)
+
+        shard = seq[4:9]
+        self.assertIsInstance(shard, ProductSequence)
+        self.assertEqual(len(shard), 5)
+        self.assertListEqual(list(shard), expected[4:9])
+        self.assertListEqual(list(shard[::2]), expected[4:9:2])
+        self.assertListEqual(list(seq[::-3]), expected[::-3])
+
+    def test_index(self):
+        expected = full_combinatorial(possible_values=self.POSSIBLE_VALUES)
+        seq = ProductSequence(possible_values=self.POSSIBLE_VALUES)
+        for i, combination in enumerate(expected):
+            self.assertEqual(seq.index(combination), i)
+            self.assertEqual(seq.encode(combination), i)
+            self.assertIn(combination, seq)
+
+        shard = seq[4:9]
+        self.assertEqual(shard.index(expected[5]), 1)
+        self.assertNotIn(expected[3], shard)
+        self.assertRaisesRegex(
+            ValueError, "is not in the sequence", shard.index, expected[3]
+        )
+
+        self.assertNotIn({"v1": True, "v2": "Other", "v3": [1]}, seq)
+        self.assertRaisesRegex(
+            ValueError,
+            r"'Other' is not a possible value of 'v2'",
+            seq.encode,
+            {"v1": True, "v2": "Other", "v3": [1]},
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"\[3\] is not a possible value of 'v3'",
+            seq.encode,
+            {"v1": True, "v2": "Auto", "v3": [3]},
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"is not a combination of \['v1', 'v2', 'v3'\]",
+            seq.encode,
+            {"v1": True},
+        )
+
+    def test_huge(self):
+        seq = ProductSequence(possible_values={f"v{i}": range(10) for i in range(15)})
+        self.assertEqual(len(seq), 10**15)
+        combination = seq[123456789012345]
+        self.assertListEqual(
+            list(combination.values()), [int(d) for d in "123456789012345"]
+        )
+        self.assertEqual(seq.index(combination), 123456789012345)
+
+
 class Test_full_combinatorial(unittest.TestCase):
     def test_0_var(self):
         results = full_combinatorial(possible_values={})
@@ -44,6 +279,89 @@ class Test_full_combinatorial(unittest.TestCase):
         results = full_combinatorial(possible_values={"v1": [4], "v2": [5]})
         self.assertListEqual(results, [{"v1": 4, "v2": 5}])
 
+    def test_columnar_equal_values_of_different_types(self):
+        possible_values = {"a": [1, True, 1.0], "b": ["x"]}
+        expected = full_combinatorial(possible_values=possible_values)
+        for results in (
+            full_combinatorial(possible_values=possible_values, columnar=True),
+            conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=["a", "b"],
+                constraints={},
+                columnar=True,
+            ),
+        ):
+            dicts = results.to_dicts()
+            self.assertListEqual(dicts, expected)
+            self.assertListEqual([type(d["a"]) for d in dicts], [int, bool, float])
+
+    def test_columnar(self):
+        possible_values = {"v1": [6, 7, 6], "v2": [8, 9], "v3": [[1], [2]]}
+        results = full_combinatorial(possible_values=possible_values, columnar=True)
+        self.assertIsInstance(results, ResultSet)
+        self.assertListEqual(
+            results.to_dicts(), full_combinatorial(possible_values=possible_values)
+        )
+
+        results = full_combinatorial(possible_values={}, columnar=True)
+        self.assertListEqual(results.to_dicts(), [])
+
+    def test_lazy(self):
+        possible_values = {"v1": [6, 7], "v2": [8, 9, 10]}
+        results = full_combinatorial(possible_values=possible_values, lazy=True)
+        self.assertIsInstance(results, ProductSequence)
+        self.assertListEqual(
+            list(results), full_combinatorial(possible_values=possible_values)
+        )
+
+        self.assertRaisesRegex(
+            ValueError,
+            "combinations can't be both columnar and lazy",
+            full_combinatorial,
+            possible_values=possible_values,
+            columnar=True,
+            lazy=True,
+        )
+
+    def test_shard(self):
+        possible_values = {"v1": [6, 7, 8], "v2": [8, 9], "v3": ["a", "b", "c"]}
+        expected = full_combinatorial(possible_values=possible_values)
+
+        for n in (1, 4, 7, 30):
+            shards = [
+                full_combinatorial(possible_values=possible_values, shard=(k, n))
+                for k in range(n)
+            ]
+            self.assertListEqual([r for s in shards for r in s], expected)
+            self.assertLessEqual(max(map(len, shards)) - min(map(len, shards)), 1)
+
+        results = full_combinatorial(
+            possible_values=possible_values, lazy=True, shard=(1, 3)
+        )
+        self.assertIsInstance(results, ProductSequence)
+        self.assertListEqual(list(results), expected[6:12])
+
+        results = full_combinatorial(
+            possible_values=possible_values, columnar=True, shard=(2, 3)
+        )
+        self.assertIsInstance(results, ResultSet)
+        self.assertListEqual(results.to_dicts(), expected[12:])
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"shard must be >= 0 and < 3 \(actual: 3\)",
+            full_combinatorial,
+            possible_values=possible_values,
+            shard=(3, 3),
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"number of shards must be > 0 \(actual: 0\)",
+            full_combinatorial,
+            possible_values=possible_values,
+            shard=(0, 0),
+        )
+
     def test_2_vars_2_values(self):
         results = full_combinatorial(possible_values={"v1": [6, 7], "v2": [8, 9]})
         self.assertListEqual(
@@ -57,6 +375,59 @@ class Test_full_combinatorial(unittest.TestCase):
         )
 
 
+# The constraints of the parallel search must be picklable so they are
+# defined at the module level.
+
+
+@scoped(watches=["v2"], reads=["v1"])
+def _cons_v2_ne_v1(var, value, state):
+    return ConstraintResult.DISCARD if value == state["v1"] else ConstraintResult.KEEP
+
+
+def _cons_v3_gt_v2(var, value, state):
+    if var != "v3":
+        return ConstraintResult.KEEP
+    return ConstraintResult.KEEP if value > state["v2"] else ConstraintResult.DISCARD
+
+
+_PARALLEL_POSSIBLE_VALUES = {"v1": [0, 1, 2], "v2": [0, 1, 2], "v3": [0, 1, 2, 3]}
+_PARALLEL_CONSTRAINTS = {"v2_ne_v1": _cons_v2_ne_v1, "v3_gt_v2": _cons_v3_gt_v2}
+
+
+class Test_index_constraints(unittest.TestCase):
+    def test(self):
+        def cons_plain(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v2", "v3"], reads=["v1"])
+        def cons_v2_v3(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v3"])
+        def cons_v3(var, value, state):
+            return ConstraintResult.KEEP
+
+        constraints = {
+            "plain": cons_plain,
+            "v2_v3": cons_v2_v3,
+            "v3": cons_v3,
+        }
+        index = _index_constraints(
+            variables=["v1", "v2", "v3"], constraints=constraints
+        )
+        self.assertDictEqual(
+            index,
+            {
+                "v1": {"plain": cons_plain},
+                "v2": {"plain": cons_plain, "v2_v3": cons_v2_v3},
+                "v3": {"plain": cons_plain, "v2_v3": cons_v2_v3, "v3": cons_v3},
+            },
+        )
+
+        # The constraints are checked in the order they are given.
+        self.assertListEqual(list(index["v3"].keys()), ["plain", "v2_v3", "v3"])
+
+
 def _grow_kombii_tree_0_var_0_value_0_cons():
     possible_values = {}
     var_precedence = []
@@ -216,7 +587,7 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # `root` must not have any children.
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertListEqual(root.children, [])
 
     def test_1_var_1_value_0_cons(self):
@@ -230,13 +601,13 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # `root` must have exactly one child.
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertEqual(len(root.children), 1)
 
         # The only child.
         child = root.children[0]
         self.assertEqual(child.value, 1)
-        self.assertDictEqual(child.state, {"v1": 1})
+        self.assertDictEqual(child.state.to_dict(), {"v1": 1})
         self.assertListEqual(child.children, [])
 
     def test_1_var_2_values_0_cons(self):
@@ -250,19 +621,19 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # `root` must have exactly two children.
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertEqual(len(root.children), 2)
 
         # 1st child.
         c1 = root.children[0]
         self.assertEqual(c1.value, 2)
-        self.assertDictEqual(c1.state, {"v1": 2})
+        self.assertDictEqual(c1.state.to_dict(), {"v1": 2})
         self.assertListEqual(c1.children, [])
 
         # 2nd child.
         c2 = root.children[1]
         self.assertEqual(c2.value, 3)
-        self.assertDictEqual(c2.state, {"v1": 3})
+        self.assertDictEqual(c2.state.to_dict(), {"v1": 3})
         self.assertListEqual(c2.children, [])
 
     def test_2_vars_1_value_0_cons(self):
@@ -276,19 +647,19 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # `root` must have exactly one child.
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertEqual(len(root.children), 1)
 
         # root's only child.
         c1 = root.children[0]
         self.assertEqual(c1.value, 4)
-        self.assertDictEqual(c1.state, {"v1": 4})
+        self.assertDictEqual(c1.state.to_dict(), {"v1": 4})
         self.assertEqual(len(c1.children), 1)
 
         # root's only child's child.
         c2 = c1.children[0]
         self.assertEqual(c2.value, 5)
-        self.assertDictEqual(c2.state, {"v1": 4, "v2": 5})
+        self.assertDictEqual(c2.state.to_dict(), {"v1": 4, "v2": 5})
         self.assertListEqual(c2.children, [])
 
     def test_2_vars_2_values_0_cons_default_precedence(self):
@@ -303,43 +674,43 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # root has two children. Each child is one of "v1"'s possible values.
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertEqual(len(root.children), 2)
 
         # root's child 1, which has two children for "v2"'s possible values.
         c1 = root.children[0]
         self.assertEqual(c1.value, 6)
-        self.assertDictEqual(c1.state, {"v1": 6})
+        self.assertDictEqual(c1.state.to_dict(), {"v1": 6})
         self.assertEqual(len(c1.children), 2)
 
         # root's child 2, which has two children for "v2"'s possible values.
         c2 = root.children[1]
         self.assertEqual(c2.value, 7)
-        self.assertDictEqual(c2.state, {"v1": 7})
+        self.assertDictEqual(c2.state.to_dict(), {"v1": 7})
         self.assertEqual(len(c2.children), 2)
 
         # child 1's child 1.
         c1_1 = c1.children[0]
         self.assertEqual(c1_1.value, 8)
-        self.assertDictEqual(c1_1.state, {"v1": 6, "v2": 8})
+        self.assertDictEqual(c1_1.state.to_dict(), {"v1": 6, "v2": 8})
         self.assertListEqual(c1_1.children, [])
 
         # child 1's child 2.
         c1_2 = c1.children[1]
         self.assertEqual(c1_2.value, 9)
-        self.assertDictEqual(c1_2.state, {"v1": 6, "v2": 9})
+        self.assertDictEqual(c1_2.state.to_dict(), {"v1": 6, "v2": 9})
         self.assertListEqual(c1_2.children, [])
 
         # child 2's child 1.
         c2_1 = c2.children[0]
         self.assertEqual(c2_1.value, 8)
-        self.assertDictEqual(c2_1.state, {"v1": 7, "v2": 8})
+        self.assertDictEqual(c2_1.state.to_dict(), {"v1": 7, "v2": 8})
         self.assertListEqual(c2_1.children, [])
 
         # child 2's child 2.
         c2_2 = c2.children[1]
         self.assertEqual(c2_2.value, 9)
-        self.assertDictEqual(c2_2.state, {"v1": 7, "v2": 9})
+        self.assertDictEqual(c2_2.state.to_dict(), {"v1": 7, "v2": 9})
         self.assertListEqual(c2_2.children, [])
 
     def test_2_vars_2_values_0_cons_reverse_precedence(self):
@@ -354,43 +725,43 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # root has two children. Each child is one of "v2"'s possible values.
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertEqual(len(root.children), 2)
 
         # root's child 1, which has two children for "v1"'s possible values.
         c1 = root.children[0]
         self.assertEqual(c1.value, 8)
-        self.assertDictEqual(c1.state, {"v2": 8})
+        self.assertDictEqual(c1.state.to_dict(), {"v2": 8})
         self.assertEqual(len(c1.children), 2)
 
         # root's child 2, which has two children for "v1"'s possible values.
         c2 = root.children[1]
         self.assertEqual(c2.value, 9)
-        self.assertDictEqual(c2.state, {"v2": 9})
+        self.assertDictEqual(c2.state.to_dict(), {"v2": 9})
         self.assertEqual(len(c2.children), 2)
 
         # child 1's child 1.
         c1_1 = c1.children[0]
         self.assertEqual(c1_1.value, 6)
-        self.assertDictEqual(c1_1.state, {"v1": 6, "v2": 8})
+        self.assertDictEqual(c1_1.state.to_dict(), {"v1": 6, "v2": 8})
         self.assertListEqual(c1_1.children, [])
 
         # child 1's child 2.
         c1_2 = c1.children[1]
         self.assertEqual(c1_2.value, 7)
-        self.assertDictEqual(c1_2.state, {"v1": 7, "v2": 8})
+        self.assertDictEqual(c1_2.state.to_dict(), {"v1": 7, "v2": 8})
         self.assertListEqual(c1_2.children, [])
 
         # child 2's child 1.
         c2_1 = c2.children[0]
         self.assertEqual(c2_1.value, 6)
-        self.assertDictEqual(c2_1.state, {"v1": 6, "v2": 9})
+        self.assertDictEqual(c2_1.state.to_dict(), {"v1": 6, "v2": 9})
         self.assertListEqual(c2_1.children, [])
 
         # child 2's child 2.
         c2_2 = c2.children[1]
         self.assertEqual(c2_2.value, 7)
-        self.assertDictEqual(c2_2.state, {"v1": 7, "v2": 9})
+        self.assertDictEqual(c2_2.state.to_dict(), {"v1": 7, "v2": 9})
         self.assertListEqual(c2_2.children, [])
 
     def test_2_vars_1_cons_partial_branch(self):
@@ -404,25 +775,25 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # root has two children for "v1".
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertEqual(len(root.children), 2)
 
         # root's child 1.
         c1 = root.children[0]
         self.assertEqual(c1.value, 10)
-        self.assertDictEqual(c1.state, {"v1": 10})
+        self.assertDictEqual(c1.state.to_dict(), {"v1": 10})
         self.assertEqual(len(c1.children), 1)
 
         # root's child 2 is a partial branch so it doesn't have any children.
         c2 = root.children[1]
         self.assertEqual(c2.value, 100)
-        self.assertDictEqual(c2.state, {"v1": 100})
+        self.assertDictEqual(c2.state.to_dict(), {"v1": 100})
         self.assertListEqual(c2.children, [])
 
         # root's child 1's only child.
         c1_1 = c1.children[0]
         self.assertEqual(c1_1.value, 12)
-        self.assertDictEqual(c1_1.state, {"v1": 10, "v2": 12})
+        self.assertDictEqual(c1_1.state.to_dict(), {"v1": 10, "v2": 12})
         self.assertListEqual(c1_1.children, [])
 
     def test_2_vars_3_values_2_cons(self):
@@ -437,27 +808,50 @@ class Test_grow_kombii_tree(unittest.TestCase):
 
         # root has exactly one child for "v2".
         self.assertIsNone(root.value)
-        self.assertDictEqual(root.state, {})
+        self.assertDictEqual(root.state.to_dict(), {})
         self.assertEqual(len(root.children), 1)
 
         # root's only child.
         c1 = root.children[0]
         self.assertEqual(c1.value, 12)
-        self.assertDictEqual(c1.state, {"v2": 12})
+        self.assertDictEqual(c1.state.to_dict(), {"v2": 12})
         self.assertEqual(len(c1.children), 2)
 
         # root's child's child 1.
         c1_1 = c1.children[0]
         self.assertEqual(c1_1.value, 10)
-        self.assertDictEqual(c1_1.state, {"v1": 10, "v2": 12})
+        self.assertDictEqual(c1_1.state.to_dict(), {"v1": 10, "v2": 12})
         self.assertListEqual(c1_1.children, [])
 
         # root's child's child 2.
         c1_2 = c1.children[1]
         self.assertEqual(c1_2.value, 11)
-        self.assertDictEqual(c1_2.state, {"v1": 11, "v2": 12})
+        self.assertDictEqual(c1_2.state.to_dict(), {"v1": 11, "v2": 12})
         self.assertListEqual(c1_2.children, [])
 
+    def test_scoped_constraint(self):
+        calls = []
+
+        @scoped(watches=["v2"], reads=["v1"])
+        def cons_v2_ne_v1(var, value, state):
+            calls.append(var)
+            return (
+                ConstraintResult.DISCARD
+                if value == state["v1"]
+                else ConstraintResult.KEEP
+            )
+
+        root = _grow_kombii_tree(
+            possible_values={"v1": [1, 2], "v2": [1, 2]},
+            var_precedence=["v1", "v2"],
+            constraints={"v2_ne_v1": cons_v2_ne_v1},
+        )
+        results = _traverse_kombii_tree(node=root, var_num=2)
+        self.assertListEqual(results, [{"v1": 1, "v2": 2}, {"v1": 2, "v2": 1}])
+
+        # The constraint is never called for the variable it doesn't watch.
+        self.assertListEqual(calls, ["v2"] * 4)
+
     def test_invalid_constraint(self):
         possible_values = {
             "v1": [20, 21],
@@ -561,6 +955,138 @@ class Test_traverse_kombii_tree(unittest.TestCase):
         )
 
 
+class Test_plan_forward_checking(unittest.TestCase):
+    def test(self):
+        def cons_plain(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v2", "v3"], reads=["v1"])
+        def cons_v1(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v2", "v3"], reads=["v2", "v3"])
+        def cons_v2_v3(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v1"], reads=["v3"])
+        def cons_later(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v1"])
+        def cons_unknown_reads(var, value, state):
+            return ConstraintResult.KEEP
+
+        var_precedence = ["v1", "v2", "v3"]
+        cons_index = _index_constraints(
+            variables=var_precedence,
+            constraints={
+                "plain": cons_plain,
+                "v1": cons_v1,
+                "v2_v3": cons_v2_v3,
+                "later": cons_later,
+                "unknown_reads": cons_unknown_reads,
+            },
+        )
+        remaining, lookahead = _plan_forward_checking(
+            var_precedence=var_precedence, cons_index=cons_index
+        )
+
+        self.assertDictEqual(
+            remaining,
+            {
+                "v1": {
+                    "plain": cons_plain,
+                    "later": cons_later,
+                    "unknown_reads": cons_unknown_reads,
+                },
+                # "v3" hasn't been assigned when "v2" is checked.
+                "v2": {"plain": cons_plain, "v2_v3": cons_v2_v3},
+                "v3": {"plain": cons_plain},
+            },
+        )
+        self.assertListEqual(
+            lookahead,
+            [
+                # Nothing can be checked before the search starts.
+                [],
+                # After "v1" is assigned.
+                [(1, {"v1": cons_v1}), (2, {"v1": cons_v1})],
+                # After "v2" is assigned.
+                [(2, {"v2_v3": cons_v2_v3})],
+                # After "v3" is assigned.
+                [],
+            ],
+        )
+
+
+class Test_auto_var_precedence(unittest.TestCase):
+    def test_reads_before_watches(self):
+        @scoped(watches=["v1"], reads=["v3"])
+        def cons_v1(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v3"], reads=["v2"])
+        def cons_v3(var, value, state):
+            return ConstraintResult.KEEP
+
+        precedence = auto_var_precedence(
+            possible_values={"v1": [1], "v2": [1, 2], "v3": [1, 2, 3]},
+            constraints={"v1": cons_v1, "v3": cons_v3},
+        )
+        self.assertListEqual(precedence, ["v2", "v3", "v1"])
+
+    def test_most_constrained_first(self):
+        @scoped(watches=["v2", "v4"], reads=["v2", "v4"])
+        def cons_v2_v4(var, value, state):
+            return ConstraintResult.KEEP
+
+        precedence = auto_var_precedence(
+            possible_values={
+                "v1": [1, 2, 3],
+                "v2": [1, 2],
+                "v3": [1],
+                "v4": [1, 2, 3],
+            },
+            constraints={"v2_v4": cons_v2_v4},
+        )
+        # "v3" has the fewest values; "v2" has fewer values than "v4", which
+        # is then linked to "v2" by the constraint.
+        self.assertListEqual(precedence, ["v3", "v2", "v4", "v1"])
+
+    def test_no_constraints(self):
+        precedence = auto_var_precedence(
+            possible_values={"v1": [1, 2], "v2": [1, 2]},
+            constraints={},
+        )
+        self.assertListEqual(precedence, ["v1", "v2"])
+
+    def test_plain_constraint(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraint 'plain' must be a 'ScopedConstraint' that declares its reads",
+            auto_var_precedence,
+            possible_values={"v1": [1]},
+            constraints={"plain": lambda var, value, state: ConstraintResult.KEEP},
+        )
+
+    def test_cycle(self):
+        @scoped(watches=["v1"], reads=["v2"])
+        def cons_v1(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v2"], reads=["v1"])
+        def cons_v2(var, value, state):
+            return ConstraintResult.KEEP
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraints read each other's variables in a cycle: \['v1', 'v2'\]",
+            auto_var_precedence,
+            possible_values={"v1": [1], "v2": [1]},
+            constraints={"v1": cons_v1, "v2": cons_v2},
+        )
+
+
 class Test_conditional_combinatorial(unittest.TestCase):
     @patch(target="kombii.kombii._grow_kombii_tree")
     @patch(target="kombii.kombii._traverse_kombii_tree")
@@ -575,12 +1101,1115 @@ class Test_conditional_combinatorial(unittest.TestCase):
             possible_values={},
             var_precedence=[],
             constraints={},
+            stats=None,
+            adaptive=False,
         )
 
         mock_traverse_kombii_tree.assert_called_once_with(
             node=mock_grow_kombii_tree.return_value,
             var_num=len([]),
+            stats=None,
+        )
+
+    def test_auto_var_precedence(self):
+        for seed in range(10):
+            possible_values, var_precedence, constraints = random_model(seed)
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            for forward_checking in (False, True):
+                results = conditional_combinatorial(
+                    possible_values=possible_values,
+                    var_precedence=None,
+                    constraints=constraints,
+                    forward_checking=forward_checking,
+                )
+                self.assertCountEqual(results, expected)
+                for r in results:
+                    # The keys are in the order of `possible_values`.
+                    self.assertListEqual(list(r.keys()), var_precedence)
+
+    def test_workers(self):
+        expected = conditional_combinatorial(
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=_PARALLEL_CONSTRAINTS,
+        )
+        self.assertEqual(len(expected), 12)
+
+        # 1 worker splits by "v1"; 4 workers split by "v1" and "v2".
+        for workers in (1, 4):
+            for forward_checking in (False, True):
+                results = conditional_combinatorial(
+                    possible_values=_PARALLEL_POSSIBLE_VALUES,
+                    var_precedence=["v1", "v2", "v3"],
+                    constraints=_PARALLEL_CONSTRAINTS,
+                    forward_checking=forward_checking,
+                    workers=workers,
+                )
+                self.assertListEqual(results, expected)
+
+    def test_columnar(self):
+        possible_values, var_precedence, constraints = random_model(seed=1)
+        expected = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        results = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            columnar=True,
+        )
+        self.assertIsInstance(results, ResultSet)
+        self.assertListEqual(results.variables, var_precedence)
+        self.assertListEqual(results.to_dicts(), expected)
+
+        results = conditional_combinatorial(
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=None,
+            constraints={"v2_ne_v1": _cons_v2_ne_v1},
+            workers=2,
+            columnar=True,
+        )
+        self.assertListEqual(results.variables, ["v1", "v2", "v3"])
+        self.assertEqual(len(results), 24)
+
+    def test_workers_0_var(self):
+        results = conditional_combinatorial(
+            possible_values={},
+            var_precedence=[],
+            constraints={},
+            workers=2,
+        )
+        self.assertListEqual(results, [])
+
+    def test_workers_invalid(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"number of workers must be > 0 \(actual: 0\)",
+            conditional_combinatorial,
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=_PARALLEL_CONSTRAINTS,
+            workers=0,
+        )
+
+    def test_workers_unpicklable_constraint(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraint 'lambda' can't be sent to the worker processes because "
+            r"it can't be pickled",
+            conditional_combinatorial,
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=["v1", "v2", "v3"],
+            constraints={"lambda": lambda var, value, state: ConstraintResult.KEEP},
+            workers=2,
+        )
+
+    def test_workers_partial_constraint(self):
+        constraints = {
+            "v2_ne_v1": _cons_v2_ne_v1,
+            "v3_gt_v2": ScopedConstraint(
+                func=partial(_cons_v3_gt_v2), watches=["v3"], reads=["v2"]
+            ),
+        }
+        results = conditional_combinatorial(
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=constraints,
+            workers=2,
+        )
+        expected = conditional_combinatorial(
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=_PARALLEL_CONSTRAINTS,
+        )
+        self.assertListEqual(results, expected)
+
+    @patch(target="kombii.kombii._grow_kombii_tree")
+    def test_forward_checking(self, mock_grow_kombii_tree):
+        possible_values, var_precedence, constraints = random_model(seed=0)
+        results = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            forward_checking=True,
+        )
+        mock_grow_kombii_tree.assert_not_called()
+
+        expected = iter_conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        self.assertListEqual(results, list(expected))
+
+
+class Test_sharded_conditional_combinatorial(unittest.TestCase):
+    def _assert_shards(self, n, expected, **kwargs):
+        shards = [conditional_combinatorial(shard=(k, n), **kwargs) for k in range(n)]
+        self.assertListEqual([r for s in shards for r in s], expected)
+        return shards
+
+    def test_same_as_conditional_combinatorial(self):
+        for seed in range(20):
+            possible_values, var_precedence, constraints = random_model(seed, var_num=6)
+            kwargs = dict(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            expected = conditional_combinatorial(**kwargs)
+            for n in (1, 3, 24):
+                for forward_checking in (False, True):
+                    self._assert_shards(
+                        n=n,
+                        expected=expected,
+                        forward_checking=forward_checking,
+                        **kwargs,
+                    )
+
+    def test_balanced(self):
+        possible_values, var_precedence, constraints = random_model(
+            seed=2, var_num=8, cons_num=6
+        )
+        kwargs = dict(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        expected = conditional_combinatorial(**kwargs)
+        shards = self._assert_shards(n=4, expected=expected, **kwargs)
+        for results in shards:
+            self.assertLess(abs(len(results) - len(expected) / 4), len(expected) / 8)
+
+    def test_plain_constraint(self):
+        # The subtree sizes are estimated instead of counted.
+        def cons_sum(var, value, state):
+            total = sum(state.values()) + value
+            return ConstraintResult.DISCARD if total > 6 else ConstraintResult.KEEP
+
+        kwargs = dict(
+            possible_values={f"v{i}": [0, 1, 2] for i in range(5)},
+            var_precedence=[f"v{i}" for i in range(5)],
+            constraints={"sum": cons_sum},
+        )
+        expected = conditional_combinatorial(**kwargs)
+        for n in (2, 5):
+            self._assert_shards(n=n, expected=expected, **kwargs)
+
+    def test_auto_var_precedence(self):
+        possible_values, _, constraints = random_model(seed=4)
+        possible_values = dict(reversed(list(possible_values.items())))
+        kwargs = dict(
+            possible_values=possible_values,
+            var_precedence=None,
+            constraints=constraints,
+        )
+        expected = conditional_combinatorial(**kwargs)
+        self._assert_shards(n=3, expected=expected, **kwargs)
+
+        results = conditional_combinatorial(shard=(0, 2), columnar=True, **kwargs)
+        self.assertIsInstance(results, ResultSet)
+        self.assertListEqual(results.variables, list(possible_values.keys()))
+
+    def test_more_shards_than_combinations(self):
+        kwargs = dict(
+            possible_values={"v1": [1, 2], "v2": [3]},
+            var_precedence=["v1", "v2"],
+            constraints={},
+        )
+        shards = self._assert_shards(
+            n=5, expected=conditional_combinatorial(**kwargs), **kwargs
+        )
+        self.assertEqual(sum(1 for s in shards if s), 2)
+
+        self.assertListEqual(
+            conditional_combinatorial(
+                possible_values={}, var_precedence=[], constraints={}, shard=(0, 2)
+            ),
+            [],
+        )
+
+    def test_invalid(self):
+        kwargs = dict(
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=_PARALLEL_CONSTRAINTS,
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"shard must be >= 0 and < 2 \(actual: -1\)",
+            conditional_combinatorial,
+            shard=(-1, 2),
+            **kwargs,
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"shard can't be combined with workers",
+            conditional_combinatorial,
+            shard=(0, 2),
+            workers=2,
+            **kwargs,
+        )
+
+    def test_unordered_possible_values(self):
+        for func, kwargs in [
+            (full_combinatorial, {}),
+            (conditional_combinatorial, dict(var_precedence=None, constraints={})),
+        ]:
+            self.assertRaisesRegex(
+                ValueError,
+                r"possible values of 'v2' must be an ordered sequence to shard "
+                r"\(actual: set\)",
+                func,
+                possible_values={"v1": [1, 2], "v2": {"a", "b"}},
+                shard=(0, 2),
+                **kwargs,
+            )
+
+    def test_same_in_every_process(self):
+        # The shards must not depend on the hashes of the values, which are
+        # different in every process for strings.
+        script = textwrap.dedent(
+            """
+            from kombii.kombii import (
+                ConstraintResult,
+                conditional_combinatorial,
+                full_combinatorial,
+            )
+            from ytestit_common.constraints import scoped
+
+            @scoped(watches=["v2"], reads=["v1"])
+            def cons_v2_ne_v1(var, value, state):
+                if value == state["v1"]:
+                    return ConstraintResult.DISCARD
+                return ConstraintResult.KEEP
+
+            values = ["Auto", "Manual", "N/A", "DHCP", "Static"]
+            possible_values = {"v1": values, "v2": values, "v3": ["a", "b", "c"]}
+            print(full_combinatorial(possible_values=possible_values, shard=(1, 3)))
+            print(
+                conditional_combinatorial(
+                    possible_values=possible_values,
+                    var_precedence=None,
+                    constraints={"v2_ne_v1": cons_v2_ne_v1},
+                    shard=(1, 3),
+                )
+            )
+            """
+        )
+        outputs = set()
+        for seed in ("1", "2", "3"):
+            result = subprocess.run(
+                [sys.executable, "-c", script],
+                env=dict(
+                    os.environ,
+                    PYTHONHASHSEED=seed,
+                    PYTHONPATH=os.pathsep.join(sys.path),
+                ),
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            outputs.add(result.stdout)
+        self.assertEqual(len(outputs), 1)
+
+    def test_assign_shards(self):
+        self.assertListEqual(
+            _assign_shards(sizes=[1, 1, 1, 1], shard_num=2), [0, 0, 1, 1]
+        )
+        self.assertListEqual(
+            _assign_shards(sizes=[6, 1, 1, 0, 4], shard_num=2), [0, 1, 1, 1, 1]
+        )
+        self.assertListEqual(_assign_shards(sizes=[0, 0, 0], shard_num=2), [0, 0, 1])
+        self.assertListEqual(_assign_shards(sizes=[5], shard_num=3), [1])
+
+
+class Test_iter_conditional_combinatorial(unittest.TestCase):
+    def test_0_var(self):
+        results = iter_conditional_combinatorial(
+            possible_values={},
+            var_precedence=[],
+            constraints={},
+        )
+        self.assertListEqual(list(results), [])
+
+    def test_2_vars_2_values_0_cons_reverse_precedence(self):
+        results = iter_conditional_combinatorial(
+            possible_values={"v1": [6, 7], "v2": [8, 9]},
+            var_precedence=["v2", "v1"],
+            constraints={},
+        )
+        self.assertListEqual(
+            list(results),
+            [
+                {"v1": 6, "v2": 8},
+                {"v1": 7, "v2": 8},
+                {"v1": 6, "v2": 9},
+                {"v1": 7, "v2": 9},
+            ],
+        )
+
+    def test_same_as_conditional_combinatorial(self):
+        possible_values = {
+            "v1": [10, 11, 100],
+            "v2": [12, 13, 14],
+            "v3": [15, 16],
+        }
+        var_precedence = ["v2", "v1", "v3"]
+
+        def cons_v1_lt_100(var, value, state):
+            return (
+                ConstraintResult.DISCARD
+                if var == "v1" and value >= 100
+                else ConstraintResult.KEEP
+            )
+
+        def cons_v3_partial_branch(var, value, state):
+            # Discard every value of "v3" when "v2" is 13 so the search must
+            # backtrack over partial branches.
+            return (
+                ConstraintResult.DISCARD
+                if var == "v3" and state["v2"] == 13
+                else ConstraintResult.KEEP
+            )
+
+        constraints = {
+            "v1_lt_100": cons_v1_lt_100,
+            "v3_partial_branch": cons_v3_partial_branch,
+        }
+
+        expected = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        results = iter_conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        self.assertEqual(len(expected), 8)
+        self.assertListEqual(list(results), expected)
+
+    def test_lazy(self):
+        def cons_lazy(var, value, state):
+            # The search must yield "v1 = 1" before it ever gets to "v1 = 2".
+            if var == "v1" and value == 2:
+                raise AssertionError("must not be reached")
+            return ConstraintResult.KEEP
+
+        results = iter_conditional_combinatorial(
+            possible_values={"v1": [1, 2]},
+            var_precedence=["v1"],
+            constraints={"cons_lazy": cons_lazy},
+        )
+        self.assertDictEqual(next(results), {"v1": 1})
+
+    def test_forward_checking_same_results(self):
+        for seed in range(20):
+            possible_values, var_precedence, constraints = random_model(seed)
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            results = iter_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                forward_checking=True,
+            )
+            self.assertListEqual(list(results), expected, f"seed: {seed}")
+
+    def test_forward_checking_prunes_dead_branches(self):
+        visited = []
+
+        def cons_visit(var, value, state):
+            visited.append((var, value))
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v3"], reads=["v1"])
+        def cons_v3(var, value, state):
+            # "v1 = 1" leaves no values for "v3".
+            return (
+                ConstraintResult.DISCARD if state["v1"] == 1 else ConstraintResult.KEEP
+            )
+
+        results = iter_conditional_combinatorial(
+            possible_values={"v1": [0, 1], "v2": [0, 1], "v3": [0, 1]},
+            var_precedence=["v1", "v2", "v3"],
+            constraints={"visit": cons_visit, "v3": cons_v3},
+            forward_checking=True,
+        )
+        self.assertEqual(len(list(results)), 4)
+
+        # "v2" is never tried under "v1 = 1".
+        self.assertEqual(visited.count(("v2", 0)), 1)
+        self.assertEqual(visited.count(("v2", 1)), 1)
+
+    def test_forward_checking_empty_domain(self):
+        @scoped(watches=["v2"], reads=[])
+        def cons_v2(var, value, state):
+            return ConstraintResult.DISCARD
+
+        def cons_v1(var, value, state):
+            raise AssertionError("must not be reached")
+
+        results = iter_conditional_combinatorial(
+            possible_values={"v1": [0, 1], "v2": [0, 1]},
+            var_precedence=["v1", "v2"],
+            constraints={"v1": cons_v1, "v2": cons_v2},
+            forward_checking=True,
+        )
+        self.assertListEqual(list(results), [])
+
+    def test_invalid_constraint(self):
+        results = iter_conditional_combinatorial(
+            possible_values={"v1": [20, 21]},
+            var_precedence=["v1"],
+            constraints={"cons_invalid": lambda var, value, state: 12},
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraint 'cons_invalid' must return .+ but actually returned '12'",
+            list,
+            results,
+        )
+
+
+class Test_aiter_conditional_combinatorial(unittest.TestCase):
+    @staticmethod
+    async def _collect(**kwargs):
+        return [c async for c in aiter_conditional_combinatorial(**kwargs)]
+
+    def test_same_as_conditional_combinatorial(self):
+        for seed in range(5):
+            possible_values, var_precedence, constraints = random_model(seed)
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            for batch_size in (1, 7, 1000):
+                results = asyncio.run(
+                    self._collect(
+                        possible_values=possible_values,
+                        var_precedence=var_precedence,
+                        constraints=constraints,
+                        batch_size=batch_size,
+                        maxsize=2,
+                    )
+                )
+                self.assertListEqual(results, expected, f"seed: {seed}")
+
+        results = asyncio.run(
+            self._collect(possible_values={}, var_precedence=[], constraints={})
+        )
+        self.assertListEqual(results, [])
+
+    def test_backpressure(self):
+        calls = []
+
+        def cons_count(var, value, state):
+            calls.append(var)
+            return ConstraintResult.KEEP
+
+        possible_values = {f"v{i}": [0, 1, 2, 3] for i in range(6)}
+
+        async def consume():
+            combinations = aiter_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=list(possible_values.keys()),
+                constraints={"count": cons_count},
+                batch_size=4,
+                maxsize=2,
+            )
+            async with contextlib.aclosing(combinations):
+                async for _ in combinations:
+                    # Give the search time to run ahead if it could.
+                    await asyncio.sleep(0.05)
+                    before = len(calls)
+                    break
+
+            # The search has stopped when the generator is closed.
+            closed = len(calls)
+            await asyncio.sleep(0.05)
+            return before, closed, len(calls)
+
+        before, closed, after = asyncio.run(consume())
+        # At most 1 batch taken, 2 queued and 1 waiting to be queued: 16
+        # combinations, i.e., 16 calls for "v5" and a few more above it.
+        self.assertLess(before, 40)
+        self.assertEqual(closed, after)
+
+    def test_close_without_results(self):
+        calls = []
+
+        @scoped(watches=["v6"])
+        def cons_all_zero(var, value, state):
+            # Only the first combination is valid, so after it the search
+            # goes through millions of nodes without any result.
+            calls.append(var)
+            return (
+                ConstraintResult.KEEP
+                if value == 0 and not any(state.values())
+                else ConstraintResult.DISCARD
+            )
+
+        possible_values = {f"v{i}": list(range(10)) for i in range(7)}
+
+        async def consume():
+            combinations = aiter_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=list(possible_values.keys()),
+                constraints={"all_zero": cons_all_zero},
+                batch_size=1,
+            )
+            async with contextlib.aclosing(combinations):
+                async for combination in combinations:
+                    # Let the search go on without finding anything.
+                    await asyncio.sleep(0.05)
+                    start = time.monotonic()
+                    break
+
+            elapsed = time.monotonic() - start
+            closed = len(calls)
+            await asyncio.sleep(0.05)
+            return combination, elapsed, closed, len(calls)
+
+        combination, elapsed, closed, after = asyncio.run(consume())
+        self.assertDictEqual(combination, {f"v{i}": 0 for i in range(7)})
+        self.assertLess(elapsed, 1)
+        self.assertEqual(closed, after)
+        self.assertLess(after, 10**6)
+
+    def test_exception(self):
+        kwargs = dict(
+            possible_values={"v1": [1, 2]},
+            var_precedence=["v1"],
+            constraints={"invalid": lambda var, value, state: None},
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            "constraint .invalid. must return",
+            asyncio.run,
+            self._collect(**kwargs),
+        )
+
+    def test_invalid_args(self):
+        kwargs = dict(
+            possible_values={"v1": [1, 2]}, var_precedence=["v1"], constraints={}
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"batch size must be > 0 \(actual: 0\)",
+            asyncio.run,
+            self._collect(batch_size=0, **kwargs),
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"maxsize must be > 0 \(actual: -1\)",
+            asyncio.run,
+            self._collect(maxsize=-1, **kwargs),
+        )
+
+
+class Test_live_reads(unittest.TestCase):
+    def test(self):
+        @scoped(watches=["v3"], reads=["v1"])
+        def cons_v3(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v4"], reads=["v2", "v4"])
+        def cons_v4(var, value, state):
+            return ConstraintResult.KEEP
+
+        var_precedence = ["v1", "v2", "v3", "v4"]
+        cons_index = _index_constraints(
+            variables=var_precedence,
+            constraints={"v3": cons_v3, "v4": cons_v4},
+        )
+        live = _live_reads(var_precedence=var_precedence, cons_index=cons_index)
+        self.assertListEqual(live, [[], ["v1"], ["v1", "v2"], ["v2"]])
+
+    def test_plain_constraint(self):
+        @scoped(watches=["v3"], reads=[])
+        def cons_v3(var, value, state):
+            return ConstraintResult.KEEP
+
+        def cons_plain(var, value, state):
+            return ConstraintResult.KEEP
+
+        var_precedence = ["v1", "v2", "v3"]
+        cons_index = _index_constraints(
+            variables=var_precedence,
+            constraints={"v3": cons_v3, "plain": cons_plain},
+        )
+        live = _live_reads(var_precedence=var_precedence, cons_index=cons_index)
+        self.assertListEqual(live, [[], ["v1"], ["v1", "v2"]])
+
+
+class Test_count_conditional_combinations(unittest.TestCase):
+    def test_0_var(self):
+        count = count_conditional_combinations(
+            possible_values={}, var_precedence=[], constraints={}
+        )
+        self.assertEqual(count, 0)
+
+    def test_same_as_conditional_combinatorial(self):
+        for seed in range(20):
+            possible_values, var_precedence, constraints = random_model(seed)
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            count = count_conditional_combinations(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            self.assertEqual(count, len(expected), f"seed: {seed}")
+
+        count = count_conditional_combinations(
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=None,
+            constraints={"v2_ne_v1": _cons_v2_ne_v1},
+        )
+        self.assertEqual(count, 24)
+
+    def test_memoized(self):
+        @scoped(watches=["v1"], reads=["v0"])
+        def cons_v1(var, value, state):
+            return (
+                ConstraintResult.DISCARD
+                if value == state["v0"]
+                else ConstraintResult.KEEP
+            )
+
+        possible_values = {f"v{i}": [0, 1] for i in range(20)}
+        counter = _SubtreeCounter(
+            possible_values=possible_values,
+            var_precedence=list(possible_values.keys()),
+            constraints={"v1": cons_v1},
+        )
+        self.assertEqual(counter.count(level=0, state={}), 2**19)
+
+        # Only the first two levels depend on the values before them.
+        self.assertEqual(len(counter.memo), 1 + 2 + 18)
+
+    def test_unhashable_values(self):
+        count = count_conditional_combinations(
+            possible_values={"v1": [[1], [2]], "v2": [[3], [4]]},
+            var_precedence=["v1", "v2"],
+            constraints={"plain": lambda var, value, state: ConstraintResult.KEEP},
+        )
+        self.assertEqual(count, 4)
+
+
+class Test_SearchStats(unittest.TestCase):
+    def test_conditional_combinatorial(self):
+        # "v3" has no valid values when "v2" is 2.
+        possible_values = {**_PARALLEL_POSSIBLE_VALUES, "v3": [0, 1, 2]}
+        stats = SearchStats()
+        results = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=["v1", "v2", "v3"],
+            constraints=_PARALLEL_CONSTRAINTS,
+            stats=stats,
+        )
+        self.assertListEqual(
+            results,
+            conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=["v1", "v2", "v3"],
+                constraints=_PARALLEL_CONSTRAINTS,
+            ),
+        )
+
+        # "v2_ne_v1" is only called for the 3 * 3 values of "v2" and
+        # discards the 3 equal ones.
+        v2_ne_v1 = stats.constraints["v2_ne_v1"]
+        self.assertEqual((v2_ne_v1.calls, v2_ne_v1.discards), (9, 3))
+        self.assertGreater(v2_ne_v1.seconds, 0)
+
+        # "v3_gt_v2" is a plain constraint, so it is called for the 3 values
+        # of "v1", the 6 values of "v2" that "v2_ne_v1" keeps and the 3
+        # values of "v3" under each of the 6 nodes of "v2".
+        v3_gt_v2 = stats.constraints["v3_gt_v2"]
+        self.assertEqual((v3_gt_v2.calls, v3_gt_v2.discards), (3 + 6 + 18, 12))
+
+        self.assertListEqual(
+            [(s.var, s.nodes, s.discarded_leaves) for s in stats.levels],
+            # The two nodes in which "v2" is 2 have no valid "v3".
+            [("v1", 3, 0), ("v2", 6, 0), ("v3", 6, 2)],
+        )
+
+        report = stats.report()
+        self.assertIn("v2_ne_v1", report)
+        self.assertIn("v3_gt_v2", report)
+
+    def test_shorter_run(self):
+        stats = SearchStats()
+        for var_precedence in (["v1", "v2", "v3"], ["v1", "v2"]):
+            conditional_combinatorial(
+                possible_values=_PARALLEL_POSSIBLE_VALUES,
+                var_precedence=var_precedence,
+                constraints={},
+                stats=stats,
+            )
+
+        # The counters of "v1" and "v2" are added up, and "v3" is dropped.
+        self.assertListEqual(
+            [(s.var, s.nodes) for s in stats.levels], [("v1", 6), ("v2", 18)]
+        )
+
+    def test_scoped(self):
+        stats = SearchStats()
+        instrumented = stats.instrument(_PARALLEL_CONSTRAINTS)
+        self.assertEqual(instrumented["v2_ne_v1"].watches, {"v2"})
+        self.assertEqual(instrumented["v2_ne_v1"].reads, {"v1"})
+
+        # The constraints are counted by every search, not only the tree.
+        list(
+            iter_conditional_combinatorial(
+                possible_values=_PARALLEL_POSSIBLE_VALUES,
+                var_precedence=["v1", "v2", "v3"],
+                constraints=instrumented,
+            )
+        )
+        self.assertEqual(stats.constraints["v2_ne_v1"].calls, 9)
+
+    def test_workers(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"stats can't be collected with workers",
+            conditional_combinatorial,
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=None,
+            constraints=_PARALLEL_CONSTRAINTS,
+            workers=2,
+            stats=SearchStats(),
+        )
+
+
+class Test_AdaptiveChecks(unittest.TestCase):
+    def test_order(self):
+        calls = []
+
+        def make_cons(name, discard):
+            def cons(var, value, state):
+                calls.append(name)
+                return (
+                    ConstraintResult.DISCARD
+                    if discard(value)
+                    else ConstraintResult.KEEP
+                )
+
+            return cons
+
+        never = make_cons("never", lambda value: False)
+        sometimes = make_cons("sometimes", lambda value: value % 4 == 0)
+        often = make_cons("often", lambda value: value % 2 == 0)
+        costly = scoped(watches=["v"], cost=100)(make_cons("costly", lambda v: True))
+
+        checks = _AdaptiveChecks(
+            constraints={
+                "never": never,
+                "sometimes": sometimes,
+                "costly": costly,
+                "often": often,
+            },
+            interval=8,
+        )
+        self.assertListEqual(checks.order(), ["never", "sometimes", "costly", "often"])
+
+        results = [checks.meets(var="v", value=i, state={}) for i in range(8)]
+        self.assertListEqual(results, [False] * 8)
+
+        # "often" was never called, so its smoothed discard rate (1/2) beats
+        # the 2 discards of "sometimes" in 8 calls. "costly" discarded every
+        # call, but a call costs 100 times more than the others.
+        self.assertListEqual(checks.order(), ["often", "sometimes", "never", "costly"])
+
+        calls.clear()
+        self.assertFalse(checks.meets(var="v", value=2, state={}))
+        self.assertListEqual(calls, ["often"])
+
+    def test_invalid_constraint(self):
+        checks = _AdaptiveChecks(
+            constraints={"cons_invalid": lambda var, value, state: 12}
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraint 'cons_invalid' must return .+ but actually returned '12'",
+            checks.meets,
+            var="v",
+            value=1,
+            state={},
+        )
+
+    def test_conditional_combinatorial(self):
+        for seed in range(10):
+            possible_values, var_precedence, constraints = random_model(
+                seed, cons_num=8
+            )
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            results = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+                adaptive=True,
+            )
+            self.assertListEqual(results, expected, f"seed: {seed}")
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"adaptive can't be combined with forward_checking, workers, columnar "
+            r"or shard",
+            conditional_combinatorial,
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            adaptive=True,
+            forward_checking=True,
+        )
+
+
+class Test_sample_conditional_combinations(unittest.TestCase):
+    def test_0_var(self):
+        samples = sample_conditional_combinations(
+            possible_values={}, var_precedence=[], constraints={}, n=3
+        )
+        self.assertListEqual(samples, [])
+
+    def test_invalid_n(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"n must be >= 0 \(actual: -1\)",
+            sample_conditional_combinations,
+            possible_values={"v1": [1]},
+            var_precedence=["v1"],
+            constraints={},
+            n=-1,
+        )
+
+    def test_no_valid_combination(self):
+        samples = sample_conditional_combinations(
+            possible_values={"v1": [1, 2]},
+            var_precedence=["v1"],
+            constraints={"none": lambda var, value, state: ConstraintResult.DISCARD},
+            n=3,
+        )
+        self.assertListEqual(samples, [])
+
+    def test_valid_and_uniform(self):
+        possible_values, var_precedence, constraints = random_model(seed=1)
+        valid = conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        n = len(valid) * 200
+        samples = sample_conditional_combinations(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            n=n,
+            seed=0,
+        )
+        self.assertEqual(len(samples), n)
+
+        counts = {}
+        for sample in samples:
+            self.assertIn(sample, valid)
+            key = tuple(sample.values())
+            counts[key] = counts.get(key, 0) + 1
+
+        # Every valid combination is drawn about 200 times.
+        self.assertEqual(len(counts), len(valid))
+        for count in counts.values():
+            self.assertGreater(count, 120)
+            self.assertLess(count, 300)
+
+    def test_seed(self):
+        possible_values, var_precedence, constraints = random_model(seed=2)
+        kwargs = dict(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            n=20,
+        )
+        self.assertListEqual(
+            sample_conditional_combinations(seed=3, **kwargs),
+            sample_conditional_combinations(seed=3, **kwargs),
+        )
+
+    def test_auto_var_precedence(self):
+        samples = sample_conditional_combinations(
+            possible_values=_PARALLEL_POSSIBLE_VALUES,
+            var_precedence=None,
+            constraints={"v2_ne_v1": _cons_v2_ne_v1},
+            n=10,
+            seed=0,
+        )
+        for sample in samples:
+            self.assertListEqual(
+                list(sample.keys()), list(_PARALLEL_POSSIBLE_VALUES.keys())
+            )
+            self.assertNotEqual(sample["v1"], sample["v2"])
+
+    def test_large_space(self):
+        # 3^20 (about 3.5 * 10^9) combinations before the constraints.
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(20)}
+        var_precedence = list(possible_values.keys())
+
+        def make_cons(watched, read):
+            @scoped(watches=[watched], reads=[read])
+            def cons(var, value, state):
+                return (
+                    ConstraintResult.DISCARD
+                    if value == state[read]
+                    else ConstraintResult.KEEP
+                )
+
+            return cons
+
+        constraints = {f"v{i}": make_cons(f"v{i}", f"v{i - 1}") for i in range(1, 20)}
+        samples = sample_conditional_combinations(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+            n=1000,
+            seed=0,
+        )
+        self.assertEqual(len(samples), 1000)
+        for sample in samples:
+            for i in range(1, 20):
+                self.assertNotEqual(sample[f"v{i}"], sample[f"v{i - 1}"])
+
+
+class Test_independent_components(unittest.TestCase):
+    def test_scoped(self):
+        @scoped(watches=["v5"], reads=["v0", "v4"])
+        def cons_v5(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v4"], reads=["v3"])
+        def cons_v4(var, value, state):
+            return ConstraintResult.KEEP
+
+        @scoped(watches=["v2"], reads=["v1"])
+        def cons_v2(var, value, state):
+            return ConstraintResult.KEEP
+
+        components = _independent_components(
+            var_precedence=["v0", "v1", "v2", "v3", "v4", "v5", "v6"],
+            constraints={"v5": cons_v5, "v4": cons_v4, "v2": cons_v2},
+        )
+        self.assertListEqual(
+            components,
+            [
+                (["v0", "v3", "v4", "v5"], {"v5": cons_v5, "v4": cons_v4}),
+                (["v1", "v2"], {"v2": cons_v2}),
+                (["v6"], {}),
+            ],
+        )
+
+    def test_plain(self):
+        def cons(var, value, state):
+            return ConstraintResult.KEEP
+
+        components = _independent_components(
+            var_precedence=["v0", "v1", "v2"],
+            constraints={"cons": cons},
+        )
+        self.assertListEqual(components, [(["v0", "v1", "v2"], {"cons": cons})])
+
+
+class Test_decomposed_conditional_combinatorial(unittest.TestCase):
+    def test_same_as_conditional_combinatorial(self):
+        for seed in range(20):
+            possible_values, var_precedence, constraints = random_model(
+                seed, var_num=6, cons_num=3
+            )
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            results = decomposed_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            self.assertIsInstance(results, ComponentProduct)
+            self.assertEqual(len(results), len(expected), f"seed: {seed}")
+            self.assertCountEqual(list(results), expected, f"seed: {seed}")
+            for combination in results:
+                self.assertListEqual(list(combination.keys()), var_precedence)
+
+    def test_lazy_product(self):
+        # Two independent groups of 10 variables each.
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(20)}
+        var_precedence = list(possible_values.keys())
+
+        def make_cons(watched, read):
+            @scoped(watches=[watched], reads=[read])
+            def cons(var, value, state):
+                return (
+                    ConstraintResult.DISCARD
+                    if value == state[read]
+                    else ConstraintResult.KEEP
+                )
+
+            return cons
+
+        constraints = {
+            f"v{i}": make_cons(f"v{i}", f"v{i - 1}") for i in range(1, 20) if i != 10
+        }
+        results = decomposed_conditional_combinatorial(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        self.assertListEqual(
+            results.components, [var_precedence[:10], var_precedence[10:]]
+        )
+        self.assertEqual(len(results), (3 * 2**9) ** 2)
+
+        last = results[-1]
+        self.assertDictEqual(last, {f"v{i}": 2 if i % 2 == 0 else 1 for i in range(20)})
+        self.assertEqual(results.index(last), len(results) - 1)
+        self.assertIn(last, results)
+        self.assertNotIn(dict(last, v1=2), results)
+
+        shard = results[10:20]
+        self.assertEqual(len(shard), 10)
+        self.assertDictEqual(shard[0], results[10])
+
+    def test_no_valid_combination(self):
+        results = decomposed_conditional_combinatorial(
+            possible_values={"v1": [1, 2], "v2": [3]},
+            var_precedence=None,
+            constraints={
+                "none": scoped(watches=["v2"], reads=[])(
+                    lambda var, value, state: ConstraintResult.DISCARD
+                )
+            },
         )
+        self.assertEqual(len(results), 0)
+        self.assertListEqual(list(results), [])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+import unittest
+
+from kombii.kombii import (
+    ConstraintResult,
+    conditional_combinatorial,
+    count_conditional_combinations,
+)
+from kombii.mdd import MDD, compile_mdd
+from ytestit_common.constraints import scoped
+
+from .helpers import random_model
+
+
+def _make_ne_chain(var_num):
+    # Every variable must be different from the one before it.
+    def make_cons(watched, read):
+        @scoped(watches=[watched], reads=[read])
+        def cons(var, value, state):
+            return (
+                ConstraintResult.DISCARD
+                if value == state[read]
+                else ConstraintResult.KEEP
+            )
+
+        return cons
+
+    return {f"v{i}": make_cons(f"v{i}", f"v{i - 1}") for i in range(1, var_num)}
+
+
+class Test_compile_mdd(unittest.TestCase):
+    def test_0_var(self):
+        mdd = compile_mdd(possible_values={}, var_precedence=[], constraints={})
+        self.assertIsInstance(mdd, MDD)
+        self.assertEqual(mdd.count(), 0)
+        self.assertListEqual(list(mdd), [])
+        self.assertListEqual(mdd.sample(n=3), [])
+
+    def test_same_as_conditional_combinatorial(self):
+        for seed in range(20):
+            possible_values, var_precedence, constraints = random_model(seed)
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            mdd = compile_mdd(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            self.assertEqual(mdd.count(), len(expected), f"seed: {seed}")
+            self.assertListEqual(list(mdd), expected, f"seed: {seed}")
+            for combination in expected[:10]:
+                self.assertIn(combination, mdd)
+
+    def test_no_valid_combination(self):
+        mdd = compile_mdd(
+            possible_values={"v1": [1, 2], "v2": [3]},
+            var_precedence=["v1", "v2"],
+            constraints={
+                "none": scoped(watches=["v2"], reads=[])(
+                    lambda var, value, state: ConstraintResult.DISCARD
+                )
+            },
+        )
+        self.assertFalse(mdd)
+        self.assertEqual(mdd.count(), 0)
+        self.assertListEqual(list(mdd), [])
+        self.assertNotIn({"v1": 1, "v2": 3}, mdd)
+
+    def test_shared_nodes(self):
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(30)}
+        mdd = compile_mdd(
+            possible_values=possible_values,
+            var_precedence=list(possible_values.keys()),
+            constraints=_make_ne_chain(30),
+        )
+        self.assertEqual(mdd.count(), 3 * 2**29)
+
+        # One node for the first variable and one per value of the previous
+        # variable for the others (the tree would have 3 * 2^29 leaves).
+        self.assertEqual(mdd.node_count(), 1 + 3 * 29)
+        self.assertEqual(mdd.edge_count(), 3 + 3 * 2 * 29)
+
+    def test_reduced(self):
+        # "v2" reads "v1", but the values of "v1" lead to the same choices.
+        @scoped(watches=["v2"], reads=["v1"])
+        def cons_v2(var, value, state):
+            return ConstraintResult.KEEP if value != 9 else ConstraintResult.DISCARD
+
+        mdd = compile_mdd(
+            possible_values={"v1": [0, 1, 2], "v2": [0, 1, 9]},
+            var_precedence=["v1", "v2"],
+            constraints={"v2": cons_v2},
+        )
+        self.assertEqual(mdd.node_count(), 2)
+        self.assertListEqual(mdd.layers[1], [((0, 0), (1, 0))])
+
+    def test_contains(self):
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(5)}
+        mdd = compile_mdd(
+            possible_values=possible_values,
+            var_precedence=list(possible_values.keys()),
+            constraints=_make_ne_chain(5),
+        )
+        self.assertIn({"v0": 0, "v1": 1, "v2": 0, "v3": 2, "v4": 0}, mdd)
+        self.assertNotIn({"v0": 0, "v1": 0, "v2": 1, "v3": 2, "v4": 0}, mdd)
+        self.assertNotIn({"v0": 0, "v1": 1, "v2": 0, "v3": 2}, mdd)
+        self.assertNotIn({"v0": 0, "v1": 1, "v2": 0, "v3": 2, "v4": 5}, mdd)
+
+    def test_sample(self):
+        possible_values, var_precedence, constraints = random_model(seed=3)
+        mdd = compile_mdd(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        valid = list(mdd)
+        samples = mdd.sample(n=len(valid) * 100, seed=0)
+
+        counts = {}
+        for sample in samples:
+            self.assertIn(sample, valid)
+            key = tuple(sample.values())
+            counts[key] = counts.get(key, 0) + 1
+        self.assertEqual(len(counts), len(valid))
+        for count in counts.values():
+            self.assertGreater(count, 50)
+            self.assertLess(count, 160)
+
+        self.assertListEqual(mdd.sample(n=5, seed=1), mdd.sample(n=5, seed=1))
+        self.assertRaisesRegex(
+            ValueError, r"n must be >= 0 \(actual: -1\)", mdd.sample, n=-1
+        )
+
+    def test_auto_var_precedence(self):
+        possible_values, _, constraints = random_model(seed=4)
+        possible_values = dict(reversed(list(possible_values.items())))
+        mdd = compile_mdd(
+            possible_values=possible_values,
+            var_precedence=None,
+            constraints=constraints,
+        )
+        self.assertEqual(
+            mdd.count(),
+            count_conditional_combinations(
+                possible_values=possible_values,
+                var_precedence=None,
+                constraints=constraints,
+            ),
+        )
+        for combination in mdd:
+            self.assertListEqual(list(combination.keys()), list(possible_values.keys()))
+
+    def test_plain_constraint(self):
+        def cons_sum(var, value, state):
+            total = sum(state.values()) + value
+            return ConstraintResult.DISCARD if total > 3 else ConstraintResult.KEEP
+
+        possible_values = {f"v{i}": [0, 1, 2] for i in range(4)}
+        var_precedence = list(possible_values.keys())
+        mdd = compile_mdd(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints={"sum": cons_sum},
+        )
+        self.assertListEqual(
+            list(mdd),
+            conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints={"sum": cons_sum},
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
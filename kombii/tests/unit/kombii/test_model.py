@@ -0,0 +1,163 @@
+import unittest
+
+from kombii.kombii import ConstraintResult, conditional_combinatorial
+from kombii.model import KombiiModel, ModelDelta
+from ytestit_common.constraints import scoped
+
+
+@scoped(watches=["v2"], reads=["v1"])
+def _cons_v2_ne_v1(var, value, state):
+    return ConstraintResult.DISCARD if value == state["v1"] else ConstraintResult.KEEP
+
+
+@scoped(watches=["v3"], reads=["v2"])
+def _cons_v3_gt_v2(var, value, state):
+    return ConstraintResult.DISCARD if value <= state["v2"] else ConstraintResult.KEEP
+
+
+@scoped(watches=["v1"], reads=[])
+def _cons_v1_ne_0(var, value, state):
+    return ConstraintResult.DISCARD if value == 0 else ConstraintResult.KEEP
+
+
+def _cons_sum_lt_5(var, value, state):
+    # A plain constraint that is checked for every variable.
+    total = sum(state.values()) + value
+    return ConstraintResult.DISCARD if total >= 5 else ConstraintResult.KEEP
+
+
+class Test_KombiiModel(unittest.TestCase):
+    def setUp(self):
+        self.possible_values = {"v1": [0, 1, 2], "v2": [0, 1, 2], "v3": [0, 1, 2, 3]}
+        self.var_precedence = ["v1", "v2", "v3"]
+        self.constraints = {"v2_ne_v1": _cons_v2_ne_v1, "v3_gt_v2": _cons_v3_gt_v2}
+        self.model = KombiiModel(
+            possible_values=self.possible_values,
+            var_precedence=self.var_precedence,
+            constraints=self.constraints,
+        )
+
+    def assertSameAsFromScratch(self, model):
+        expected = conditional_combinatorial(
+            possible_values=model.possible_values,
+            var_precedence=self.var_precedence,
+            constraints=model.constraints,
+        )
+        self.assertListEqual(model.results, expected)
+
+    def assertDelta(self, before, after, delta):
+        self.assertIsInstance(delta, ModelDelta)
+        self.assertCountEqual(delta.added, [r for r in after if r not in before])
+        self.assertCountEqual(delta.removed, [r for r in before if r not in after])
+
+    def test_init(self):
+        self.assertSameAsFromScratch(self.model)
+        self.assertEqual(len(self.model), len(self.model.results))
+
+        # The model has its own copy of the values and the constraints.
+        self.model.add_value(var="v1", value=3)
+        self.assertListEqual(self.possible_values["v1"], [0, 1, 2])
+
+    def test_add_value(self):
+        before = list(self.model)
+        delta = self.model.add_value(var="v2", value=-1)
+        self.assertSameAsFromScratch(self.model)
+        self.assertDelta(before, self.model.results, delta)
+        for r in delta.added:
+            self.assertEqual(r["v2"], -1)
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"'v2' already has the value -1",
+            self.model.add_value,
+            var="v2",
+            value=-1,
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"unknown variable: 'v9'",
+            self.model.add_value,
+            var="v9",
+            value=0,
+        )
+
+    def test_remove_value(self):
+        before = list(self.model)
+        delta = self.model.remove_value(var="v3", value=3)
+        self.assertSameAsFromScratch(self.model)
+        self.assertDelta(before, self.model.results, delta)
+        self.assertListEqual(delta.added, [])
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"'v3' doesn't have the value 3",
+            self.model.remove_value,
+            var="v3",
+            value=3,
+        )
+
+    def test_add_constraint(self):
+        for name, cons in [("v1_ne_0", _cons_v1_ne_0), ("sum_lt_5", _cons_sum_lt_5)]:
+            before = list(self.model)
+            delta = self.model.add_constraint(name=name, cons=cons)
+            self.assertSameAsFromScratch(self.model)
+            self.assertDelta(before, self.model.results, delta)
+            self.assertListEqual(delta.added, [])
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraint 'v1_ne_0' already exists",
+            self.model.add_constraint,
+            name="v1_ne_0",
+            cons=_cons_v1_ne_0,
+        )
+
+    def test_remove_constraint(self):
+        self.model.add_constraint(name="sum_lt_5", cons=_cons_sum_lt_5)
+        for name in ["v2_ne_v1", "sum_lt_5", "v3_gt_v2"]:
+            before = list(self.model)
+            delta = self.model.remove_constraint(name=name)
+            self.assertSameAsFromScratch(self.model)
+            self.assertDelta(before, self.model.results, delta)
+            self.assertListEqual(delta.removed, [])
+
+        self.assertEqual(len(self.model), 3 * 3 * 4)
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraint 'v2_ne_v1' doesn't exist",
+            self.model.remove_constraint,
+            name="v2_ne_v1",
+        )
+
+    def test_replace_constraint(self):
+        before = list(self.model)
+        delta = self.model.replace_constraint(name="v2_ne_v1", cons=_cons_v1_ne_0)
+        self.assertSameAsFromScratch(self.model)
+        self.assertDelta(before, self.model.results, delta)
+        self.assertTrue(delta)
+
+        # The same constraint again changes nothing.
+        delta = self.model.replace_constraint(name="v2_ne_v1", cons=_cons_v1_ne_0)
+        self.assertFalse(delta)
+
+    def test_auto_var_precedence(self):
+        model = KombiiModel(
+            possible_values=self.possible_values,
+            var_precedence=None,
+            constraints=self.constraints,
+        )
+        model.add_value(var="v3", value=4)
+        model.remove_constraint(name="v3_gt_v2")
+
+        expected = conditional_combinatorial(
+            possible_values=model.possible_values,
+            var_precedence=None,
+            constraints=model.constraints,
+        )
+        self.assertCountEqual(model.results, expected)
+        for r in model:
+            self.assertListEqual(list(r.keys()), ["v1", "v2", "v3"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import random
+import unittest
+
+from kombii.kombii import (
+    conditional_combinatorial,
+    full_combinatorial,
+)
+from kombii.ordering import _hamming, _two_opt, iter_gray_code, min_change_order
+from ytestit_common.results import ResultSet
+
+from .helpers import random_model
+
+
+def _changes(combinations):
+    return [
+        sum(a[var] != b[var] for var in a)
+        for a, b in zip(combinations, combinations[1:])
+    ]
+
+
+def _sorted(combinations):
+    return sorted(tuple(c.values()) for c in combinations)
+
+
+class Test_iter_gray_code(unittest.TestCase):
+    def test_0_var(self):
+        self.assertListEqual(list(iter_gray_code(possible_values={})), [])
+
+    def test_one_change(self):
+        possible_values = {"v1": [0, 1, 2], "v2": ["a", "b"], "v3": [5, 6, 7, 8]}
+        results = list(iter_gray_code(possible_values=possible_values))
+        self.assertListEqual(
+            _sorted(results),
+            _sorted(full_combinatorial(possible_values=possible_values)),
+        )
+        self.assertListEqual(_changes(results), [1] * (len(results) - 1))
+        self.assertDictEqual(results[0], {"v1": 0, "v2": "a", "v3": 5})
+        self.assertDictEqual(results[4], {"v1": 0, "v2": "b", "v3": 8})
+
+    def test_full_combinatorial(self):
+        possible_values = {"v1": [0, 1], "v2": ["a", "b", "c"]}
+        expected = list(iter_gray_code(possible_values=possible_values))
+        self.assertListEqual(
+            full_combinatorial(possible_values=possible_values, order="min_change"),
+            expected,
+        )
+        results = full_combinatorial(
+            possible_values=possible_values, order="min_change", columnar=True
+        )
+        self.assertIsInstance(results, ResultSet)
+        self.assertListEqual(results.to_dicts(), expected)
+
+        self.assertRaisesRegex(
+            ValueError,
+            "order can't be combined with lazy or shard",
+            full_combinatorial,
+            possible_values=possible_values,
+            order="min_change",
+            lazy=True,
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"order must be None or one of \['min_change'\] \(actual: 'gray'\)",
+            full_combinatorial,
+            possible_values=possible_values,
+            order="gray",
+        )
+
+
+class Test_min_change_order(unittest.TestCase):
+    def test_small(self):
+        self.assertListEqual(min_change_order([]), [])
+        self.assertListEqual(
+            min_change_order([{"v1": 1}, {"v1": 0}]), [{"v1": 1}, {"v1": 0}]
+        )
+
+    def test_full_product(self):
+        # A full product is walked as a Gray code whatever its order.
+        combinations = full_combinatorial(
+            possible_values={"v1": [0, 1, 2], "v2": [0, 1, 2], "v3": [0, 1]}
+        )
+        random.Random(0).shuffle(combinations)
+        results = min_change_order(combinations)
+        self.assertListEqual(_sorted(results), _sorted(combinations))
+        self.assertListEqual(_changes(results), [1] * (len(results) - 1))
+
+    def test_constrained(self):
+        total_changes = 0
+        total_steps = 0
+        for seed in range(10):
+            possible_values, var_precedence, constraints = random_model(seed)
+            combinations = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            results = min_change_order(combinations)
+            self.assertListEqual(
+                _sorted(results), _sorted(combinations), f"seed: {seed}"
+            )
+            self.assertLessEqual(
+                sum(_changes(results)), sum(_changes(combinations)), f"seed: {seed}"
+            )
+            self.assertListEqual(results, min_change_order(combinations))
+            total_changes += sum(_changes(results))
+            total_steps += len(results) - 1
+
+        # Every step changes at least one variable; a few of the small sets
+        # have no walk that changes only one at every step.
+        self.assertLess(total_changes, 1.2 * total_steps)
+
+    def test_unhashable(self):
+        combinations = [
+            {"v1": [1], "v2": {"a": 0}},
+            {"v1": [2], "v2": {"a": 1}},
+            {"v1": [1], "v2": {"a": 1}},
+            {"v1": [2], "v2": {"a": 0}},
+        ]
+        results = min_change_order(combinations)
+        self.assertCountEqual(results, combinations)
+        self.assertListEqual(_changes(results), [1] * (len(results) - 1))
+
+        combinations = combinations[:3] + [{"v1": [3], "v2": {"a": 2}}]
+        results = min_change_order(combinations)
+        self.assertCountEqual(results, combinations)
+
+    def test_two_opt(self):
+        codes = [(0, 0), (1, 1), (0, 1), (1, 0)]
+        walk = [0, 1, 2, 3]
+        self.assertEqual(
+            sum(_hamming(codes[a], codes[b]) for a, b in [(0, 1), (1, 2), (2, 3)]), 5
+        )
+
+        _two_opt(codes=codes, walk=walk, window=4, passes=2)
+        self.assertListEqual(walk, [0, 2, 1, 3])
+
+    def test_conditional_combinatorial(self):
+        possible_values, var_precedence, constraints = random_model(seed=1)
+        kwargs = dict(
+            possible_values=possible_values,
+            var_precedence=var_precedence,
+            constraints=constraints,
+        )
+        expected = min_change_order(conditional_combinatorial(**kwargs))
+        self.assertListEqual(
+            conditional_combinatorial(order="min_change", **kwargs), expected
+        )
+
+        results = conditional_combinatorial(order="min_change", columnar=True, **kwargs)
+        self.assertIsInstance(results, ResultSet)
+        self.assertListEqual(results.to_dicts(), expected)
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"order must be None or one of \['min_change'\] \(actual: 'x'\)",
+            conditional_combinatorial,
+            order="x",
+            **kwargs,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+import pytest
+
+from kombii.kombii import conditional_combinatorial
+from kombii.pytest_plugin import _case_ids, _parse_selections, _select
+from ytestit_common.results import ResultSet
+
+
+_TEST_FILE = textwrap.dedent(
+    """
+    import pytest
+    from kombii.kombii import ConstraintResult
+
+    def cons_v2_ne_v1(var, value, state):
+        if var == "v2" and value == state["v1"]:
+            return ConstraintResult.DISCARD
+        return ConstraintResult.KEEP
+
+    @pytest.mark.kombii(
+        "case",
+        possible_values={"v1": [0, 1, 2], "v2": [0, 1, 2], "v3": ["a", "b"]},
+        var_precedence=["v1", "v2", "v3"],
+        constraints={"v2_ne_v1": cons_v2_ne_v1},
+    )
+    def test_conditional(case):
+        assert case["v1"] != case["v2"]
+
+    @pytest.mark.kombii(argname="case", possible_values={"x": [1, 2]})
+    def test_full(case):
+        assert dict(case) in ({"x": 1}, {"x": 2})
+    """
+)
+
+
+class Test_pytest_plugin(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmp.name, "test_model.py"), "w") as f:
+            f.write(_TEST_FILE)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _pytest(self, *args):
+        return subprocess.run(
+            [sys.executable, "-m", "pytest", "-p", "kombii.pytest_plugin", "-q"]
+            + list(args),
+            cwd=self.tmp.name,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+            capture_output=True,
+            text=True,
+        )
+
+    def test_parametrize(self):
+        for _ in range(2):
+            result = self._pytest()
+            self.assertIn("14 passed", result.stdout)
+
+        # The second run loaded the cached results.
+        cache_dir = os.path.join(self.tmp.name, ".pytest_cache", "d", "kombii")
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+        result = self._pytest("-k", "v1:0 and v3:b")
+        self.assertIn("2 passed, 12 deselected", result.stdout)
+
+    def test_select(self):
+        result = self._pytest("--kombii-select", "v1=2", "--kombii-select", "v3=a")
+        # 2 conditional test cases and the 2 full test cases, which don't
+        # have these variables.
+        self.assertIn("4 passed", result.stdout)
+
+        result = self._pytest("--kombii-select", "v1")
+        self.assertIn("--kombii-select must be VAR=VALUE", result.stderr)
+
+
+class Test_select(unittest.TestCase):
+    def setUp(self):
+        self.results = ResultSet.from_dicts(
+            conditional_combinatorial(
+                possible_values={"v1": [0, 1, 2], "v2": [None, "x"]},
+                var_precedence=["v1", "v2"],
+                constraints={},
+            )
+        )
+
+    def test_select(self):
+        self.assertListEqual(
+            _select(results=self.results, selections=None), list(range(6))
+        )
+        self.assertListEqual(
+            _select(results=self.results, selections={"v2": "None"}), [0, 2, 4]
+        )
+        self.assertListEqual(
+            _select(results=self.results, selections={"v1": "1", "v2": "x"}), [3]
+        )
+        self.assertListEqual(_select(results=self.results, selections={"v1": "3"}), [])
+        self.assertListEqual(
+            _select(results=self.results, selections={"v9": "3"}), list(range(6))
+        )
+
+    def test_case_ids(self):
+        self.assertListEqual(
+            _case_ids(results=self.results, indexes=[0, 5]),
+            ["v1:0-v2:None", "v1:2-v2:x"],
+        )
+        self.assertListEqual(_case_ids(results=ResultSet([]), indexes=[]), [])
+
+    def test_parse_selections(self):
+        self.assertDictEqual(
+            _parse_selections(["v1=a=b", "v2="]), {"v1": "a=b", "v2": ""}
+        )
+        self.assertRaises(pytest.UsageError, _parse_selections, ["=1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,262 @@
+import os
+import pickle
+import random
+import tempfile
+import unittest
+
+from kombii.kombii import ConstraintResult, conditional_combinatorial
+from kombii.tables import (
+    TableConstraint,
+    _join_order,
+    join_conditional_combinatorial,
+    read_table_csv,
+)
+from ytestit_common.constraints import scoped
+
+
+def _random_tables(seed, var_num=6, value_num=3, table_num=3):
+    rnd = random.Random(seed)
+
+    possible_values = {f"v{i}": list(range(value_num)) for i in range(var_num)}
+    var_precedence = list(possible_values.keys())
+
+    constraints = {}
+    for t in range(table_num):
+        variables = rnd.sample(var_precedence, rnd.randint(2, 3))
+        # Some of the allowed tuples have values that are not possible.
+        allowed = [
+            tuple(rnd.randrange(value_num + 1) for _ in variables)
+            for _ in range(value_num ** len(variables) // 2)
+        ]
+        constraints[f"t{t}"] = TableConstraint(variables=variables, allowed=allowed)
+
+    return possible_values, var_precedence, constraints
+
+
+class TestTableConstraint(unittest.TestCase):
+    def test_invalid(self):
+        self.assertRaisesRegex(
+            ValueError,
+            "a table needs at least one variable",
+            TableConstraint,
+            variables=[],
+            allowed=[],
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"variables of a table must be unique: \['v1', 'v1'\]",
+            TableConstraint,
+            variables=["v1", "v1"],
+            allowed=[],
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            r"every allowed tuple must have 2 values \(actual: \(1,\)\)",
+            TableConstraint,
+            variables=["v1", "v2"],
+            allowed=[(1, 2), (1,)],
+        )
+
+    def test_check(self):
+        table = TableConstraint(
+            variables=["v1", "v2", "v3"], allowed=[(0, 1, 2), (1, 1, 0)]
+        )
+        self.assertSetEqual(table.watches, {"v1", "v2", "v3"})
+        self.assertSetEqual(table.reads, {"v1", "v2", "v3"})
+
+        # Only the assigned variables of the table are checked.
+        self.assertEqual(table("v1", 1, {}), ConstraintResult.KEEP)
+        self.assertEqual(table("v1", 2, {}), ConstraintResult.DISCARD)
+        self.assertEqual(table("v3", 2, {"v1": 0}), ConstraintResult.KEEP)
+        self.assertEqual(table("v3", 2, {"v1": 1}), ConstraintResult.DISCARD)
+        self.assertEqual(table("v3", 0, {"v1": 1, "v2": 1}), ConstraintResult.KEEP)
+        self.assertEqual(table("v2", 0, {"v1": 1, "v9": 5}), ConstraintResult.DISCARD)
+
+    def test_conditional_combinatorial(self):
+        table = TableConstraint(
+            variables=["v2", "v1"], allowed=[(0, 1), (1, 0), (2, 2), (5, 5)]
+        )
+
+        def cons_v2(var, value, state):
+            if var != "v2":
+                return ConstraintResult.KEEP
+            return (
+                ConstraintResult.KEEP
+                if (value, state["v1"]) in [(0, 1), (1, 0), (2, 2)]
+                else ConstraintResult.DISCARD
+            )
+
+        possible_values = {"v1": [0, 1, 2], "v2": [0, 1, 2], "v3": ["a", "b"]}
+        self.assertListEqual(
+            conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=["v1", "v2", "v3"],
+                constraints={"table": table},
+            ),
+            conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=["v1", "v2", "v3"],
+                constraints={"v2": cons_v2},
+            ),
+        )
+
+    def test_pickle(self):
+        table = TableConstraint(variables=["v1", "v2"], allowed=[(0, 1), (1, 0)])
+        copied = pickle.loads(pickle.dumps(table))
+        self.assertIsInstance(copied, TableConstraint)
+        self.assertListEqual(copied.variables, ["v1", "v2"])
+        self.assertSetEqual(copied.allowed, {(0, 1), (1, 0)})
+        self.assertEqual(copied("v2", 0, {"v1": 1}), ConstraintResult.KEEP)
+
+
+class Test_read_table_csv(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "table.csv")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, text):
+        with open(self.path, "w") as f:
+            f.write(text)
+
+    def test_strings(self):
+        self._write("v4_ip, v4_dns\nAuto,Auto\n\nManual,Manual\n")
+        table = read_table_csv(self.path)
+        self.assertListEqual(table.variables, ["v4_ip", "v4_dns"])
+        self.assertSetEqual(table.allowed, {("Auto", "Auto"), ("Manual", "Manual")})
+
+    def test_possible_values(self):
+        self._write("enabled,ip\nTrue,Auto\nFalse,N/A\n")
+        table = read_table_csv(
+            self.path,
+            possible_values={"enabled": [True, False], "ip": ["Auto", "N/A"]},
+        )
+        self.assertSetEqual(table.allowed, {(True, "Auto"), (False, "N/A")})
+
+        self.assertRaisesRegex(
+            ValueError,
+            "row 3 of .* has a value that is not possible: 'N/A'",
+            read_table_csv,
+            self.path,
+            possible_values={"enabled": [True, False], "ip": ["Auto"]},
+        )
+        self.assertRaisesRegex(
+            ValueError,
+            "unknown variable in table .*: 'ip'",
+            read_table_csv,
+            self.path,
+            possible_values={"enabled": [True, False]},
+        )
+
+    def test_invalid(self):
+        self._write("")
+        self.assertRaisesRegex(
+            ValueError, "table has no header row", read_table_csv, self.path
+        )
+
+        self._write("v1,v2\n1,2,3\n")
+        self.assertRaisesRegex(
+            ValueError,
+            r"row 2 of .* must have 2 values \(actual: 3\)",
+            read_table_csv,
+            self.path,
+        )
+
+
+class Test_join_order(unittest.TestCase):
+    def test_order(self):
+        relations = [
+            (["a", "b"], [(0, 0)] * 5),
+            (["c"], [(0,)] * 2),
+            (["b", "d"], [(0, 0)] * 9),
+            (["d", "e"], [(0, 0)] * 3),
+        ]
+        # The smallest first. Nothing shares a variable with "c", so the
+        # smallest of the others is next; then "b, d" shares "d" so it comes
+        # before the smaller "a, b".
+        self.assertListEqual(
+            [variables for variables, _ in _join_order(relations)],
+            [["c"], ["d", "e"], ["b", "d"], ["a", "b"]],
+        )
+
+
+class Test_join_conditional_combinatorial(unittest.TestCase):
+    def test_0_var(self):
+        self.assertListEqual(
+            join_conditional_combinatorial(
+                possible_values={}, var_precedence=[], constraints={}
+            ),
+            [],
+        )
+
+    def test_same_as_conditional_combinatorial(self):
+        for seed in range(30):
+            possible_values, var_precedence, constraints = _random_tables(seed)
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            results = join_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            self.assertListEqual(results, expected, f"seed: {seed}")
+
+    def test_other_constraints(self):
+        @scoped(watches=["v4"], reads=["v0"])
+        def cons_v4_ne_v0(var, value, state):
+            return (
+                ConstraintResult.DISCARD
+                if value == state["v0"]
+                else ConstraintResult.KEEP
+            )
+
+        def cons_sum(var, value, state):
+            total = sum(state.values()) + value
+            return ConstraintResult.DISCARD if total > 8 else ConstraintResult.KEEP
+
+        for seed in range(10):
+            possible_values, var_precedence, constraints = _random_tables(seed)
+            constraints = dict(constraints, v4_ne_v0=cons_v4_ne_v0, sum=cons_sum)
+            expected = conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            results = join_conditional_combinatorial(
+                possible_values=possible_values,
+                var_precedence=var_precedence,
+                constraints=constraints,
+            )
+            self.assertListEqual(results, expected, f"seed: {seed}")
+
+    def test_auto_var_precedence(self):
+        possible_values, _, constraints = _random_tables(seed=3)
+        possible_values = dict(reversed(list(possible_values.items())))
+        kwargs = dict(
+            possible_values=possible_values,
+            var_precedence=None,
+            constraints=constraints,
+        )
+        self.assertListEqual(
+            join_conditional_combinatorial(**kwargs),
+            conditional_combinatorial(**kwargs),
+        )
+
+    def test_unknown_variable(self):
+        self.assertRaisesRegex(
+            ValueError,
+            "unknown variable in table 't': 'v9'",
+            join_conditional_combinatorial,
+            possible_values={"v1": [0, 1]},
+            var_precedence=["v1"],
+            constraints={"t": TableConstraint(variables=["v1", "v9"], allowed=[])},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+
+from kombii.kombii import full_combinatorial
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+else:
+    from kombii.vectorized import (
+        ColumnarResult,
+        full_combinatorial_vectorized,
+        implies,
+        is_in,
+        not_in,
+    )
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class Test_full_combinatorial_vectorized(unittest.TestCase):
+    def test_0_var(self):
+        results = full_combinatorial_vectorized(possible_values={})
+        self.assertEqual(len(results), 0)
+        self.assertListEqual(results.to_dicts(), [])
+
+    def test_same_as_full_combinatorial(self):
+        possible_values = {
+            "v1": [True, False],
+            "v2": ["Auto", "Manual", "N/A"],
+            "v3": [1, 2, 3, 4],
+            "v4": [(1, 2), (3, 4)],
+        }
+        results = full_combinatorial_vectorized(
+            possible_values=possible_values, chunk_size=5
+        )
+        self.assertIsInstance(results, ColumnarResult)
+        self.assertEqual(len(results), 48)
+        self.assertListEqual(
+            results.to_dicts(), full_combinatorial(possible_values=possible_values)
+        )
+
+        # The values are the Python values, not NumPy scalars.
+        self.assertIs(type(results[0]["v1"]), bool)
+        self.assertIs(type(results[0]["v3"]), int)
+
+    def test_mixed_types(self):
+        possible_values = {"a": [1, "x"], "b": [True, 2], "c": [1, 2.5]}
+        results = full_combinatorial_vectorized(possible_values=possible_values)
+        self.assertListEqual(
+            results.to_dicts(), full_combinatorial(possible_values=possible_values)
+        )
+        self.assertIs(type(results[0]["a"]), int)
+        self.assertIs(type(results[0]["b"]), bool)
+        self.assertIs(type(results[0]["c"]), int)
+
+        results = full_combinatorial_vectorized(
+            possible_values=possible_values,
+            constraints={
+                "a": is_in("a", [1, "y"]),
+                "c": not_in("c", [2.5, "z"]),
+            },
+        )
+        self.assertListEqual(
+            results.to_dicts(),
+            [{"a": 1, "b": True, "c": 1}, {"a": 1, "b": 2, "c": 1}],
+        )
+        self.assertIs(type(results[0]["b"]), bool)
+
+    def test_constraints(self):
+        possible_values = {
+            "enabled": [True, False],
+            "ip": ["Auto", "Manual", "N/A"],
+            "mtu": [1280, 1500, 9000],
+        }
+        constraints = {
+            "enabled": implies(is_in("enabled", [True]), not_in("ip", ["N/A"])),
+            "disabled": implies(is_in("enabled", [False]), is_in("ip", ["N/A"])),
+            "mtu": lambda columns: columns["mtu"] >= 1500,
+        }
+        results = full_combinatorial_vectorized(
+            possible_values=possible_values,
+            constraints=constraints,
+            chunk_size=4,
+        )
+        self.assertListEqual(
+            results.to_dicts(),
+            [
+                {"enabled": True, "ip": "Auto", "mtu": 1500},
+                {"enabled": True, "ip": "Auto", "mtu": 9000},
+                {"enabled": True, "ip": "Manual", "mtu": 1500},
+                {"enabled": True, "ip": "Manual", "mtu": 9000},
+                {"enabled": False, "ip": "N/A", "mtu": 1500},
+                {"enabled": False, "ip": "N/A", "mtu": 9000},
+            ],
+        )
+        self.assertListEqual(list(results.column("mtu")), [1500, 9000] * 3)
+
+        sliced = results[1:3]
+        self.assertIsInstance(sliced, ColumnarResult)
+        self.assertListEqual(list(sliced), results.to_dicts()[1:3])
+        self.assertDictEqual(results[-1], {"enabled": False, "ip": "N/A", "mtu": 9000})
+
+    def test_to_result_set(self):
+        possible_values = {
+            "v1": [True, False],
+            "v2": ["Auto", "Manual", "Auto"],
+            "v3": list(range(300)),
+        }
+        results = full_combinatorial_vectorized(
+            possible_values=possible_values,
+            constraints={"v3": lambda columns: columns["v3"] % 7 == 0},
+        )
+        result_set = results.to_result_set()
+        self.assertEqual(len(result_set), len(results))
+        self.assertListEqual(result_set.to_dicts(), results.to_dicts())
+
+    def test_invalid_constraint(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"constraint 'cons_invalid' must return a boolean array of shape \(2,\)",
+            full_combinatorial_vectorized,
+            possible_values={"v1": [1, 2]},
+            constraints={"cons_invalid": lambda columns: np.zeros(2)},
+        )
+
+    def test_invalid_chunk_size(self):
+        self.assertRaisesRegex(
+            ValueError,
+            r"chunk size must be > 0 \(actual: 0\)",
+            full_combinatorial_vectorized,
+            possible_values={"v1": [1, 2]},
+            chunk_size=0,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
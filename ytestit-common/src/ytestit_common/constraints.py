@@ -1,4 +1,8 @@
 import enum
+import functools
+import sys
+
+from typing import Iterable, Optional
 
 
 class ConstraintResult(enum.IntEnum):
@@ -6,3 +10,83 @@ class ConstraintResult(enum.IntEnum):
     DISCARD = 1
     # Keep the current test case.
     KEEP = 2
+
+
+class ScopedConstraint(object):
+    """A constraint function together with the variables it is about.
+
+    - `watches`: the variables whose values the constraint checks. The
+      constraint only needs to be called when one of these variables is being
+      assigned; for any other variable it is assumed to return
+      `ConstraintResult.KEEP`.
+    - `reads`: the variables that the constraint reads from the state. `None`
+      means the constraint may read any variable.
+    - `cost`: how expensive a call is relative to other constraints (`1.0` by
+      default). It is only a hint for ordering the checks.
+
+    A `ScopedConstraint` is called the same way as the function it wraps, so it
+    can be used wherever a plain constraint function can.
+    """
+
+    def __init__(
+        self,
+        func,
+        watches: Iterable[str],
+        reads: Optional[Iterable[str]] = None,
+        cost: float = 1.0,
+    ):
+        if cost <= 0:
+            raise ValueError(f"cost must be > 0 (actual: {cost})")
+
+        self.func = func
+        self.watches = frozenset(watches)
+        self.reads = None if reads is None else frozenset(reads)
+        self.cost = cost
+
+        # Don't copy `func.__dict__`: if `func` is a `ScopedConstraint` itself,
+        # its scope would replace the new one.
+        functools.update_wrapper(self, func, updated=())
+
+    def __call__(self, var, value, state) -> ConstraintResult:
+        return self.func(var=var, value=value, state=state)
+
+    def __reduce__(self):
+        # A module-level function decorated with `scoped` is replaced by its
+        # `ScopedConstraint`, so the function can't be pickled by its name any
+        # more, but the `ScopedConstraint` can. A `func` without a name, e.g.,
+        # a `functools.partial`, is pickled by value.
+        qualname = getattr(self, "__qualname__", None)
+        if qualname is not None:
+            obj = sys.modules.get(self.__module__)
+            for name in qualname.split("."):
+                obj = getattr(obj, name, None)
+            if obj is self:
+                return qualname
+
+        return (ScopedConstraint, (self.func, self.watches, self.reads, self.cost))
+
+    def __repr__(self) -> str:
+        func = getattr(self.func, "__name__", repr(self.func))
+        return (
+            f"ScopedConstraint(func={func} "
+            f"watches={sorted(self.watches)} "
+            f"reads={None if self.reads is None else sorted(self.reads)})"
+        )
+
+
+def scoped(
+    watches: Iterable[str],
+    reads: Optional[Iterable[str]] = None,
+    cost: float = 1.0,
+):
+    """Decorator that turns a constraint function into a `ScopedConstraint`:
+
+    @scoped(watches=["v4_ip", "v4_dns"], reads=["v4_enabled"])
+    def cons_v4_enabled(var, value, state):
+        ...
+    """
+
+    def decorator(func) -> ScopedConstraint:
+        return ScopedConstraint(func=func, watches=watches, reads=reads, cost=cost)
+
+    return decorator
@@ -0,0 +1,200 @@
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Iterable, List, Optional
+
+from ytestit_common.types import Type_VariableValues
+
+
+# The array type codes that are used for the value codes, from the smallest to
+# the largest, with the number of distinct values each of them can hold.
+_CODE_TYPES = [
+    ("B", 1 << 8),
+    ("H", 1 << 16),
+    ("I", 1 << 32),
+    ("Q", 1 << 64),
+]
+
+_CAPACITIES = dict(_CODE_TYPES)
+
+
+class ValueDictionary(object):
+    """Number the distinct values of a variable in the order they are added.
+
+    The values are looked up by their types and hash when they are hashable
+    and by their types and equality otherwise, so values that are equal but of
+    different types (e.g., `1`, `True` and `1.0`) get different codes.
+    """
+
+    def __init__(self, values: Optional[Iterable[Any]] = None):
+        self.values = []
+        self._codes = {}
+        for value in values or []:
+            self.encode(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def encode(self, value) -> int:
+        """Return the code of `value`, adding it if it is a new value."""
+        key = (type(value), value)
+        try:
+            return self._codes[key]
+        except KeyError:
+            code = len(self.values)
+            self._codes[key] = code
+        except TypeError:
+            # The value is not hashable.
+            for code, v in enumerate(self.values):
+                if type(v) is type(value) and v == value:
+                    return code
+            code = len(self.values)
+
+        self.values.append(value)
+        return code
+
+    def decode(self, code: int):
+        return self.values[code]
+
+
+class Row(Mapping):
+    """A read-only view of one combination in a `ResultSet`. The values are
+    only decoded when they are accessed.
+    """
+
+    __slots__ = ("_results", "_index")
+
+    def __init__(self, results: "ResultSet", index: int):
+        self._results = results
+        self._index = index
+
+    def __getitem__(self, var: str):
+        return self._results.value(var=var, index=self._index)
+
+    def __iter__(self):
+        return iter(self._results.variables)
+
+    def __len__(self) -> int:
+        return len(self._results.variables)
+
+    def __repr__(self) -> str:
+        return f"Row({self.to_dict()})"
+
+    def to_dict(self) -> Type_VariableValues:
+        return {var: self[var] for var in self._results.variables}
+
+
+class ResultSet(Sequence):
+    """A compact list of combinations of the same variables.
+
+    Every variable is stored as a column of value codes in an `array`, with a
+    `ValueDictionary` per variable to turn the codes back into values, so a
+    combination takes a few bytes per variable instead of a `dict`. The column
+    type grows automatically with the number of distinct values.
+
+    Indexing returns a `Row` view, slicing returns a new `ResultSet` that
+    shares the value dictionaries, and `to_dicts` converts the combinations to
+    `dict`s.
+    """
+
+    def __init__(
+        self,
+        variables: Iterable[str],
+        dictionaries: Optional[Dict[str, ValueDictionary]] = None,
+    ):
+        self.variables = list(variables)
+        self._variable_set = set(self.variables)
+        self.dictionaries = dictionaries or {
+            var: ValueDictionary() for var in self.variables
+        }
+        self.columns = {
+            var: array(_type_code(len(self.dictionaries[var])))
+            for var in self.variables
+        }
+
+    @classmethod
+    def from_dicts(
+        cls,
+        rows: Iterable[Type_VariableValues],
+        variables: Optional[Iterable[str]] = None,
+    ) -> "ResultSet":
+        """Build a `ResultSet` from the combinations in `rows`. The variables
+        are the keys of the first row unless `variables` is given.
+        """
+        rows = iter(rows)
+        results = None
+        if variables is not None:
+            results = cls(variables=variables)
+
+        for row in rows:
+            if results is None:
+                results = cls(variables=row.keys())
+            results.append(row)
+
+        return results if results is not None else cls(variables=[])
+
+    def __len__(self) -> int:
+        if not self.variables:
+            return 0
+        return len(self.columns[self.variables[0]])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            sliced = ResultSet(variables=self.variables, dictionaries=self.dictionaries)
+            sliced.columns = {
+                var: column[index] for var, column in self.columns.items()
+            }
+            return sliced
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"result index out of range: {index}")
+
+        return Row(results=self, index=index)
+
+    def __repr__(self) -> str:
+        return f"ResultSet(variables={self.variables} len={len(self)})"
+
+    def append(self, row: Type_VariableValues) -> None:
+        if row.keys() != self._variable_set:
+            raise ValueError(
+                f"row must have the variables {self.variables} "
+                f"but has {list(row.keys())}"
+            )
+
+        for var in self.variables:
+            self.append_code(var=var, code=self.dictionaries[var].encode(row[var]))
+
+    def extend(self, rows: Iterable[Type_VariableValues]) -> None:
+        for row in rows:
+            self.append(row)
+
+    def append_code(self, var: str, code: int) -> None:
+        """Append a value code to the column of `var`. Appending a code to
+        every column adds a combination.
+        """
+        column = self.columns[var]
+        if code >= _CAPACITIES[column.typecode]:
+            column = array(_type_code(code + 1), column)
+            self.columns[var] = column
+        column.append(code)
+
+    def value(self, var: str, index: int):
+        return self.dictionaries[var].decode(self.columns[var][index])
+
+    def column(self, var: str) -> List[Any]:
+        """Return the values of `var` in all the combinations."""
+        values = self.dictionaries[var].values
+        return [values[code] for code in self.columns[var]]
+
+    def to_dicts(self) -> List[Type_VariableValues]:
+        decoded = [self.column(var) for var in self.variables]
+        return [dict(zip(self.variables, values)) for values in zip(*decoded)]
+
+
+def _type_code(value_num: int) -> str:
+    for type_code, capacity in _CODE_TYPES:
+        if value_num <= capacity:
+            return type_code
+
+    raise ValueError(f"too many distinct values: {value_num}")
@@ -1,10 +1,121 @@
+import pickle
 import unittest
 
+from functools import partial
+from ytestit_common.constraints import ConstraintResult, ScopedConstraint, scoped
+
 
 class TestImport(unittest.TestCase):
     def test(self):
         import ytestit_common.constraints
 
 
+def _cons_keep(var, value, state):
+    return ConstraintResult.KEEP
+
+
+@scoped(watches=["v2"], reads=["v1"])
+def _cons_scoped(var, value, state):
+    return ConstraintResult.KEEP
+
+
+class TestScopedConstraint(unittest.TestCase):
+    def test___init__(self):
+        def cons(var, value, state):
+            return ConstraintResult.KEEP
+
+        c = ScopedConstraint(func=cons, watches=["v2", "v3"], reads=["v1"])
+        self.assertIs(c.func, cons)
+        self.assertEqual(c.watches, frozenset(["v2", "v3"]))
+        self.assertEqual(c.reads, frozenset(["v1"]))
+        self.assertEqual(c.__name__, "cons")
+
+        self.assertEqual(c.cost, 1.0)
+
+        c = ScopedConstraint(func=cons, watches=["v2"], cost=5)
+        self.assertIsNone(c.reads)
+        self.assertEqual(c.cost, 5)
+
+        self.assertRaisesRegex(
+            ValueError,
+            r"cost must be > 0 \(actual: 0\)",
+            ScopedConstraint,
+            func=cons,
+            watches=["v2"],
+            cost=0,
+        )
+
+    def test_rescoped(self):
+        c = ScopedConstraint(func=_cons_scoped, watches=["x"], reads=["y"], cost=3)
+        self.assertIs(c.func, _cons_scoped)
+        self.assertEqual(c.watches, frozenset(["x"]))
+        self.assertEqual(c.reads, frozenset(["y"]))
+        self.assertEqual(c.cost, 3)
+        self.assertEqual(c.__name__, "_cons_scoped")
+
+    def test___call__(self):
+        def cons(var, value, state):
+            return (
+                ConstraintResult.DISCARD
+                if state["v1"] == value
+                else ConstraintResult.KEEP
+            )
+
+        c = ScopedConstraint(func=cons, watches=["v2"], reads=["v1"])
+        self.assertEqual(
+            c(var="v2", value=1, state={"v1": 1}), ConstraintResult.DISCARD
+        )
+        self.assertEqual(c(var="v2", value=2, state={"v1": 1}), ConstraintResult.KEEP)
+
+    def test_pickle(self):
+        c = pickle.loads(pickle.dumps(_cons_scoped))
+        self.assertIs(c, _cons_scoped)
+
+        c = pickle.loads(
+            pickle.dumps(ScopedConstraint(func=_cons_keep, watches=["v2"], cost=3))
+        )
+        self.assertIsInstance(c, ScopedConstraint)
+        self.assertIs(c.func, _cons_keep)
+        self.assertEqual(c.watches, frozenset(["v2"]))
+        self.assertIsNone(c.reads)
+        self.assertEqual(c.cost, 3)
+
+    def test_pickle_partial(self):
+        c = pickle.loads(
+            pickle.dumps(
+                ScopedConstraint(func=partial(_cons_keep), watches=["v2"], reads=[])
+            )
+        )
+        self.assertIsInstance(c, ScopedConstraint)
+        self.assertIsInstance(c.func, partial)
+        self.assertIs(c.func.func, _cons_keep)
+        self.assertEqual(c.watches, frozenset(["v2"]))
+        self.assertEqual(c.reads, frozenset())
+
+    def test___repr__(self):
+        self.assertEqual(
+            repr(_cons_scoped),
+            "ScopedConstraint(func=_cons_scoped watches=['v2'] reads=['v1'])",
+        )
+
+        func = partial(_cons_keep)
+        self.assertEqual(
+            repr(ScopedConstraint(func=func, watches=["v2"])),
+            f"ScopedConstraint(func={func!r} watches=['v2'] reads=None)",
+        )
+
+
+class Test_scoped(unittest.TestCase):
+    def test(self):
+        @scoped(watches=["v2"], reads=["v1"])
+        def cons(var, value, state):
+            return ConstraintResult.KEEP
+
+        self.assertIsInstance(cons, ScopedConstraint)
+        self.assertEqual(cons.watches, frozenset(["v2"]))
+        self.assertEqual(cons.reads, frozenset(["v1"]))
+        self.assertEqual(cons(var="v2", value=1, state={}), ConstraintResult.KEEP)
+
+
 if __name__ == "__main__":
     unittest.main()
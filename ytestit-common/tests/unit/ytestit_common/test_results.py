@@ -0,0 +1,100 @@
+import unittest
+
+from ytestit_common.results import ResultSet, Row, ValueDictionary
+
+
+class TestImport(unittest.TestCase):
+    def test(self):
+        import ytestit_common.results
+
+
+class TestValueDictionary(unittest.TestCase):
+    def test_encode_decode(self):
+        d = ValueDictionary(values=["a", "b", "a"])
+        self.assertEqual(len(d), 2)
+        self.assertEqual(d.encode("b"), 1)
+        self.assertEqual(d.encode("c"), 2)
+        self.assertEqual(d.decode(2), "c")
+
+    def test_unhashable(self):
+        d = ValueDictionary()
+        self.assertEqual(d.encode([1]), 0)
+        self.assertEqual(d.encode([2]), 1)
+        self.assertEqual(d.encode([1]), 0)
+        self.assertEqual(d.decode(1), [2])
+
+    def test_equal_values_of_different_types(self):
+        d = ValueDictionary(values=[1, True, 1.0, 1])
+        self.assertEqual(len(d), 3)
+        self.assertEqual(d.encode(True), 1)
+        self.assertIs(d.decode(1), True)
+        self.assertIs(type(d.decode(2)), float)
+
+        d = ValueDictionary(values=[[1], (1,), [1]])
+        self.assertEqual(len(d), 2)
+
+
+class TestResultSet(unittest.TestCase):
+    ROWS = [
+        {"v1": True, "v2": "Auto"},
+        {"v1": True, "v2": "Manual"},
+        {"v1": False, "v2": "N/A"},
+    ]
+
+    def test_empty(self):
+        results = ResultSet.from_dicts(rows=[])
+        self.assertEqual(len(results), 0)
+        self.assertListEqual(results.variables, [])
+        self.assertListEqual(results.to_dicts(), [])
+
+        results = ResultSet.from_dicts(rows=[], variables=["v1"])
+        self.assertEqual(len(results), 0)
+        self.assertListEqual(results.variables, ["v1"])
+
+    def test_from_dicts(self):
+        results = ResultSet.from_dicts(rows=iter(self.ROWS))
+        self.assertEqual(len(results), 3)
+        self.assertListEqual(results.variables, ["v1", "v2"])
+        self.assertListEqual(results.to_dicts(), self.ROWS)
+        self.assertListEqual(results.column("v2"), ["Auto", "Manual", "N/A"])
+        self.assertListEqual(list(results.columns["v1"]), [0, 0, 1])
+
+    def test_row(self):
+        results = ResultSet.from_dicts(rows=self.ROWS)
+        row = results[1]
+        self.assertIsInstance(row, Row)
+        self.assertEqual(row["v2"], "Manual")
+        self.assertListEqual(list(row), ["v1", "v2"])
+        self.assertEqual(row, self.ROWS[1])
+        self.assertDictEqual(row.to_dict(), self.ROWS[1])
+        self.assertEqual(results[-1], self.ROWS[-1])
+        self.assertRaises(IndexError, lambda: results[3])
+        self.assertListEqual([r.to_dict() for r in results], self.ROWS)
+
+    def test_slice(self):
+        results = ResultSet.from_dicts(rows=self.ROWS)
+        sliced = results[1:]
+        self.assertIsInstance(sliced, ResultSet)
+        self.assertListEqual(sliced.to_dicts(), self.ROWS[1:])
+        self.assertListEqual(results[::-2].to_dicts(), self.ROWS[::-2])
+
+    def test_invalid_row(self):
+        results = ResultSet(variables=["v1", "v2"])
+        self.assertRaisesRegex(
+            ValueError,
+            r"row must have the variables \['v1', 'v2'\] but has \['v1'\]",
+            results.append,
+            {"v1": 1},
+        )
+
+    def test_column_type_grows(self):
+        results = ResultSet(variables=["v1"])
+        self.assertEqual(results.columns["v1"].typecode, "B")
+
+        results.extend({"v1": i} for i in range(300))
+        self.assertEqual(results.columns["v1"].typecode, "H")
+        self.assertListEqual(results.column("v1"), list(range(300)))
+
+
+if __name__ == "__main__":
+    unittest.main()